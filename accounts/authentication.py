@@ -1,14 +1,55 @@
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
 from rest_framework.authentication import CSRFCheck
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import AuthenticationFailed, PermissionDenied
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
 
 
 class CSRFPermissionDeniedError(PermissionDenied):
     default_code = "csrf_permission_denied"
 
 
+def dummy_get_response(_):
+    return None
+
+
+# Like Django's own middleware instances, one CSRFCheck serves every request
+csrf_check = CSRFCheck(dummy_get_response)
+
+
+class UserCache:
+    """
+    Active users by id for JWT authentication, kept for AUTH_USER_CACHE["TIMEOUT_SECONDS"].
+    Entries are dropped when a save changes one of User.AUTH_CACHE_FIELDS (see accounts.signals);
+    changes made with queryset.update() are only picked up when the entry expires.
+    """
+    key_prefix = 'accounts:user'
+
+    @classmethod
+    def make_key(cls, user_id):
+        return f"{cls.key_prefix}:{user_id}"
+
+    @classmethod
+    def get(cls, user_id):
+        return cache.get(cls.make_key(user_id))
+
+    @classmethod
+    def set(cls, user):
+        cache.set(cls.make_key(user.pk), user, timeout=settings.AUTH_USER_CACHE["TIMEOUT_SECONDS"])
+
+    @classmethod
+    def delete(cls, user_id):
+        cache.delete(cls.make_key(user_id))
+
+
 class JWTCookieAuthentication(JWTAuthentication):
+    """
+    JWT from the Authorization header or the access token cookie. The user is resolved
+    through UserCache, so most authenticated requests don't query the database.
+    """
     def authenticate(self, request):
         header = self.get_header(request)
 
@@ -27,13 +68,35 @@ class JWTCookieAuthentication(JWTAuthentication):
 
         return self.get_user(validated_token), validated_token
 
-    def enforce_csrf(self, request):
-        def dummy_get_response(_):
-            return None
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
 
-        check = CSRFCheck(dummy_get_response)
+        user = UserCache.get(user_id)
+        if user is None:
+            # Raises for unknown and inactive users, so only active ones are cached
+            user = super().get_user(validated_token)
+            UserCache.set(user)
+        elif api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+    def enforce_csrf(self, request):
         # populates request.META['CSRF_COOKIE'], which is used in process_view()
-        check.process_request(request)
-        reason = check.process_view(request, None, (), {})
+        csrf_check.process_request(request)
+        reason = csrf_check.process_view(request, None, (), {})
         if reason:
-            raise CSRFPermissionDeniedError(f"CSRF Failed: {reason}")
\ No newline at end of file
+            raise CSRFPermissionDeniedError(f"CSRF Failed: {reason}")
+
+
+class JWTCookieStatelessAuthentication(JWTCookieAuthentication):
+    """
+    For read-only endpoints: the user is a TokenUser built from the JWT claims, with no
+    cache or database lookup. A deactivated user keeps access until the token expires.
+    """
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        return api_settings.TOKEN_USER_CLASS(validated_token)
@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from django_redis import get_redis_connection
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBlacklist:
+    """
+    Redis mirror of the blacklisted refresh token JTIs, so checking a token does not
+    query the ever-growing token_blacklist tables.
+
+    Every blacklisted JTI gets a key that expires with the token, and its bits are set
+    in a Bloom filter (a Redis bitmap). A check reads both in one round trip: a key
+    hit means blacklisted, a Bloom miss means not blacklisted. Only Bloom false
+    positives, and checks made before the filter has been built, go to the database.
+    `rebuild()` recreates the filter from the unexpired rows; it also drops the bits of
+    expired tokens, which a Bloom filter can't remove one by one.
+    """
+    key_prefix = 'accounts:token_blacklist'
+    bloom_key = 'accounts:token_blacklist:bloom'
+    ready_key = 'accounts:token_blacklist:bloom_ready'
+    rebuild_scheduled_key = 'accounts:token_blacklist:rebuild_scheduled'
+    rebuild_lock_key = 'accounts:token_blacklist:rebuild_lock'
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    @classmethod
+    def make_key(cls, jti):
+        return f"{cls.key_prefix}:{jti}"
+
+    @staticmethod
+    def bloom_offsets(jti):
+        # Double hashing: BLOOM_HASHES positions from two 64-bit halves of one digest
+        config = settings.TOKEN_BLACKLIST_CACHE
+        digest = hashlib.sha256(jti.encode()).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:16], 'big') | 1
+        return [(h1 + i * h2) % config["BLOOM_BITS"] for i in range(config["BLOOM_HASHES"])]
+
+    @classmethod
+    def add(cls, pipe, jti, expires_at, bloom_key=None):
+        ttl = int(expires_at - time.time())
+        if ttl <= 0:
+            return
+        pipe.set(cls.make_key(jti), 1, ex=ttl)
+        for offset in cls.bloom_offsets(jti):
+            pipe.setbit(bloom_key or cls.bloom_key, offset, 1)
+
+    @classmethod
+    def mirror(cls, jti, expires_at):
+        """Record a JTI that was just blacklisted in the database; `expires_at` is a Unix timestamp."""
+        try:
+            connection = cls.get_connection()
+        except NotImplementedError:
+            return
+        pipe = connection.pipeline(transaction=False)
+        cls.add(pipe, jti, expires_at)
+        try:
+            pipe.execute()
+        except Exception:
+            # The row is in the database but its bits may not be in the filter, which would then
+            # call the token clean: stop trusting the filter until a rebuild has read the row back
+            logger.warning("Could not mirror a blacklisted token, rebuilding the filter", exc_info=True)
+            connection.delete(cls.ready_key)
+            cls.schedule_rebuild()
+
+    @classmethod
+    def lookup(cls, jti):
+        """True or False when Redis can tell, None when the database has to be asked."""
+        try:
+            connection = cls.get_connection()
+        except NotImplementedError:
+            return None
+
+        pipe = connection.pipeline(transaction=False)
+        pipe.exists(cls.ready_key)
+        pipe.exists(cls.make_key(jti))
+        for offset in cls.bloom_offsets(jti):
+            pipe.getbit(cls.bloom_key, offset)
+        ready, listed, *bits = pipe.execute()
+
+        if listed:
+            return True
+        if not ready:
+            cls.schedule_rebuild()
+            return None
+        return None if all(bits) else False
+
+    @classmethod
+    def schedule_rebuild(cls):
+        from .tasks import rebuild_token_blacklist
+
+        if cache.add(cls.rebuild_scheduled_key, 1, timeout=settings.TOKEN_BLACKLIST_CACHE["REBUILD_RETRY_SECONDS"]):
+            try:
+                rebuild_token_blacklist.delay()
+            except Exception:
+                # The database still answers; the next attempt comes after REBUILD_RETRY_SECONDS
+                logger.warning("Could not queue the token blacklist rebuild", exc_info=True)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Rebuild the keys and the Bloom filter from the unexpired blacklist rows; returns how
+        many were loaded, or None when another rebuild is already running.
+        """
+        config = settings.TOKEN_BLACKLIST_CACHE
+        if not cache.add(cls.rebuild_lock_key, 1, timeout=config["REBUILD_LOCK_SECONDS"]):
+            return None
+        try:
+            return cls.build_filter(config["BATCH_SIZE"])
+        finally:
+            cache.delete(cls.rebuild_lock_key)
+
+    @classmethod
+    def build_filter(cls, batch_size):
+        # A key of its own, so a run that outlived its lock can't mix its bits into another one's filter
+        building_key = f"{cls.bloom_key}:building:{uuid.uuid4().hex}"
+        started = timezone.now()
+        connection = cls.get_connection()
+
+        pipe = connection.pipeline(transaction=False)
+        # Make sure the key exists for RENAME even when nothing is blacklisted
+        pipe.setbit(building_key, 0, 0)
+
+        try:
+            rows = BlacklistedToken.objects \
+                .filter(token__expires_at__gt=started) \
+                .values_list('token__jti', 'token__expires_at') \
+                .iterator(chunk_size=batch_size)
+            loaded = 0
+            for jti, expires_at in rows:
+                cls.add(pipe, jti, expires_at.timestamp(), bloom_key=building_key)
+                loaded += 1
+                if loaded % batch_size == 0:
+                    pipe.execute()
+
+            pipe.rename(building_key, cls.bloom_key)
+            pipe.set(cls.ready_key, 1)
+            pipe.execute()
+        except Exception:
+            connection.delete(building_key)
+            raise
+
+        # Tokens blacklisted while we were scanning set their bits in the filter we just replaced
+        pipe = connection.pipeline(transaction=False)
+        for jti, expires_at in BlacklistedToken.objects \
+                .filter(blacklisted_at__gte=started) \
+                .values_list('token__jti', 'token__expires_at'):
+            cls.add(pipe, jti, expires_at.timestamp())
+        pipe.execute()
+        return loaded
+
+def prune_expired_tokens():
+    """
+    Delete expired outstanding tokens, and their blacklist rows, in BATCH_SIZE chunks.
+    Unlike `flushexpiredtokens` no row is loaded into Python and no single statement
+    locks millions of rows. Returns the number of outstanding tokens deleted.
+    """
+    batch_size = settings.TOKEN_BLACKLIST_CACHE["BATCH_SIZE"]
+    now = timezone.now()
+    deleted = 0
+
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+
+        with transaction.atomic():
+            BlacklistedToken.objects.filter(token_id__in=ids).delete()
+            deleted += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+
+
+class CachedBlacklistRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check goes through TokenBlacklist before the database."""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+
+        listed = TokenBlacklist.lookup(jti)
+        if listed is None:
+            listed = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        if listed:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        result = super().blacklist()
+        TokenBlacklist.mirror(self.payload[api_settings.JTI_CLAIM], self.payload['exp'])
+        return result
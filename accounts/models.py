@@ -31,6 +31,9 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     objects = UserManager()
 
+    # Saving a change to any of these drops the user from the authentication cache
+    AUTH_CACHE_FIELDS = ('phone', 'is_active', 'is_staff', 'is_admin', 'is_superuser', 'password')
+
     USERNAME_FIELD = 'phone'
     REQUIRED_FIELDS = []
 
@@ -43,5 +46,15 @@ class User(AbstractBaseUser, PermissionsMixin):
             models.Index(fields=['phone']),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auth_state = instance.get_auth_state()
+        return instance
+
+    def get_auth_state(self):
+        # Read from __dict__ so deferred fields don't trigger a query
+        return tuple(self.__dict__.get(field) for field in self.AUTH_CACHE_FIELDS)
+
     def __str__(self):
         return f"{self.phone}"
@@ -0,0 +1,125 @@
+import time
+
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from utils.cache_manager import CacheManager
+from .sms import GatewayError, get_gateway, route_phone
+
+
+class OTPOutbox:
+    """
+    OTP messages waiting to go out through one gateway, oldest first.
+    Backed by a Redis list, so any worker can drain it in batches.
+    """
+    key_prefix = 'accounts:otp_outbox'
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+        self.key = f"{self.key_prefix}:{gateway}"
+        self.flush_scheduled_key = f"{self.key}:flush_scheduled"
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    def push(self, messages):
+        """Append messages and return the outbox size."""
+        pipe = self.get_connection().pipeline()
+        pipe.rpush(self.key, *[orjson.dumps(message) for message in messages])
+        pipe.llen(self.key)
+        _, size = pipe.execute()
+        return size
+
+    def requeue(self, messages):
+        """Put messages back at the head of the outbox, keeping their order."""
+        self.get_connection().lpush(self.key, *[orjson.dumps(message) for message in reversed(messages)])
+
+    def pop(self, count):
+        """Remove and return up to `count` messages from the head of the outbox."""
+        pipe = self.get_connection().pipeline()
+        pipe.lrange(self.key, 0, count - 1)
+        pipe.ltrim(self.key, count, -1)
+        items, _ = pipe.execute()
+        return [orjson.loads(item) for item in items]
+
+
+def dispatch_otp(phone, otp):
+    """
+    Queue `otp` for `phone` on its gateway's outbox and make sure a flush is on its way:
+    immediately each time BATCH_SIZE messages have piled up, otherwise after
+    FLUSH_INTERVAL_SECONDS. The same code sent again to the same phone while it is still
+    valid (a retried request, a redelivered task) is dropped. Returns whether it was queued.
+    """
+    from .tasks import flush_otp_outbox
+
+    config = settings.OTP_DISPATCH
+    # cache.add directly: set_new_value reports a cache error like an existing key, which would drop the OTP
+    dispatched_key = CacheManager.make_key(f"{phone}:{otp}", 'otp_dispatched')
+    if not cache.add(dispatched_key, 1, timeout=settings.OTP["EXPIRATION_TIME_SECONDS"]):
+        return False
+
+    gateway = route_phone(phone)
+    outbox = OTPOutbox(gateway)
+    size = outbox.push([{'phone': phone, 'otp': str(otp), 'queued_at': time.time(), 'attempts': 0}])
+
+    if size % config["BATCH_SIZE"] == 0:
+        flush_otp_outbox.delay(gateway)
+    elif cache.add(outbox.flush_scheduled_key, 1, timeout=config["FLUSH_INTERVAL_SECONDS"]):
+        flush_otp_outbox.apply_async((gateway,), countdown=config["FLUSH_INTERVAL_SECONDS"])
+    return True
+
+
+def latest_per_phone(messages):
+    # Each new code replaces the secret of the previous one, so only the newest is worth sending
+    latest = {}
+    for message in messages:
+        latest.pop(message['phone'], None)
+        latest[message['phone']] = message
+    return list(latest.values())
+
+
+def flush_outbox(gateway):
+    """
+    Drain a gateway's outbox in batches of BATCH_SIZE, one `send_many` call each.
+    Failed messages go back to the outbox with one more attempt recorded, unless they
+    have used up MAX_ATTEMPTS or their code has expired; that also happens before any
+    other error from the gateway is re-raised. Returns (sent, requeued).
+    """
+    config = settings.OTP_DISPATCH
+    outbox = OTPOutbox(gateway)
+    sender = get_gateway(gateway)
+    expires_before = time.time() - settings.OTP["EXPIRATION_TIME_SECONDS"]
+    sent = 0
+    failed = []
+
+    try:
+        while True:
+            messages = latest_per_phone(outbox.pop(config["BATCH_SIZE"]))
+            if not messages:
+                break
+
+            texts = [(message['phone'], config["MESSAGE"].format(otp=message['otp'])) for message in messages]
+            try:
+                failed_phones = set(sender.send_many(texts))
+            except GatewayError:
+                # Nothing went out: stop here and leave the rest of the outbox for the retry
+                failed.extend(messages)
+                break
+            except Exception:
+                # Popped but not sent: don't lose them before the error propagates
+                failed.extend(messages)
+                raise
+
+            sent += len(messages) - len(failed_phones)
+            failed.extend(message for message in messages if message['phone'] in failed_phones)
+    finally:
+        retry = [
+            {**message, 'attempts': message['attempts'] + 1} for message in failed
+            if message['attempts'] + 1 < config["MAX_ATTEMPTS"] and message['queued_at'] > expires_before
+        ]
+        if retry:
+            outbox.requeue(retry)
+    return sent, len(retry)
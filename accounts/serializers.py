@@ -1,7 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenBlacklistSerializer, TokenRefreshSerializer
 from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _
 
+from accounts.blacklist import CachedBlacklistRefreshToken
 from accounts.models import User
 from utils import verify_otp_auth_num, verify_otp_change_phone
 
@@ -65,4 +67,12 @@ class ChangePhoneVerifySerializer(VerifyOTPSerializer):
             )
         return value
 
-# endregion
\ No newline at end of file
+# endregion
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedBlacklistRefreshToken
+
+
+class CachedTokenBlacklistSerializer(TokenBlacklistSerializer):
+    token_class = CachedBlacklistRefreshToken
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import UserCache
+from .models import User
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user(sender, instance, created, **kwargs):
+    # A new row may reuse the id of a deleted, still cached user
+    if created or instance.get_auth_state() != getattr(instance, '_auth_state', None):
+        UserCache.delete(instance.pk)
+    instance._auth_state = instance.get_auth_state()
+
+
+@receiver(post_delete, sender=User)
+def remove_cached_user(sender, instance, **kwargs):
+    UserCache.delete(instance.pk)
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class GatewayError(Exception):
+    """The gateway rejected or could not take the whole batch; every message in it may be retried."""
+
+
+class SMSGateway:
+    """
+    Interface of the SMS providers OTPs are sent through. One instance per gateway alias
+    is kept per process, so a subclass can hold a connection or an HTTP session.
+    """
+    def send_many(self, messages):
+        """
+        Send a batch of (phone, text) pairs in as few provider calls as possible.
+        Return the phones whose message failed and may be retried; raise GatewayError
+        when nothing in the batch was sent.
+        """
+        raise NotImplementedError
+
+
+class ConsoleGateway(SMSGateway):
+    """Development gateway: prints the messages."""
+
+    def send_many(self, messages):
+        for phone, text in messages:
+            print(f'{phone}: {text}')
+        return []
+
+
+gateways = {}
+
+
+def get_gateway(alias):
+    path = settings.OTP_DISPATCH["GATEWAYS"].get(alias)
+    if not path:
+        raise ImproperlyConfigured(f'No SMS gateway configured for "{alias}" in OTP_DISPATCH["GATEWAYS"].')
+    if path not in gateways:
+        gateways[path] = import_string(path)()
+    return gateways[path]
+
+
+def route_phone(phone):
+    """Alias of the gateway for `phone`: the longest matching ROUTES prefix, else 'default'."""
+    routes = settings.OTP_DISPATCH["ROUTES"]
+    for prefix in sorted(routes, key=len, reverse=True):
+        if phone.startswith(prefix):
+            return routes[prefix]
+    return 'default'
@@ -1,6 +1,33 @@
+from django.conf import settings
+
 from core.celery import app
 
 
+@app.task(bind=True, max_retries=None)
+def flush_otp_outbox(self, gateway='default'):
+    """Send the queued OTPs of one gateway in batches; retry with exponential backoff while some fail."""
+    from .otp_dispatch import flush_outbox
+
+    sent, requeued = flush_outbox(gateway)
+    if requeued:
+        config = settings.OTP_DISPATCH
+        countdown = min(config["RETRY_BACKOFF_SECONDS"] * 2 ** self.request.retries, config["RETRY_BACKOFF_MAX_SECONDS"])
+        raise self.retry(countdown=countdown)
+    return sent
+
+
 @app.task
-def send_otp_to_phone_tasks(otp):
-    print(f'Your OTP is: {otp}')
+def prune_token_blacklist():
+    """Delete expired token rows in bulk, then rebuild the Redis blacklist mirror without them."""
+    from .blacklist import TokenBlacklist, prune_expired_tokens
+
+    deleted = prune_expired_tokens()
+    TokenBlacklist.rebuild()
+    return deleted
+
+
+@app.task
+def rebuild_token_blacklist():
+    from .blacklist import TokenBlacklist
+
+    return TokenBlacklist.rebuild()
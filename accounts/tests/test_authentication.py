@@ -0,0 +1,63 @@
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.authentication import JWTCookieAuthentication, JWTCookieStatelessAuthentication, UserCache
+from accounts.models import User
+
+
+class TestJWTCookieAuthentication(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(phone='+989123456789')
+        self.factory = APIRequestFactory()
+
+    def authenticate(self, authentication=JWTCookieAuthentication):
+        token = AccessToken.for_user(self.user)
+        request = self.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return authentication().authenticate(request)[0]
+
+    def test_user_is_cached_after_first_lookup(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+
+        self.assertEqual(user, self.user)
+
+    def test_saving_unrelated_fields_keeps_the_entry(self):
+        self.authenticate()
+        user = User.objects.get(pk=self.user.pk)
+        user.last_login = user.created_at
+        user.save()
+
+        self.assertIsNotNone(UserCache.get(self.user.pk))
+
+    def test_phone_change_invalidates(self):
+        self.authenticate()
+        user = User.objects.get(pk=self.user.pk)
+        user.phone = '+989123456780'
+        user.save()
+
+        self.assertIsNone(UserCache.get(self.user.pk))
+        self.assertEqual(self.authenticate().phone, '+989123456780')
+
+    def test_deactivation_invalidates(self):
+        self.authenticate()
+        user = User.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_stateless_user_from_claims(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate(JWTCookieStatelessAuthentication)
+
+        self.assertIsInstance(user, TokenUser)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIsNone(UserCache.get(self.user.pk))
@@ -0,0 +1,175 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from kombu.exceptions import OperationalError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from unittest.mock import MagicMock, patch
+
+from accounts.blacklist import CachedBlacklistRefreshToken, TokenBlacklist, prune_expired_tokens
+from accounts.models import User
+
+
+class TestCachedBlacklistRefreshToken(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(phone='+989123456789')
+
+    @patch('accounts.tasks.rebuild_token_blacklist.delay')
+    def test_database_answers_without_redis(self, mock_rebuild):
+        token = CachedBlacklistRefreshToken.for_user(self.user)
+        CachedBlacklistRefreshToken(str(token))
+
+        token.blacklist()
+        with self.assertRaises(TokenError):
+            CachedBlacklistRefreshToken(str(token))
+
+    def test_redis_answers_without_database(self):
+        token = CachedBlacklistRefreshToken.for_user(self.user)
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection):
+            # Filter built and this token's bits not all set: not blacklisted
+            pipe.execute.return_value = [1, 0, 1, 1, 0, 1, 1, 1, 1]
+            with self.assertNumQueries(0):
+                CachedBlacklistRefreshToken(str(token))
+
+            pipe.execute.return_value = [1, 1, 1, 1, 1, 1, 1, 1, 1]
+            with self.assertNumQueries(0), self.assertRaises(TokenError):
+                CachedBlacklistRefreshToken(str(token))
+
+    @patch('accounts.tasks.rebuild_token_blacklist.delay')
+    def test_database_fallback_until_filter_is_built(self, mock_rebuild):
+        token = CachedBlacklistRefreshToken.for_user(self.user)
+        connection = MagicMock()
+        connection.pipeline.return_value.execute.return_value = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection):
+            with self.assertNumQueries(1):
+                CachedBlacklistRefreshToken(str(token))
+            CachedBlacklistRefreshToken(str(token))
+
+        mock_rebuild.assert_called_once_with()
+
+    @patch('accounts.tasks.rebuild_token_blacklist.delay', side_effect=OperationalError('broker down'))
+    def test_broker_outage_falls_back_to_database(self, mock_rebuild):
+        token = CachedBlacklistRefreshToken.for_user(self.user)
+        connection = MagicMock()
+        connection.pipeline.return_value.execute.return_value = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection), self.assertNumQueries(1), \
+                self.assertLogs('accounts.blacklist', 'WARNING'):
+            CachedBlacklistRefreshToken(str(token))
+
+        mock_rebuild.assert_called_once_with()
+
+    def test_blacklist_is_mirrored_until_expiry(self):
+        token = CachedBlacklistRefreshToken.for_user(self.user)
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection):
+            token.blacklist()
+
+        jti = token['jti']
+        key, value = pipe.set.call_args.args
+        self.assertEqual((key, value), (f'accounts:token_blacklist:{jti}', 1))
+        self.assertAlmostEqual(pipe.set.call_args.kwargs['ex'], 30 * 24 * 60 * 60, delta=5)
+        self.assertEqual(
+            [call.args[1] for call in pipe.setbit.call_args_list],
+            TokenBlacklist.bloom_offsets(jti),
+        )
+        pipe.execute.assert_called_once_with()
+
+    @patch('accounts.tasks.rebuild_token_blacklist.delay')
+    def test_failed_mirror_stops_trusting_the_filter(self, mock_rebuild):
+        token = CachedBlacklistRefreshToken.for_user(self.user)
+        connection = MagicMock()
+        connection.pipeline.return_value.execute.side_effect = ConnectionError('redis timed out')
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection), \
+                self.assertLogs('accounts.blacklist', 'WARNING'):
+            token.blacklist()
+
+        self.assertTrue(BlacklistedToken.objects.filter(token__jti=token['jti']).exists())
+        connection.delete.assert_called_once_with(TokenBlacklist.ready_key)
+        mock_rebuild.assert_called_once_with()
+
+
+class TestTokenBlacklistMaintenance(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(phone='+989123456789')
+        now = timezone.now()
+        for i in range(5):
+            expires_at = now - timedelta(days=1) if i < 3 else now + timedelta(days=1)
+            outstanding = OutstandingToken.objects.create(
+                user=self.user, jti=f'jti-{i}', token='token', created_at=now, expires_at=expires_at,
+            )
+            if i % 2 == 0:
+                BlacklistedToken.objects.create(token=outstanding)
+
+    @override_settings(TOKEN_BLACKLIST_CACHE={
+        'BLOOM_BITS': 1024, 'BLOOM_HASHES': 3, 'BATCH_SIZE': 2, 'REBUILD_RETRY_SECONDS': 60, 'REBUILD_LOCK_SECONDS': 60,
+    })
+    def test_prune_deletes_expired_rows_in_batches(self):
+        self.assertEqual(prune_expired_tokens(), 3)
+
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True).order_by('jti')), ['jti-3', 'jti-4'])
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ['jti-4'])
+
+    @override_settings(TOKEN_BLACKLIST_CACHE={
+        'BLOOM_BITS': 1024, 'BLOOM_HASHES': 3, 'BATCH_SIZE': 2, 'REBUILD_RETRY_SECONDS': 60, 'REBUILD_LOCK_SECONDS': 60,
+    })
+    def test_rebuild_loads_unexpired_rows(self):
+        cache.clear()
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection):
+            self.assertEqual(TokenBlacklist.rebuild(), 1)
+
+        pipe.set.assert_any_call('accounts:token_blacklist:jti-4', 1, ex=pipe.set.call_args_list[0].kwargs['ex'])
+        building_key, bloom_key = pipe.rename.call_args.args
+        self.assertTrue(building_key.startswith('accounts:token_blacklist:bloom:building:'))
+        self.assertEqual(bloom_key, TokenBlacklist.bloom_key)
+        pipe.set.assert_called_with(TokenBlacklist.ready_key, 1)
+        self.assertIsNone(cache.get(TokenBlacklist.rebuild_lock_key))
+
+    @override_settings(TOKEN_BLACKLIST_CACHE={
+        'BLOOM_BITS': 1024, 'BLOOM_HASHES': 3, 'BATCH_SIZE': 2, 'REBUILD_RETRY_SECONDS': 60, 'REBUILD_LOCK_SECONDS': 60,
+    })
+    def test_concurrent_rebuilds_do_not_share_a_filter(self):
+        cache.clear()
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+
+        cache.add(TokenBlacklist.rebuild_lock_key, 1)
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection):
+            self.assertIsNone(TokenBlacklist.rebuild())
+        connection.pipeline.assert_not_called()
+
+        cache.delete(TokenBlacklist.rebuild_lock_key)
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection):
+            TokenBlacklist.rebuild()
+            TokenBlacklist.rebuild()
+        first, second = [call.args[0] for call in pipe.rename.call_args_list]
+        self.assertNotEqual(first, second)
+
+    @override_settings(TOKEN_BLACKLIST_CACHE={
+        'BLOOM_BITS': 1024, 'BLOOM_HASHES': 3, 'BATCH_SIZE': 2, 'REBUILD_RETRY_SECONDS': 60, 'REBUILD_LOCK_SECONDS': 60,
+    })
+    def test_failed_rebuild_drops_its_filter_and_lock(self):
+        cache.clear()
+        connection = MagicMock()
+        connection.pipeline.return_value.execute.side_effect = ConnectionError('redis down')
+
+        with patch.object(TokenBlacklist, 'get_connection', return_value=connection), \
+                self.assertRaises(ConnectionError):
+            TokenBlacklist.rebuild()
+
+        building_key = connection.pipeline.return_value.setbit.call_args_list[0].args[0]
+        connection.delete.assert_called_once_with(building_key)
+        self.assertIsNone(cache.get(TokenBlacklist.rebuild_lock_key))
@@ -0,0 +1,155 @@
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+from unittest.mock import MagicMock, patch
+
+from utils import CacheManager, OTPManager, generate_otp_auth_num, verify_otp_auth_num
+
+
+class TestCacheManager(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_batch_operations_are_prefixed(self):
+        CacheManager.set_many({1: 'a', 2: 'b'}, 'otp_secret', timeout=60)
+
+        self.assertEqual(cache.get('otp_secret_1'), 'a')
+        self.assertEqual(CacheManager.get_many([1, 2, 3], 'otp_secret'), {1: 'a', 2: 'b'})
+
+        CacheManager.delete_many([1, 3], 'otp_secret')
+        self.assertEqual(CacheManager.get_many([1, 2], 'otp_secret'), {2: 'b'})
+
+    def test_set_replaces_without_delete(self):
+        CacheManager.set_new_value(1, 'old', 'otp_secret', timeout=60)
+
+        with patch('utils.cache_manager.cache', wraps=cache) as mock_cache:
+            self.assertTrue(CacheManager.set_new_value(1, 'new', 'otp_secret', timeout=60))
+
+        mock_cache.delete.assert_not_called()
+        self.assertEqual(CacheManager.get_value(1, 'otp_secret'), 'new')
+
+    def test_set_only_if_missing(self):
+        self.assertTrue(CacheManager.set_new_value(1, 'first', 'otp_sent', timeout=60, nx=True))
+        self.assertFalse(CacheManager.set_new_value(1, 'second', 'otp_sent', timeout=60, nx=True))
+        self.assertEqual(CacheManager.get_value(1, 'otp_sent'), 'first')
+
+    def test_pipeline_executes_once_on_exit(self):
+        pipe = MagicMock()
+        connection = MagicMock()
+        connection.pipeline.return_value = pipe
+
+        with patch('utils.cache_manager.get_redis_connection', return_value=connection), \
+                patch('utils.cache_manager.cache') as mock_cache:
+            with CacheManager.pipeline() as client:
+                CacheManager.set_many({1: 'a', 2: 'b'}, 'otp_secret', timeout=60, client=client)
+                CacheManager.delete_value(3, 'otp_secret', client=client)
+                pipe.execute.assert_not_called()
+
+        pipe.execute.assert_called_once_with()
+        self.assertEqual(mock_cache.set.call_count, 2)
+        mock_cache.set.assert_called_with('otp_secret_2', 'b', timeout=60, client=pipe)
+        mock_cache.delete.assert_called_once_with('otp_secret_3', client=pipe)
+
+    def test_pipeline_without_redis_runs_immediately(self):
+        with patch('utils.cache_manager.get_redis_connection', side_effect=NotImplementedError), \
+                CacheManager.pipeline() as client:
+            self.assertIsNone(client)
+            CacheManager.set_new_value(1, 'a', 'otp_secret', timeout=60, client=client)
+            self.assertEqual(cache.get('otp_secret_1'), 'a')
+
+
+class TestOTPFlow(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_new_code_replaces_the_previous_one(self):
+        with patch('utils.otp.pyotp.TOTP.at', side_effect=['111111', '222222']):
+            generate_otp_auth_num('+989123456789')
+            generate_otp_auth_num('+989123456789')
+
+        self.assertFalse(verify_otp_auth_num('+989123456789', 111111))
+        self.assertTrue(verify_otp_auth_num('+989123456789', 222222))
+
+    def test_verify_consumes_the_code(self):
+        otp = generate_otp_auth_num('+989123456789')
+
+        self.assertFalse(verify_otp_auth_num('+989123456789', '000000' if otp != '000000' else '111111'))
+        self.assertTrue(verify_otp_auth_num('+989123456789', int(otp)))
+        with self.assertRaises(SuspiciousOperation):
+            verify_otp_auth_num('+989123456789', otp)
+        self.assertIsNone(cache.get('otp_secret_auth_num_failures_+989123456789'))
+
+    def test_code_expires_after_the_valid_window(self):
+        with freeze_time('2025-01-01 12:00:00'):
+            otp = generate_otp_auth_num('+989123456789')
+        with freeze_time('2025-01-01 12:01:00'):
+            self.assertFalse(verify_otp_auth_num('+989123456789', otp))
+
+    @override_settings(OTP={
+        'EXPIRATION_TIME_SECONDS': 120, 'LONG_TIME_SECONDS': 7200, 'LONG_MAX_REQUESTS': 15,
+        'MAX_FAILED_ATTEMPTS': 3, 'VALID_WINDOW': 1,
+    })
+    def test_code_is_discarded_after_too_many_failures(self):
+        with patch('utils.otp.pyotp.TOTP.at', return_value='123456'):
+            generate_otp_auth_num('+989123456789')
+
+        for _ in range(3):
+            self.assertFalse(verify_otp_auth_num('+989123456789', 654321))
+        with self.assertRaises(SuspiciousOperation):
+            verify_otp_auth_num('+989123456789', 123456)
+
+    @override_settings(OTP={
+        'EXPIRATION_TIME_SECONDS': 120, 'LONG_TIME_SECONDS': 7200, 'LONG_MAX_REQUESTS': 15,
+        'MAX_FAILED_ATTEMPTS': 3, 'VALID_WINDOW': 1,
+    })
+    def test_new_code_resets_the_failed_attempts(self):
+        with patch('utils.otp.pyotp.TOTP.at', side_effect=['123456', '234567']):
+            generate_otp_auth_num('+989123456789')
+            for _ in range(3):
+                verify_otp_auth_num('+989123456789', 654321)
+
+            generate_otp_auth_num('+989123456789')
+
+        self.assertFalse(verify_otp_auth_num('+989123456789', 654321))
+        self.assertTrue(verify_otp_auth_num('+989123456789', 234567))
+
+    def test_value_in_an_old_format_is_missing(self):
+        # A bare secret, as stored before codes were kept with their time step
+        key = 'otp_secret_auth_num_+989123456789'
+        try:
+            OTPManager.get_connection().set(cache.make_key(key), 'JBSWY3DPEHPK3PXP')
+        except NotImplementedError:
+            cache.set(key, 'JBSWY3DPEHPK3PXP')
+
+        with self.assertRaises(SuspiciousOperation):
+            verify_otp_auth_num('+989123456789', 123456)
+
+    def test_redis_verify_is_one_script_call(self):
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+        pipe.execute.return_value = [True, 0]
+        script = connection.register_script.return_value
+        script.return_value = 1
+
+        with patch.object(OTPManager, 'get_connection', return_value=connection), \
+                patch.object(OTPManager, 'script', None), \
+                freeze_time('2025-01-01 12:00:00'):
+            with patch('utils.otp.pyotp.TOTP.at', return_value='012345'):
+                self.assertEqual(generate_otp_auth_num('+989123456789'), '012345')
+            self.assertTrue(verify_otp_auth_num('+989123456789', 12345))
+
+        step = 1735732800 // 30
+        pipe.set.assert_called_once_with(
+            cache.make_key('otp_secret_auth_num_+989123456789'), f'{step}:012345', ex=120,
+        )
+        pipe.delete.assert_called_once_with(cache.make_key('otp_secret_auth_num_failures_+989123456789'))
+        pipe.execute.assert_called_once_with()
+        script.assert_called_once_with(
+            keys=[cache.make_key('otp_secret_auth_num_+989123456789'),
+                  cache.make_key('otp_secret_auth_num_failures_+989123456789')],
+            args=['012345', step - 1, step + 1, 5, 120],
+            client=connection,
+        )
+        connection.get.assert_not_called()
+        connection.delete.assert_not_called()
@@ -0,0 +1,172 @@
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from freezegun import freeze_time
+from unittest.mock import patch
+
+from accounts.otp_dispatch import OTPOutbox, dispatch_otp, flush_outbox
+from accounts.sms import GatewayError, SMSGateway, route_phone
+from accounts.tasks import flush_otp_outbox
+
+
+class FakeGateway(SMSGateway):
+    """
+    Records the batches it receives. Phones in `failing` are reported as failed and
+    `down` makes the whole batch fail; `reset()` clears everything.
+    """
+    batches = []
+    failing = set()
+    down = False
+    error = None
+
+    def send_many(self, messages):
+        if FakeGateway.error:
+            raise FakeGateway.error
+        if FakeGateway.down:
+            raise GatewayError("Fake gateway is down.")
+        FakeGateway.batches.append(list(messages))
+        return [phone for phone, _ in messages if phone in FakeGateway.failing]
+
+    @classmethod
+    def sent(cls):
+        return [message for batch in cls.batches for message in batch]
+
+    @classmethod
+    def reset(cls):
+        cls.batches = []
+        cls.failing = set()
+        cls.down = False
+        cls.error = None
+
+
+FAKE_GATEWAY = 'accounts.tests.test_otp_dispatch.FakeGateway'
+
+OTP_DISPATCH = {
+    'GATEWAYS': {'default': FAKE_GATEWAY, 'intl': FAKE_GATEWAY},
+    'ROUTES': {'+1': 'intl'},
+    'MESSAGE': 'Code: {otp}',
+    'BATCH_SIZE': 2,
+    'FLUSH_INTERVAL_SECONDS': 1,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF_SECONDS': 1,
+    'RETRY_BACKOFF_MAX_SECONDS': 30,
+}
+
+
+@override_settings(OTP_DISPATCH=OTP_DISPATCH)
+class TestOTPDispatch(TestCase):
+    def setUp(self):
+        cache.clear()
+        FakeGateway.reset()
+        # Stand-in for the Redis lists: gateway alias -> queued messages
+        self.outboxes = {}
+        patch.object(OTPOutbox, 'push', autospec=True, side_effect=self.push).start()
+        patch.object(OTPOutbox, 'requeue', autospec=True, side_effect=self.requeue).start()
+        patch.object(OTPOutbox, 'pop', autospec=True, side_effect=self.pop).start()
+        self.addCleanup(patch.stopall)
+
+    def push(self, outbox, messages):
+        queue = self.outboxes.setdefault(outbox.gateway, [])
+        queue.extend(messages)
+        return len(queue)
+
+    def requeue(self, outbox, messages):
+        self.outboxes[outbox.gateway][:0] = messages
+
+    def pop(self, outbox, count):
+        queue = self.outboxes.setdefault(outbox.gateway, [])
+        messages = queue[:count]
+        del queue[:count]
+        return messages
+
+    @patch('accounts.tasks.flush_otp_outbox.apply_async')
+    @patch('accounts.tasks.flush_otp_outbox.delay')
+    def test_dispatch_batches_and_drops_repeated_codes(self, mock_delay, mock_apply_async):
+        self.assertTrue(dispatch_otp('+989123456789', '111111'))
+        self.assertFalse(dispatch_otp('+989123456789', '111111'))
+        mock_apply_async.assert_called_once_with(('default',), countdown=1)
+        mock_delay.assert_not_called()
+
+        self.assertTrue(dispatch_otp('+989123456780', '222222'))
+        mock_delay.assert_called_once_with('default')
+
+        self.assertTrue(dispatch_otp('+14155550100', '333333'))
+        self.assertEqual([m['phone'] for m in self.outboxes['default']], ['+989123456789', '+989123456780'])
+        self.assertEqual([m['phone'] for m in self.outboxes['intl']], ['+14155550100'])
+
+    @patch('accounts.otp_dispatch.cache.add', side_effect=ConnectionError('redis down'))
+    def test_cache_errors_are_not_taken_for_duplicates(self, mock_add):
+        with self.assertRaises(ConnectionError):
+            dispatch_otp('+989123456789', '111111')
+
+    def test_missing_gateway_is_a_configuration_error(self):
+        with override_settings(OTP_DISPATCH={**OTP_DISPATCH, 'GATEWAYS': {'default': ''}}), \
+                self.assertRaises(ImproperlyConfigured):
+            flush_outbox('default')
+
+    def test_routes_by_longest_prefix(self):
+        with override_settings(OTP_DISPATCH={**OTP_DISPATCH, 'ROUTES': {'+1': 'intl', '+1415': 'default'}}):
+            self.assertEqual(route_phone('+14155550100'), 'default')
+            self.assertEqual(route_phone('+12025550100'), 'intl')
+            self.assertEqual(route_phone('+989123456789'), 'default')
+
+    @patch('accounts.tasks.flush_otp_outbox.apply_async')
+    @patch('accounts.tasks.flush_otp_outbox.delay')
+    def test_flush_sends_batches_with_the_newest_code_per_phone(self, mock_delay, mock_apply_async):
+        for phone, otp in [('+989120000001', '1'), ('+989120000002', '2'), ('+989120000001', '3')]:
+            dispatch_otp(phone, otp)
+
+        self.assertEqual(flush_outbox('default'), (3, 0))
+        self.assertEqual(FakeGateway.batches, [
+            [('+989120000001', 'Code: 1'), ('+989120000002', 'Code: 2')],
+            [('+989120000001', 'Code: 3')],
+        ])
+
+        self.outboxes['default'] = [
+            {'phone': '+989120000001', 'otp': '4', 'queued_at': 0, 'attempts': 0},
+            {'phone': '+989120000001', 'otp': '5', 'queued_at': 0, 'attempts': 0},
+        ]
+        FakeGateway.reset()
+        flush_outbox('default')
+        self.assertEqual(FakeGateway.sent(), [('+989120000001', 'Code: 5')])
+
+    @patch('accounts.tasks.flush_otp_outbox.apply_async')
+    @patch('accounts.tasks.flush_otp_outbox.delay')
+    def test_failed_messages_are_requeued_until_they_run_out(self, mock_delay, mock_apply_async):
+        with freeze_time('2025-01-01 12:00:00'):
+            dispatch_otp('+989120000001', '1')
+            dispatch_otp('+989120000002', '2')
+            dispatch_otp('+989120000003', '3')
+
+            FakeGateway.failing = {'+989120000002'}
+            self.assertEqual(flush_outbox('default'), (2, 1))
+            self.assertEqual(self.outboxes['default'][0]['attempts'], 1)
+
+            FakeGateway.down = True
+            self.assertEqual(flush_outbox('default'), (0, 1))
+            # Out of attempts
+            self.assertEqual(flush_outbox('default'), (0, 0))
+
+            dispatch_otp('+989120000004', '4')
+        with freeze_time('2025-01-01 12:02:01'):
+            # Expired while waiting
+            self.assertEqual(flush_outbox('default'), (0, 0))
+        self.assertEqual(self.outboxes['default'], [])
+
+    @patch('accounts.tasks.flush_otp_outbox.apply_async')
+    @patch('accounts.tasks.flush_otp_outbox.delay')
+    def test_unexpected_gateway_errors_requeue_before_raising(self, mock_delay, mock_apply_async):
+        dispatch_otp('+989120000001', '1')
+        dispatch_otp('+989120000002', '2')
+        dispatch_otp('+989120000003', '3')
+
+        FakeGateway.error = TimeoutError('read timed out')
+        with self.assertRaises(TimeoutError):
+            flush_outbox('default')
+        self.assertEqual([(m['phone'], m['attempts']) for m in self.outboxes['default']],
+                         [('+989120000001', 1), ('+989120000002', 1), ('+989120000003', 0)])
+
+    @patch('accounts.otp_dispatch.flush_outbox', side_effect=[(0, 2), (1, 1), (1, 0)])
+    def test_task_retries_while_messages_are_requeued(self, mock_flush):
+        self.assertEqual(flush_otp_outbox.apply(args=('default',)).get(), 1)
+        self.assertEqual(mock_flush.call_count, 3)
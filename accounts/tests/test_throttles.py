@@ -0,0 +1,179 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.timezone import datetime, timedelta
+from freezegun import freeze_time
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from rest_framework.parsers import JSONParser
+from unittest.mock import MagicMock, patch
+
+from accounts.throttles import CustomThrottled, DualThrottle, IPThrottling, MultiWindowRateThrottle, PhoneThrottle
+from utils.rate_limit import RateLimitResult, SlidingWindowRateLimiter, local_allowances
+
+
+class TestSlidingWindowRateLimiter(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.start = datetime(2025, 1, 1, 12, 0, 0)
+
+    def hit_at(self, limiter, moment, key='client'):
+        with freeze_time(moment):
+            result = limiter.hit(key)
+        return result.allowed, result.wait
+
+    def test_every_window_must_allow(self):
+        limiter = SlidingWindowRateLimiter([(60, 1), (600, 3)])
+
+        self.assertEqual(self.hit_at(limiter, self.start), (True, 0))
+        self.assertEqual(self.hit_at(limiter, self.start + timedelta(seconds=20)), (False, 40))
+        self.assertTrue(self.hit_at(limiter, self.start + timedelta(seconds=60))[0])
+        self.assertTrue(self.hit_at(limiter, self.start + timedelta(seconds=120))[0])
+
+        # Three requests in the long window: blocked until the first one leaves it
+        self.assertEqual(self.hit_at(limiter, self.start + timedelta(seconds=180)), (False, 420))
+        self.assertTrue(self.hit_at(limiter, self.start + timedelta(seconds=600))[0])
+
+    def test_denied_requests_are_not_counted(self):
+        limiter = SlidingWindowRateLimiter([(60, 1)])
+
+        self.hit_at(limiter, self.start)
+        for seconds in (10, 20, 30):
+            self.assertFalse(self.hit_at(limiter, self.start + timedelta(seconds=seconds))[0])
+        self.assertTrue(self.hit_at(limiter, self.start + timedelta(seconds=60))[0])
+
+    def test_keys_are_independent(self):
+        limiter = SlidingWindowRateLimiter([(60, 1)])
+
+        self.assertTrue(self.hit_at(limiter, self.start, key='a')[0])
+        self.assertTrue(self.hit_at(limiter, self.start, key='b')[0])
+
+    @freeze_time('2025-01-01 12:00:00')
+    def test_redis_runs_one_script_call(self):
+        connection = MagicMock()
+        script = connection.register_script.return_value
+        script.return_value = [0, 1500, 1, 0, 1500]
+        limiter = SlidingWindowRateLimiter([(120, 1), (7200, 15)])
+
+        with patch.object(SlidingWindowRateLimiter, 'script', None), \
+                patch.object(SlidingWindowRateLimiter, 'get_connection', return_value=connection):
+            result = limiter.hit('phone_dual_throttle:+989123456789')
+
+        self.assertEqual(result, RateLimitResult(False, 1.5, 1, 0, 1.5))
+        script.assert_called_once()
+        kwargs = script.call_args.kwargs
+        self.assertEqual(kwargs['keys'], ['phone_dual_throttle:+989123456789'])
+        self.assertEqual(kwargs['args'][0], 1735732800000)
+        self.assertEqual(kwargs['args'][2:], [0, 120000, 1, 7200000, 15])
+        self.assertIs(kwargs['client'], connection)
+
+
+class TestThrottles(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+
+    def make_request(self, phone='+989123456789'):
+        request = self.factory.post('/', {'phone': phone}, format='json', REMOTE_ADDR='10.0.0.1')
+        return Request(request, parsers=[JSONParser()])
+
+    def test_ip_throttling(self):
+        throttle = IPThrottling(time_out=60, max_requests=2)
+
+        self.assertTrue(throttle.allow_request(self.make_request(), None))
+        self.assertTrue(throttle.allow_request(self.make_request(), None))
+        with self.assertRaises(CustomThrottled):
+            throttle.allow_request(self.make_request(), None)
+        self.assertEqual(throttle.key, 'ip_throttling:10.0.0.1')
+
+    def test_phone_throttle(self):
+        throttle = PhoneThrottle('phone', time_out=60, max_requests=1)
+
+        self.assertTrue(throttle.allow_request(self.make_request(), None))
+        self.assertTrue(throttle.allow_request(self.make_request('+989123456780'), None))
+        with self.assertRaises(CustomThrottled):
+            throttle.allow_request(self.make_request(), None)
+
+    def test_phone_throttle_without_phone(self):
+        throttle = PhoneThrottle('phone', time_out=60, max_requests=0)
+
+        self.assertTrue(throttle.allow_request(self.make_request(phone=''), None))
+
+    @freeze_time('2025-01-01 12:00:00')
+    def test_dual_throttle_reports_wait(self):
+        throttle = DualThrottle(short_time_out=120, long_time_out=3600, long_max_requests=5)
+
+        throttle.allow_request(self.make_request(), None)
+        with self.assertRaises(CustomThrottled) as ctx:
+            throttle.allow_request(self.make_request(), None)
+
+        self.assertEqual(ctx.exception.detail, '00:02:00')
+        self.assertEqual(throttle.wait(), 120)
+
+
+@override_settings(
+    RATE_LIMITS={'search': {'ip': [(60, 100)], 'user': [(60, 10)], 'api_key': [(60, 1000)]}},
+    RATE_LIMIT_LOCAL={'SHARE': 0.5, 'MAX_CLIENTS': 2},
+)
+class TestMultiWindowRateThrottle(TestCase):
+    def setUp(self):
+        cache.clear()
+        local_allowances.clear()
+        self.factory = APIRequestFactory()
+        self.view = MagicMock(rate_limit_scope='search')
+
+    def make_request(self, **extra):
+        request = Request(self.factory.get('/', REMOTE_ADDR='10.0.0.1', **extra))
+        request.user = AnonymousUser()
+        return request
+
+    def test_local_allowance_skips_redis_and_reports_pending(self):
+        throttle = MultiWindowRateThrottle()
+
+        with patch.object(SlidingWindowRateLimiter, 'hit', autospec=True,
+                          side_effect=lambda limiter, key, pending=0: limiter.hit_cache(key, time.time(), pending)) as hit:
+            for _ in range(51):
+                request = self.make_request()
+                throttle.allow_request(request, self.view)
+
+        # 99 left after the first check: 49 served locally, then the next check records them
+        self.assertEqual([call.args[2] for call in hit.call_args_list], [0, 49])
+        self.assertEqual(request.rate_limit.remaining, 49)
+        self.assertEqual(len(cache.get('rate_limit:search:ip:10.0.0.1')), 51)
+
+    def test_every_identity_is_limited(self):
+        throttle = MultiWindowRateThrottle()
+        request = self.make_request(HTTP_X_API_KEY='secret')
+
+        with patch.object(SlidingWindowRateLimiter, 'hit', autospec=True,
+                          side_effect=SlidingWindowRateLimiter.hit) as hit:
+            throttle.allow_request(request, self.view)
+
+        self.assertEqual(request.rate_limit.limit, 100)
+        keys = [call.args[1] for call in hit.call_args_list]
+        self.assertEqual(keys[0], 'rate_limit:search:ip:10.0.0.1')
+        self.assertEqual(len(keys), 2)
+        self.assertTrue(keys[1].startswith('rate_limit:search:api_key:'))
+        self.assertNotIn('secret', keys[1])
+
+    def test_denied_client_is_denied_locally(self):
+        throttle = MultiWindowRateThrottle()
+        self.view.rate_limit_scope = 'tight'
+
+        with override_settings(RATE_LIMITS={'tight': {'ip': [(60, 1)]}}):
+            throttle.allow_request(self.make_request(), self.view)
+            with self.assertRaises(CustomThrottled):
+                throttle.allow_request(self.make_request(), self.view)
+            with patch.object(SlidingWindowRateLimiter, 'hit') as hit, self.assertRaises(CustomThrottled):
+                throttle.allow_request(self.make_request(), self.view)
+
+        hit.assert_not_called()
+
+    def test_unconfigured_scope_is_not_limited(self):
+        request = self.make_request()
+        self.view.rate_limit_scope = None
+
+        self.assertTrue(MultiWindowRateThrottle().allow_request(request, self.view))
+        self.assertFalse(hasattr(request, 'rate_limit'))
@@ -55,7 +55,7 @@ class TestRequestOTPView(APITestCase):
         
     @override_settings(DEBUG=True)
     @patch('accounts.views.generate_otp_auth_num')
-    @patch('accounts.views.send_otp_to_phone_tasks.delay')
+    @patch('accounts.views.dispatch_otp')
     def test_request_otp_success_existing_user(self, mock_send_otp, mock_generate_otp):
         mock_generate_otp.return_value = "123456"
 
@@ -66,11 +66,11 @@ class TestRequestOTPView(APITestCase):
         self.assertEqual(response.data['otp'], '123456')
         
         mock_generate_otp.assert_called_once_with(self.valid_phone)
-        mock_send_otp.assert_called_once_with("123456")
+        mock_send_otp.assert_called_once_with(self.valid_phone, "123456")
     
     @override_settings(DEBUG=True)
     @patch('accounts.views.generate_otp_auth_num')
-    @patch('accounts.views.send_otp_to_phone_tasks.delay')
+    @patch('accounts.views.dispatch_otp')
     def test_request_otp_success_new_user(self, mock_send_otp, mock_generate_otp):
         mock_generate_otp.return_value = "123456"
 
@@ -81,11 +81,11 @@ class TestRequestOTPView(APITestCase):
         self.assertEqual(response.data['otp'], '123456')
         
         mock_generate_otp.assert_called_once_with(self.valid_new_phone)
-        mock_send_otp.assert_called_once_with("123456")
+        mock_send_otp.assert_called_once_with(self.valid_new_phone, "123456")
 
     @override_settings(DEBUG=True)
     @patch('accounts.views.generate_otp_auth_num')
-    @patch('accounts.views.send_otp_to_phone_tasks.delay')
+    @patch('accounts.views.dispatch_otp')
     def test_invalid_phone_format(self, mock_send_otp, mock_generate_otp):
         response = self.client.post(self.url, {"phone": "invalid"}, format='json')
         
@@ -109,7 +109,7 @@ class TestRequestOTPView(APITestCase):
         },
         DEBUG=False,
     )
-    @patch('accounts.views.send_otp_to_phone_tasks.delay')
+    @patch('accounts.views.dispatch_otp')
     @patch('accounts.views.generate_otp_auth_num')
     def test_throttling_protection(self, mock_generate_otp, mock_send_otp):
         mock_generate_otp.return_value = '111111'
@@ -196,6 +196,10 @@ class TestVerifyOTPView(APITestCase):
 
 class TestLogoutView(APITestCase):
     def setUp(self):
+        # The blacklist check queues a rebuild of the Redis mirror on first use
+        rebuild = patch('accounts.tasks.rebuild_token_blacklist.delay')
+        rebuild.start()
+        self.addCleanup(rebuild.stop)
         self.url_logout = reverse('logout')
         self.user = User.objects.create(phone="+989123456789")
         
@@ -223,6 +227,11 @@ class TestRefreshTokenView(APITestCase):
         self.url = reverse('token-refresh')
         self.user = User.objects.create(phone="+989123456789")
         self.user.save()
+
+    def setUp(self):
+        rebuild = patch('accounts.tasks.rebuild_token_blacklist.delay')
+        rebuild.start()
+        self.addCleanup(rebuild.stop)
         
     def test_refresh_token_success(self):
         response_login = self.login(self.user)
@@ -258,7 +267,7 @@ class TestChangePhoneRequestView(APITestCase):
     
     @override_settings(DEBUG=True)
     @patch('accounts.views.generate_otp_change_phone', return_value=123456)
-    @patch('accounts.views.send_otp_to_phone_tasks.delay')
+    @patch('accounts.views.dispatch_otp')
     def test_request_otp_success(self, mock_send_otp, mock_generate_otp):
         response = self.client.post(self.url, {"phone": self.valid_new_phone})
         
@@ -266,7 +275,7 @@ class TestChangePhoneRequestView(APITestCase):
         self.assertEqual(response.data['otp'], 123456)
         
         mock_generate_otp.assert_called_once_with(self.valid_new_phone)
-        mock_send_otp.assert_called_once_with(123456)
+        mock_send_otp.assert_called_once_with(self.valid_new_phone, 123456)
     
     def test_request_otp_without_login(self):
         self.client.cookies['access_token'] = 'invalid.token.here'
@@ -1,9 +1,12 @@
-import time
-from django.core.cache import cache
+import hashlib
+import math
+
 from django.conf import settings
 from rest_framework.throttling import BaseThrottle
 from rest_framework.exceptions import Throttled
 
+from utils.rate_limit import SlidingWindowRateLimiter, local_allowances
+
 
 class CustomThrottled(Throttled):
     """Custom exception for throttling that displays wait time in HH:MM:SS format."""
@@ -17,7 +20,32 @@ class CustomThrottled(Throttled):
         return self.detail
 
 
-class IPThrottling(BaseThrottle):
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Base for throttles backed by SlidingWindowRateLimiter: subclasses provide the cache key
+    and the (seconds, max_requests) windows, the check itself is one atomic Redis call.
+    """
+    def get_windows(self):
+        raise NotImplementedError('.get_windows() must be overridden')
+
+    def allow_request(self, request, view):
+        self.key = self.get_cache_key(request, view)
+        self.wait_time = None
+        if not self.key:
+            return True
+
+        result = SlidingWindowRateLimiter(self.get_windows()).hit(self.key)
+        self.wait_time = result.wait
+        if not result.allowed:
+            raise CustomThrottled(wait=self.wait())
+        return True
+
+    def wait(self):
+        """Seconds until the throttled request would be allowed, from the last check."""
+        return getattr(self, 'wait_time', None)
+
+
+class IPThrottling(SlidingWindowThrottle):
     """
     Custom throttle class that enforces rate limiting based on configurable time windows.
     """
@@ -45,42 +73,13 @@ class IPThrottling(BaseThrottle):
         ip = self.get_ident(request)  # Identifies the client by their IP address
         return f"{self.scope}:{ip}"
 
-    def allow_request(self, request, view):
-        self.key = self.get_cache_key(request, view)
-        if not self.key:
-            return True
-
-        throttle_data = cache.get(self.key)
-        now = time.time()
-
-        if throttle_data:
-            request_count, first_request_time = throttle_data
-            elapsed_time = now - float(first_request_time)
-
-            if elapsed_time < self.time_out:
-                if request_count < self.max_requests:
-                    cache.set(self.key, (request_count + 1, first_request_time), timeout=self.time_out)
-                    return True
-                raise CustomThrottled(wait=self.wait())
-
-            cache.set(self.key, (1, now), timeout=self.time_out)
-            return True
-
-        cache.set(self.key, (1, now), timeout=self.time_out)
-        return True
-
-    def wait(self):
-        throttle_data = cache.get(self.key)
-        if not throttle_data:
-            return None
-        request_count, first_request_time = throttle_data
-        remaining_time = self.time_out - (time.time() - float(first_request_time))
-        return max(0, remaining_time)
+    def get_windows(self):
+        return [(self.time_out, self.max_requests)]
 
 
 # region Phone Throttle
 
-class PhoneThrottle(BaseThrottle):
+class PhoneThrottle(SlidingWindowThrottle):
     """
     Throttle class that allows configuration of scope, time_out, and max_requests.
     """
@@ -95,44 +94,15 @@ class PhoneThrottle(BaseThrottle):
             return None
         return f"{self.scope}:{phone}"
 
-    def allow_request(self, request, view):
-        self.key = self.get_cache_key(request, view)
-        if not self.key:
-            return True
-
-        throttle_data = cache.get(self.key)
-        now = time.time()
-
-        if throttle_data:
-            request_count, first_request_time = throttle_data
-            elapsed_time = now - float(first_request_time)
-
-            if elapsed_time < self.time_out:
-                if request_count < self.max_requests:
-                    cache.set(self.key, (request_count + 1, first_request_time), timeout=self.time_out)
-                    return True
-                raise CustomThrottled(wait=self.wait())
-
-            cache.set(self.key, (1, now), timeout=self.time_out)
-            return True
-
-        cache.set(self.key, (1, now), timeout=self.time_out)
-        return True
-
-    def wait(self):
-        throttle_data = cache.get(self.key)
-        if not throttle_data:
-            return None
-        request_count, first_request_time = throttle_data
-        remaining_time = self.time_out - (time.time() - float(first_request_time))
-        return max(0, remaining_time)
+    def get_windows(self):
+        return [(self.time_out, self.max_requests)]
 
 # endregion
 
 
 # region Dual Throttle
 
-class DualThrottle(BaseThrottle):
+class DualThrottle(SlidingWindowThrottle):
     """
     A throttle class that supports dual time-based limits:
     1. Short-term limit (e.g., 1 request every 120 seconds).
@@ -159,72 +129,90 @@ class DualThrottle(BaseThrottle):
             return None
         return f"{self.scope}:{phone}"
 
-    def get_throttle_data(self, key):
+    def get_windows(self):
         """
-        Retrieves throttle data from cache.
-        :param key: Cache key.
-        :return: List of timestamps of past requests.
+        Both limits are checked, and the request recorded, in the same atomic step.
         """
-        return cache.get(key, [])
+        return [
+            (self.short_time_out, self.short_max_requests),
+            (self.long_time_out, self.long_max_requests),
+        ]
 
-    def set_throttle_data(self, key, timestamps):
-        """
-        Stores updated request timestamps in cache.
-        :param key: Cache key.
-        :param timestamps: List of timestamps.
-        """
-        # Set expiration time to the maximum of both time windows
-        cache.set(key, timestamps, timeout=max(self.short_time_out, self.long_time_out))
+# endregion
 
-    def allow_request(self, request, view):
-        """
-        Checks if the request is allowed under both short-term and long-term limits.
-        """
-        self.key = self.get_cache_key(request, view)
-        if not self.key:
-            return True
 
-        now = time.time()
-        timestamps = self.get_throttle_data(self.key)
+# region Multi-window Rate Throttle
 
-        # Remove timestamps outside of both time windows
-        timestamps = [ts for ts in timestamps if now - ts <= self.long_time_out]
+class MultiWindowRateThrottle(BaseThrottle):
+    """
+    Multi-window rate limits per client identity, configured per view scope in
+    settings.RATE_LIMITS[view.rate_limit_scope]:
+
+        {"ip": [(1, 20), (60, 600)], "user": [...], "api_key": [...]}
 
-        # Check short-term limit
-        short_term_timestamps = [ts for ts in timestamps if now - ts <= self.short_time_out]
-        if len(short_term_timestamps) >= self.short_max_requests:
-            wait_time = self.short_time_out - (now - short_term_timestamps[0])
-            raise CustomThrottled(wait=wait_time)
+    A request must fit the limits of every identity it carries: its IP address, the
+    authenticated user and the API key header. Each check goes through the per-process
+    local allowances first, so clients far below their limits rarely reach Redis.
+    The outcome is left on `request.rate_limit` for RateLimitHeadersMixin.
+    """
+    scope_attr = 'rate_limit_scope'
+    api_key_header = 'HTTP_X_API_KEY'
+
+    def get_identities(self, request):
+        identities = [('ip', self.get_ident(request))]
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            identities.append(('user', user.pk))
+        api_key = request.META.get(self.api_key_header)
+        if api_key:
+            # Keep the keys themselves out of Redis
+            identities.append(('api_key', hashlib.sha256(api_key.encode()).hexdigest()[:32]))
+        return identities
 
-        # Check long-term limit
-        if len(timestamps) >= self.long_max_requests:
-            wait_time = self.long_time_out - (now - timestamps[0])
-            raise CustomThrottled(wait=wait_time)
+    def allow_request(self, request, view):
+        scope = getattr(view, self.scope_attr, None)
+        limits = settings.RATE_LIMITS.get(scope) if scope else None
+        self.wait_time = None
+        if not limits:
+            return True
 
-        # Add current request timestamp and update cache
-        timestamps.append(now)
-        self.set_throttle_data(self.key, timestamps)
+        tightest = None
+        for kind, ident in self.get_identities(request):
+            if not limits.get(kind):
+                continue
+            limiter = SlidingWindowRateLimiter(limits[kind])
+            result = local_allowances.hit(limiter, f"rate_limit:{scope}:{kind}:{ident}")
+            if tightest is None or not result.allowed or result.remaining < tightest.remaining:
+                tightest = result
+            if not result.allowed:
+                break
+
+        request.rate_limit = tightest
+        if tightest is not None and not tightest.allowed:
+            self.wait_time = tightest.wait
+            raise CustomThrottled(wait=self.wait())
         return True
 
     def wait(self):
-        """
-        Returns the remaining time for the first valid time window.
-        """
-        if not self.key:
-            return None
+        return getattr(self, 'wait_time', None)
 
-        now = time.time()
-        timestamps = self.get_throttle_data(self.key)
 
-        # Check remaining time for short-term limit
-        short_term_timestamps = [ts for ts in timestamps if now - ts <= self.short_time_out]
-        if len(short_term_timestamps) >= self.short_max_requests:
-            return self.short_time_out - (now - short_term_timestamps[0])
+class RateLimitHeadersMixin:
+    """
+    Adds the RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset headers (IETF
+    draft-ietf-httpapi-ratelimit-headers) for the limit a throttle left on the request.
+    """
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        add_rate_limit_headers(response, getattr(request, 'rate_limit', None))
+        return response
 
-        # Check remaining time for long-term limit
-        if len(timestamps) >= self.long_max_requests:
-            return self.long_time_out - (now - timestamps[0])
 
-        return None
+def add_rate_limit_headers(response, result):
+    if result is None:
+        return
+    response['RateLimit-Limit'] = str(result.limit)
+    response['RateLimit-Remaining'] = str(result.remaining)
+    response['RateLimit-Reset'] = str(math.ceil(result.reset))
 
-# endregion
\ No newline at end of file
+# endregion
@@ -12,7 +12,6 @@ from rest_framework.views import APIView
 from rest_framework.request import Request
 from rest_framework.exceptions import PermissionDenied
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from rest_framework_simplejwt.serializers import TokenBlacklistSerializer
 from rest_framework_simplejwt.tokens import RefreshToken, Token
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -22,11 +21,13 @@ from accounts.serializers import *
 from accounts.throttles import DualThrottle
 from accounts.permissions import IsAnonymous
 from accounts.jwt import set_token_cookies, delete_token_cookies
-from accounts.tasks import send_otp_to_phone_tasks
+from accounts.otp_dispatch import dispatch_otp
 from utils import generate_otp_change_phone, generate_otp_auth_num
 
 
 class RefreshTokenAPIView(TokenRefreshView):
+    serializer_class = CachedTokenRefreshSerializer
+
     def post(self, request: Request, *args, **kwargs) -> Response:
         try:
             serializer = self.get_serializer(data={"refresh": self.get_refresh_token_from_cookie()})
@@ -104,7 +105,7 @@ class RequestOTPView(APIView):
             created = User.objects.filter(phone=phone).exists()
 
             otp = generate_otp_auth_num(phone)
-            send_otp_to_phone_tasks.delay(otp)
+            dispatch_otp(phone, otp)
             
             data = {'created': not created,}
             
@@ -148,7 +149,7 @@ class VerifyOTPView(BaseLoginView):
 
 
 class LogoutAPIView(APIView):
-    serializer_class = TokenBlacklistSerializer
+    serializer_class = CachedTokenBlacklistSerializer
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -188,7 +189,7 @@ class ChangePhoneRequestView(APIView):
             data = serializer.validated_data
             
             otp = generate_otp_change_phone(data['phone'])
-            send_otp_to_phone_tasks.delay(otp)
+            dispatch_otp(data['phone'], otp)
             
             data = {}
             
@@ -161,12 +161,28 @@ OTP = {
     "EXPIRATION_TIME_SECONDS": 60 * 2,
     "LONG_TIME_SECONDS": 2 * 60 * 60,
     "LONG_MAX_REQUESTS": 15,
+    "MAX_FAILED_ATTEMPTS": 5,  # Wrong codes per phone before the pending code is discarded
 
     "VALID_WINDOW": 1,
     # VALID_WINDOW defines how many time steps are valid for OTP
     # verification Each step is 30 seconds, and values from 0 to 5 are allowed.
 }
 
+# Outbound OTP messages are buffered per gateway and sent in batches (accounts.otp_dispatch)
+OTP_DISPATCH = {
+    "GATEWAYS": {
+        # Dotted path of the SMS provider's SMSGateway subclass; ConsoleGateway only prints the codes
+        "default": os.getenv('OTP_SMS_GATEWAY', 'accounts.sms.ConsoleGateway' if DEBUG else ''),
+    },
+    "ROUTES": {},  # Phone prefix -> gateway alias, e.g. {"+98": "default"}; unmatched phones use "default"
+    "MESSAGE": "Your OTP is: {otp}",
+    "BATCH_SIZE": 500,  # Messages per send_many() call
+    "FLUSH_INTERVAL_SECONDS": 1,  # Longest a message waits for its batch to fill up
+    "MAX_ATTEMPTS": 5,  # Per message; expired codes are dropped sooner
+    "RETRY_BACKOFF_SECONDS": 1,  # Doubled on each retry of a flush, up to RETRY_BACKOFF_MAX_SECONDS
+    "RETRY_BACKOFF_MAX_SECONDS": 30,
+}
+
     
 
 # USER_MODEL
@@ -192,6 +208,22 @@ SIMPLE_JWT = {
 }
 
 
+# Users resolved by JWTCookieAuthentication are cached by id
+AUTH_USER_CACHE = {
+    "TIMEOUT_SECONDS": 60,  # Bounds staleness for changes that bypass User.save()
+}
+
+
+# Redis mirror of the refresh token blacklist (accounts.blacklist.TokenBlacklist)
+TOKEN_BLACKLIST_CACHE = {
+    "BLOOM_BITS": 2 ** 24,  # 2 MB bitmap: about 1% false positives with 1.7 million live blacklisted tokens
+    "BLOOM_HASHES": 7,
+    "BATCH_SIZE": 10000,  # Rows per statement when pruning, per pipeline when rebuilding
+    "REBUILD_RETRY_SECONDS": 5 * 60,  # At most one rebuild is queued per interval while the filter is missing
+    "REBUILD_LOCK_SECONDS": 30 * 60,  # Longest a rebuild keeps others out, should its worker die mid-run
+}
+
+
 # REST_FRAMEWORK
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
@@ -206,10 +238,42 @@ CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL')
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
+CELERY_BEAT_SCHEDULE = {
+    'sync-product-index-delta': {
+        'task': 'products.tasks.sync_product_index_delta',
+        'schedule': 5 * 60,
+    },
+    'decay-popular-queries': {
+        'task': 'products.tasks.decay_popular_queries',
+        'schedule': 10 * 60,  # Keep in step with PRODUCT_POPULAR_QUERIES["DECAY_INTERVAL_SECONDS"]
+    },
+    'precompute-top-queries': {
+        'task': 'products.tasks.precompute_top_queries',
+        'schedule': 5 * 60,  # Keep in step with PRODUCT_POPULAR_QUERIES["PRECOMPUTE_INTERVAL_SECONDS"]
+    },
+    'prune-token-blacklist': {
+        'task': 'accounts.tasks.prune_token_blacklist',
+        'schedule': 24 * 60 * 60,
+    },
+}
 
 
 # RATELIMIT
-# RATELIMIT_USE_CACHE = 'default'
+# Sliding windows per view `rate_limit_scope`: (seconds, max requests) pairs for each client identity.
+# A request must fit the limits of every identity it carries: its IP, the user and the X-API-Key header.
+RATE_LIMITS = {
+    "product-search": {
+        "ip": [(1, 20), (60, 600)],
+        "user": [(1, 30), (60, 1200)],
+        "api_key": [(1, 50), (60, 3000)],
+    },
+}
+
+# Per-process pre-check in front of the Redis rate limiter
+RATE_LIMIT_LOCAL = {
+    "SHARE": 0.25,  # Fraction of a client's remaining requests a process serves before asking Redis again
+    "MAX_CLIENTS": 10000,  # Clients tracked per process, least recently seen dropped first
+}
 
 
 # CSRF
@@ -222,16 +286,98 @@ CSRF_COOKIE_DOMAIN = None  # TODO: ".example.com" or None for standard domain co
 CSRF_COOKIE_SECURE = False  # TODO: Whether the auth cookies should be secure (https:// only).
 
 
+# In-process tier in front of Redis for read-mostly keys (index generation, precomputed search pages)
+LOCAL_CACHE = {
+    "MAX_ENTRIES": 5000,
+    "MAX_BYTES": 64 * 1024 * 1024,  # Per worker process, measured on the pickled values
+    "TIMEOUT_SECONDS": 10,  # Bounds how stale an entry gets if its invalidation is lost or Redis is flushed
+    "CHANNEL": "cache:local:invalidate",  # Redis pub/sub channel carrying invalidations
+}
+
+
 # Elasticsearch configuration
 ELASTICSEARCH_DSL = {
     'default': {
-        'hosts': 'http://elasticsearch:9200'
+        'hosts': 'http://elasticsearch:9200',
+        'maxsize': int(os.getenv('ELASTICSEARCH_MAXSIZE', 25)),  # Keep-alive connections per worker process
+        'http_compress': True,  # gzip request bodies (bulk indexing) and accept gzip responses
+        'timeout': 10,  # Default request timeout in seconds; searches use PRODUCT_SEARCH["REQUEST_TIMEOUT_SECONDS"]
+        'max_retries': 2,
+        'retry_on_status': (502, 503, 504),
+        'retry_on_timeout': False,  # A timed out node is slow, not gone: retrying only adds load
     },
 }
 
-if DEBUG:
-    ELASTICSEARCH_DSL['default'].update({
-        'timeout': 10,  # seconds
-        'max_retries': 3,
-        'retry_on_timeout': True,
-    })
\ No newline at end of file
+# AsyncElasticsearch client used by the ASGI search view
+ELASTICSEARCH_ASYNC = {
+    "MAXSIZE": 100,  # Pooled connections per worker process, i.e. concurrent in-flight searches
+}
+
+# Fail searches fast while Elasticsearch keeps erroring instead of queueing on it
+ELASTICSEARCH_CIRCUIT_BREAKER = {
+    "FAILURE_THRESHOLD": 5,  # Consecutive transient failures that open the breaker
+    "RESET_SECONDS": 30,  # How long it stays open before a single probe request is let through
+}
+
+
+# Product index queue
+PRODUCT_INDEX_QUEUE = {
+    "BATCH_SIZE": 500,  # Flush as soon as this many products are waiting
+    "FLUSH_INTERVAL_SECONDS": 5,  # Otherwise flush this long after the first queued change
+}
+
+
+# Incremental index sync driven by Product.updated_at
+PRODUCT_INDEX_DELTA = {
+    "BATCH_SIZE": 1000,
+    "SAFETY_LAG_SECONDS": 10,  # Leave very recent rows to the next run in case older transactions commit late
+    "LOCK_TIMEOUT_SECONDS": 30 * 60,
+}
+
+
+# Product search result cache
+PRODUCT_SEARCH_CACHE = {
+    "TIMEOUT_SECONDS": 60,  # Also bounds how long pages from before an index refresh survive
+}
+
+
+# Product search
+PRODUCT_SEARCH = {
+    "TIERED_MIN_HITS": 10,  # Fall back to the fuzzy query when the exact tier matches fewer documents
+    "TIMEOUT": "800ms",  # Elasticsearch-side budget; slow shards return partial results instead of stalling
+    "REQUEST_TIMEOUT_SECONDS": 2,  # Client-side cap on the whole round trip
+    "PIT_KEEP_ALIVE": "2m",  # How long a consistent-mode point in time survives between two pages
+}
+
+
+# Search cache warm-up (python manage.py warm_search_cache)
+PRODUCT_SEARCH_WARMUP = {
+    "TOP_QUERIES": 100,  # How many of the most popular queries are replayed
+}
+
+
+# Popular query tracking and the precomputed first pages of the top queries
+PRODUCT_POPULAR_QUERIES = {
+    "MAX_TRACKED": 10000,  # Queries kept in the popularity set after each flush and decay step
+    "FLUSH_SECONDS": 5,  # Searches are counted in process and added to the set this often
+    "HALF_LIFE_SECONDS": 24 * 60 * 60,  # A search counts half as much after this long
+    "DECAY_INTERVAL_SECONDS": 10 * 60,
+    "TOP_K": 200,  # Queries whose first page is precomputed
+    "PRECOMPUTE_INTERVAL_SECONDS": 5 * 60,  # Also bounds how stale a precomputed page can be
+}
+
+
+# Streaming search export (/api/products/export/)
+PRODUCT_SEARCH_EXPORT = {
+    "BATCH_SIZE": 1000,  # Hits per Elasticsearch request, also one streamed chunk
+    "MAX_RESULTS": 100000,
+    "KEEP_ALIVE": "1m",  # Point in time lifetime between two batches
+}
+
+
+# Product search instrumentation
+PRODUCT_SEARCH_METRICS = {
+    "SLOW_QUERY_MS": 500,  # Searches slower than this are logged with their normalized query
+    "ALLOWED_IPS": ["127.0.0.1"],  # Who may scrape /api/products/metrics/
+    "FLUSH_SECONDS": 5,  # How often each worker adds its counts to the totals the endpoint serves
+}
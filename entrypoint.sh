@@ -8,17 +8,24 @@ echo "✅ Migrations completed."
 echo "========================================="
 
 echo "▶️ Generating test data (5,000,000 products)..."
-python manage.py create_test_products 5000000
+python manage.py create_test_products 5000000 --disable-indexes
 echo "✅ Test data created."
 echo "========================================="
 
 echo "▶️ Rebuilding search index..."
-python manage.py search_index --rebuild -f --parallel
+python manage.py reindex_products --resume
 echo "✅ Search index rebuilt."
 echo "========================================="
+
+echo "▶️ Warming search cache with the most popular queries..."
+python manage.py warm_search_cache
+echo "✅ Search cache warmed."
+echo "========================================="
 echo ""
 echo ""
 echo ""
 
-echo "▶️ Starting Django development server..."
-exec python manage.py runserver 0.0.0.0:8000
+echo "▶️ Starting Django ASGI server..."
+# Sync views (all of DRF) share one thread per process under ASGI, so run several processes
+WEB_CONCURRENCY="${WEB_CONCURRENCY:-$(( $(nproc) * 2 + 1 ))}"
+exec uvicorn core.asgi:application --host 0.0.0.0 --port 8000 --workers "$WEB_CONCURRENCY"
@@ -1,6 +1,4 @@
 from django.apps import AppConfig
-import random
-import time
 
 
 class ProductsConfig(AppConfig):
@@ -9,19 +7,3 @@ class ProductsConfig(AppConfig):
 
     def ready(self):
         import products.signals
-
-        try:
-            from products.documents import ProductDocument
-
-            for i in range(5):
-                offset = random.randint(0, 100)
-                ProductDocument.search() \
-                    .query("match_all") \
-                    .source(['id', 'title', 'price', 'description']) \
-                    [offset:offset + 20] \
-                    .execute()
-
-                time.sleep(0.2)
-
-        except Exception as e:
-            pass
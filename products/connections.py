@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from django.conf import settings
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.exceptions import ConnectionError, TransportError
+from rest_framework.exceptions import APIException
+
+from .instrumentation import search_es_failures
+
+
+# aiohttp sessions are bound to the event loop that created them, so there is one
+# pooled client per running loop (in practice: one per ASGI worker process)
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Shared AsyncElasticsearch client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncElasticsearch(**{
+            **settings.ELASTICSEARCH_DSL['default'],
+            'maxsize': settings.ELASTICSEARCH_ASYNC["MAXSIZE"],
+        })
+        _async_clients[loop] = client
+    return client
+
+
+class SearchUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Search is temporarily unavailable, please try again shortly.'
+    default_code = 'search_unavailable'
+
+
+def is_transient(exc):
+    """Connection failures, timeouts and overload answers; not errors caused by the request itself."""
+    if isinstance(exc, ConnectionError):  # includes ConnectionTimeout
+        return True
+    return isinstance(exc, TransportError) and exc.status_code in (429, 502, 503, 504)
+
+
+class CircuitBreaker:
+    """
+    Per-process breaker around Elasticsearch calls. After FAILURE_THRESHOLD consecutive
+    transient failures it opens and rejects calls immediately; after RESET_SECONDS one
+    probe call is let through, and its outcome closes or re-opens the breaker.
+    """
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < settings.ELASTICSEARCH_CIRCUIT_BREAKER["RESET_SECONDS"]:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= settings.ELASTICSEARCH_CIRCUIT_BREAKER["FAILURE_THRESHOLD"]:
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        with self.lock:
+            self.probing = False
+
+    @contextmanager
+    def guard(self):
+        """Wrap one Elasticsearch call; transient failures and rejections surface as SearchUnavailable."""
+        if not self.allow():
+            search_es_failures.inc('rejected')
+            raise SearchUnavailable()
+
+        try:
+            yield
+        except TransportError as exc:
+            if not is_transient(exc):
+                # Elasticsearch answered, it just did not like the request
+                self.record_success()
+                raise
+            search_es_failures.inc(type(exc).__name__)
+            self.record_failure()
+            raise SearchUnavailable() from exc
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record_success()
+
+
+search_breaker = CircuitBreaker()
@@ -52,6 +52,16 @@ product_index.settings(
                     "persian_stem",
                     "edge_ngram_filter"
                 ]
+            },
+            "persian_suggest": {
+                "tokenizer":   "standard",
+                "char_filter": ["zero_width_spaces"],
+                "filter": [
+                    "lowercase",
+                    "decimal_digit",
+                    "arabic_normalization",
+                    "persian_normalization"
+                ]
             }
         }
     }
@@ -96,6 +106,13 @@ class ProductDocument(Document):
     )
     tags_en = fields.TextField(attr="cached_tags")
 
+    # Prefix autocomplete over the title and each tag; no stopwords or stemming on half-typed input
+    suggest = fields.CompletionField(
+        analyzer="persian_suggest",
+        search_analyzer="persian_suggest",
+        preserve_separators=True,
+        preserve_position_increments=False,
+    )
     
     class Index:
         name = 'products'
@@ -104,6 +121,8 @@ class ProductDocument(Document):
     class Django:
         model = Product
         fields = ['title', 'id']
+        # Indexing goes through the batched queue in products.indexing, not per-save syncs
+        ignore_signals = True
         
     def get_queryset(self):
         return super().get_queryset().filter(is_published=True, is_deleted=False)
@@ -111,3 +130,6 @@ class ProductDocument(Document):
     def should_index_instance(self, instance):
         return instance.is_published and not instance.is_deleted
 
+    def prepare_suggest(self, instance):
+        tags = [tag for tag in (instance.cached_tags or '').split(',') if tag]
+        return {'input': [instance.title, *tags]}
@@ -0,0 +1,123 @@
+import csv
+import io
+
+import orjson
+from django.conf import settings
+
+from .pagination import aclose_point_in_time, aexecute_raw, close_point_in_time, execute_raw
+
+
+# `_shard_doc` is the cheapest unique tiebreaker inside a point in time
+EXPORT_SORT = [{'_score': {'order': 'desc'}}, {'_shard_doc': {'order': 'asc'}}]
+
+
+def iter_hit_batches(search, pit_id, batch_size, limit):
+    """
+    Yield the raw hits of `search` in lists of up to `batch_size`, at most `limit` in total.
+    All batches are read from the point in time `pit_id` with search_after, so the export is
+    a consistent snapshot however slowly the client consumes it. The point in time is closed
+    when the generator finishes or is closed; one that is never iterated expires after KEEP_ALIVE.
+    """
+    pit = {'id': pit_id, 'keep_alive': settings.PRODUCT_SEARCH_EXPORT["KEEP_ALIVE"]}
+    search = search.sort(*EXPORT_SORT).extra(track_total_hits=False)
+
+    try:
+        search_after = None
+        remaining = limit
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            response = execute_raw(batch_search(search, size, search_after), pit=pit)
+            pit = {**pit, 'id': response.get('pit_id', pit['id'])}
+
+            hits = response['hits']['hits']
+            if hits:
+                yield hits
+            if len(hits) < size:
+                return
+
+            remaining -= len(hits)
+            search_after = hits[-1]['sort']
+    finally:
+        close_point_in_time(search, pit['id'])
+
+
+async def aiter_hit_batches(search, pit_id, batch_size, limit):
+    """iter_hit_batches() on the event loop's shared AsyncElasticsearch client."""
+    pit = {'id': pit_id, 'keep_alive': settings.PRODUCT_SEARCH_EXPORT["KEEP_ALIVE"]}
+    search = search.sort(*EXPORT_SORT).extra(track_total_hits=False)
+
+    try:
+        search_after = None
+        remaining = limit
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            response = await aexecute_raw(batch_search(search, size, search_after), pit=pit)
+            pit = {**pit, 'id': response.get('pit_id', pit['id'])}
+
+            hits = response['hits']['hits']
+            if hits:
+                yield hits
+            if len(hits) < size:
+                return
+
+            remaining -= len(hits)
+            search_after = hits[-1]['sort']
+    finally:
+        await aclose_point_in_time(pit['id'])
+
+
+def batch_search(search, size, search_after):
+    batch = search.extra(size=size)
+    if search_after is not None:
+        batch = batch.extra(search_after=search_after)
+    return batch
+
+
+def ndjson_encoder(serializer):
+    """(header, encode): the bytes that open the export and the function turning a batch of hits into bytes."""
+    def encode(hits):
+        return b''.join(orjson.dumps(serializer.to_representation(hit)) + b'\n' for hit in hits)
+
+    return b'', encode
+
+
+def csv_encoder(serializer):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    def encode(hits):
+        for hit in hits:
+            row = serializer.to_representation(hit)
+            writer.writerow([row[name] for name in serializer.source_fields])
+        return flush()
+
+    writer.writerow(serializer.source_fields)
+    return flush(), encode
+
+
+def iter_chunks(batches, encoder):
+    header, encode = encoder
+    if header:
+        yield header
+    for hits in batches:
+        yield encode(hits)
+
+
+async def aiter_chunks(batches, encoder):
+    header, encode = encoder
+    if header:
+        yield header
+    async for hits in batches:
+        yield encode(hits)
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_encoder),
+    'csv': ('text/csv; charset=utf-8', csv_encoder),
+}
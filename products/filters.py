@@ -1,23 +1,81 @@
+from collections import namedtuple
+
+from django.conf import settings
 from django_elasticsearch_dsl_drf.filter_backends import BaseSearchFilterBackend
-from elasticsearch_dsl.query import MultiMatch
+from elasticsearch_dsl.query import Bool, MultiMatch
+
+from .normalization import normalize_query
+from .pagination import parse_search_after
+
+# Search the paginator runs instead when the primary search matches fewer than `min_hits` documents
+FallbackSearch = namedtuple('FallbackSearch', ['tier', 'search', 'min_hits'])
+
 
 class FuzzySearchFilterBackend(BaseSearchFilterBackend):
+    def get_fuzzy_query(self, query):
+        return MultiMatch(
+            query=query,
+            fields=[
+                'title_fa_ngram^2',
+                'title_en',
+                'tags_fa_ngram',
+            ],
+            fuzziness='AUTO',
+            prefix_length=1,
+            type='best_fields',
+        )
+
     def filter_queryset(self, request, queryset, view):
-        query = request.query_params.get('search', None)
+        query = normalize_query(request.query_params.get('search', None))
         if not query:
             return queryset
-        
-        queryset =  queryset.query(
-            MultiMatch(
-                query=query,
-                fields=[
-                    'title_fa_ngram^2',
-                    'title_en',
-                    'tags_fa_ngram',
-                ],
-                fuzziness='AUTO',
-                prefix_length=1,
-                type='best_fields',
-            )
-        )
+
+        queryset =  queryset.query(self.get_fuzzy_query(query))
         return queryset
+
+
+class TieredSearchFilterBackend(FuzzySearchFilterBackend):
+    """
+    Two-phase search: a cheap non-fuzzy match / phrase-prefix query over the plain Persian
+    fields first, and the fuzzy ngram query only when that matches fewer than
+    PRODUCT_SEARCH["TIERED_MIN_HITS"] documents.
+
+    The decision is made on the first page; the answering tier is reported in the
+    response and carried in the `search_after` cursor so later pages stay on it.
+    """
+    EXACT = 'exact'
+    FUZZY = 'fuzzy'
+
+    exact_fields = [
+        'title_fa^2',
+        'tags_fa',
+    ]
+
+    def get_exact_query(self, query):
+        return Bool(
+            should=[
+                MultiMatch(query=query, fields=self.exact_fields, type='best_fields', operator='and'),
+                MultiMatch(query=query, fields=self.exact_fields, type='phrase_prefix'),
+            ],
+            minimum_should_match=1,
+        )
+
+    def filter_queryset(self, request, queryset, view):
+        query = normalize_query(request.query_params.get('search', None))
+        if not query:
+            return queryset
+
+        cursor = parse_search_after(request.query_params.get(view.paginator.search_after_param))
+        # Cursors without an exact tier come from the fuzzy tier (or from before tiering)
+        if cursor is not None and cursor.tier != self.EXACT:
+            view.search_tier = self.FUZZY
+            return queryset.query(self.get_fuzzy_query(query))
+
+        view.search_tier = self.EXACT
+        if cursor is None:
+            view.fallback_search = FallbackSearch(
+                tier=self.FUZZY,
+                search=queryset.query(self.get_fuzzy_query(query)),
+                min_hits=settings.PRODUCT_SEARCH["TIERED_MIN_HITS"],
+            )
+        return queryset.query(self.get_exact_query(query))
@@ -0,0 +1,158 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .documents import ProductDocument
+from .models import Product
+from .search_cache import SearchResultCache
+
+
+class IndexQueue:
+    """
+    Set of product ids waiting to be pushed to Elasticsearch.
+    Backed by a Redis set, so repeated edits of the same product collapse into one entry.
+    """
+    key = 'products:index_queue'
+    flush_scheduled_key = 'products:index_queue:flush_scheduled'
+    flush_now_key = 'products:index_queue:flush_now'
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    @classmethod
+    def push(cls, product_ids):
+        """Add ids to the queue and return the queue size."""
+        connection = cls.get_connection()
+        pipe = connection.pipeline()
+        pipe.sadd(cls.key, *product_ids)
+        pipe.scard(cls.key)
+        _, size = pipe.execute()
+        return size
+
+    @classmethod
+    def pop(cls, count):
+        """Remove and return up to `count` ids from the queue."""
+        members = cls.get_connection().spop(cls.key, count) or []
+        return [int(member) for member in members]
+
+    @classmethod
+    def size(cls):
+        return cls.get_connection().scard(cls.key)
+
+
+def enqueue_product_index(*product_ids):
+    """
+    Record products whose search document is stale and make sure a flush is on its way:
+    immediately once the queue reaches BATCH_SIZE, otherwise after FLUSH_INTERVAL_SECONDS.
+    At most one immediate flush is queued at a time; it drains the whole queue.
+    """
+    from .tasks import flush_product_index_queue
+
+    if not product_ids:
+        return
+
+    config = settings.PRODUCT_INDEX_QUEUE
+    size = IndexQueue.push(product_ids)
+
+    if size >= config["BATCH_SIZE"]:
+        if cache.add(IndexQueue.flush_now_key, 1, timeout=config["FLUSH_INTERVAL_SECONDS"]):
+            flush_product_index_queue.delay()
+    elif cache.add(IndexQueue.flush_scheduled_key, 1, timeout=config["FLUSH_INTERVAL_SECONDS"]):
+        flush_product_index_queue.apply_async(countdown=config["FLUSH_INTERVAL_SECONDS"])
+
+
+def get_index_actions(product_ids, document=None):
+    """
+    Build `_bulk` actions for the given ids: published products are (re)indexed,
+    everything else (unpublished, soft-deleted or gone from the database) is deleted.
+    """
+    document = document or ProductDocument()
+    index_name = document._index._name
+    found = set()
+
+    for product in Product.objects.filter(pk__in=product_ids):
+        found.add(product.pk)
+        if document.should_index_instance(product):
+            yield document._prepare_action(product, 'index')
+        else:
+            yield {'_op_type': 'delete', '_index': index_name, '_id': product.pk}
+
+    for product_id in product_ids:
+        if product_id not in found:
+            yield {'_op_type': 'delete', '_index': index_name, '_id': product_id}
+
+
+def sync_products(product_ids):
+    """Push the current state of the given products to the index in a single `_bulk` request."""
+    if not product_ids:
+        return 0, []
+
+    document = ProductDocument()
+    result = document.bulk(
+        get_index_actions(product_ids, document),
+        refresh=False,
+        ignore_status=(404,),
+        chunk_size=len(product_ids),
+    )
+    SearchResultCache.bump_generation()
+    return result
+
+
+class IndexWatermark:
+    """
+    Position of the incremental index sync: the (updated_at, id) of the last product pushed.
+    Kept in the default cache without expiry.
+    """
+    key = 'products:index_delta:watermark'
+    lock_key = 'products:index_delta:lock'
+
+    @classmethod
+    def get(cls):
+        return cache.get(cls.key)
+
+    @classmethod
+    def set(cls, updated_at, product_id=0):
+        cache.set(cls.key, (updated_at, product_id), timeout=None)
+
+
+def sync_index_delta():
+    """
+    Push every product changed since the watermark, in keyset-ordered batches on (updated_at, id).
+    Rows newer than SAFETY_LAG_SECONDS are left for the next run, so transactions that commit
+    slightly out of order are not skipped.
+
+    Returns the number of products synced, or None if another sync is already running.
+    """
+    config = settings.PRODUCT_INDEX_DELTA
+    if not cache.add(IndexWatermark.lock_key, 1, timeout=config["LOCK_TIMEOUT_SECONDS"]):
+        return None
+
+    try:
+        upper_bound = timezone.now() - timedelta(seconds=config["SAFETY_LAG_SECONDS"])
+        changed = Product.objects.filter(updated_at__lt=upper_bound).order_by('updated_at', 'id')
+
+        synced = 0
+        while True:
+            batch = changed
+            watermark = IndexWatermark.get()
+            if watermark is not None:
+                updated_at, product_id = watermark
+                batch = batch.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=product_id))
+
+            rows = list(batch.values_list('id', 'updated_at')[:config["BATCH_SIZE"]])
+            if not rows:
+                break
+
+            sync_products([product_id for product_id, _ in rows])
+            last_id, last_updated_at = rows[-1]
+            IndexWatermark.set(last_updated_at, last_id)
+            synced += len(rows)
+
+        return synced
+    finally:
+        cache.delete(IndexWatermark.lock_key)
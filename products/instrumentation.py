@@ -0,0 +1,312 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+
+import orjson
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+logger = logging.getLogger('products.search')
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def empty(self):
+        return 0
+
+    def samples(self, values=None):
+        with self.lock:
+            for label_values, value in sorted((self.values if values is None else values).items()):
+                yield self.name, dict(zip(self.labels, label_values)), value
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self.values = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self.lock:
+            series = self.values.setdefault(label_values, self.empty())
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def empty(self):
+        return [0] * (len(self.buckets) + 2)
+
+    def samples(self, values=None):
+        with self.lock:
+            for label_values, series in sorted((self.values if values is None else values).items()):
+                labels = dict(zip(self.labels, label_values))
+                for bound, count in zip(self.buckets, series):
+                    yield f"{self.name}_bucket", {**labels, 'le': repr(float(bound))}, count
+                yield f"{self.name}_bucket", {**labels, 'le': '+Inf'}, series[-2]
+                yield f"{self.name}_count", labels, series[-2]
+                yield f"{self.name}_sum", labels, series[-1]
+
+
+class MetricsRegistry:
+    """
+    Metrics rendered in the Prometheus text exposition format.
+
+    Each process counts in memory, and a background thread adds what it counted since
+    the last flush to one Redis hash every FLUSH_SECONDS. `render(shared_values())`
+    therefore reports the totals of every uvicorn worker, whichever worker serves the
+    scrape, at most FLUSH_SECONDS behind. With a cache that has no Redis client
+    (LocMem) nothing is shared and each process reports its own values.
+    """
+    shared_key = 'products:search_metrics'
+
+    def __init__(self):
+        self.metrics = []
+        self.flushed = {}
+        self.flusher_pid = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def series(self):
+        """Every value of this process as {(metric name, label values, slot): value}."""
+        series = {}
+        for metric in self.metrics:
+            with metric.lock:
+                for label_values, value in metric.values.items():
+                    for slot, slot_value in enumerate(value if isinstance(value, list) else [value]):
+                        series[(metric.name, label_values, slot)] = slot_value
+        return series
+
+    def start_flusher(self):
+        """Start this process's flush thread, once per process."""
+        if self.flusher_pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.flusher_pid != os.getpid():
+                try:
+                    self.get_connection()
+                except NotImplementedError:
+                    pass
+                else:
+                    # A forked worker inherits the parent's counts, which the parent flushes itself
+                    self.flushed = self.series()
+                    threading.Thread(target=self.flush_forever, name='search-metrics-flush', daemon=True).start()
+                self.flusher_pid = os.getpid()
+
+    def flush_forever(self):
+        while True:
+            time.sleep(settings.PRODUCT_SEARCH_METRICS["FLUSH_SECONDS"])
+            try:
+                self.flush()
+            except Exception:
+                # Nothing is lost: the next flush sends these counts too
+                logger.warning("Could not flush the search metrics", exc_info=True)
+
+    def flush(self):
+        """Add what this process counted since its last flush to the shared totals."""
+        with self.lock:
+            series = self.series()
+            pipe = self.get_connection().pipeline(transaction=False)
+            for key, value in series.items():
+                delta = value - self.flushed.get(key, 0)
+                if isinstance(delta, int):
+                    if delta:
+                        pipe.hincrby(self.shared_key, orjson.dumps(key), delta)
+                elif delta:
+                    pipe.hincrbyfloat(self.shared_key, orjson.dumps(key), delta)
+            pipe.execute()
+            self.flushed = series
+
+    def shared_values(self):
+        """The totals of every process, as {metric name: values} for `render`."""
+        metrics = {metric.name: metric for metric in self.metrics}
+        values = {name: {} for name in metrics}
+        for field, raw in self.get_connection().hgetall(self.shared_key).items():
+            name, label_values, slot = orjson.loads(field)
+            metric = metrics.get(name)
+            if metric is None:
+                continue
+            value = float(raw)
+            value = int(value) if value.is_integer() else value
+            if isinstance(metric, Histogram):
+                metric_values = values[name].setdefault(tuple(label_values), metric.empty())
+                metric_values[slot] = value
+            else:
+                values[name][tuple(label_values)] = value
+        return values
+
+    def render(self, values=None):
+        lines = []
+        for metric in self.metrics:
+            kind = 'histogram' if isinstance(metric, Histogram) else 'counter'
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            for name, labels, value in metric.samples(None if values is None else values[metric.name]):
+                label_str = ','.join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+registry = MetricsRegistry()
+
+search_requests = registry.register(Counter(
+    'product_search_requests_total', 'Product search requests.', labels=('status', 'tier', 'cache'),
+))
+search_slow_queries = registry.register(Counter(
+    'product_search_slow_queries_total', 'Product searches slower than SLOW_QUERY_MS.',
+))
+search_es_failures = registry.register(Counter(
+    'product_search_es_failures_total', 'Searches that failed on Elasticsearch or were rejected by the circuit breaker.',
+    labels=('reason',),
+))
+search_phase_seconds = registry.register(Histogram(
+    'product_search_phase_seconds', 'Time spent in each phase of a product search.',
+    LATENCY_BUCKETS, labels=('phase',),
+))
+search_es_took_seconds = registry.register(Histogram(
+    'product_search_es_took_seconds', 'Search time reported by Elasticsearch (took).', LATENCY_BUCKETS,
+))
+search_total_hits = registry.register(Histogram(
+    'product_search_total_hits', 'Matching documents per search.', (0, 1, 10, 100, 1000, 10000),
+))
+
+
+class SearchTimings:
+    """
+    Per-request phase timer. Phases are accumulated in seconds and reported, in the
+    order they first ran, through the Server-Timing header and the phase histogram.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.mark = None
+        self.query = None
+        self.tier = None
+        self.cache = 'bypass'
+        self.total_hits = None
+        self.es_took = None
+
+    def add(self, name, duration):
+        self.phases[name] = self.phases.get(name, 0.0) + duration
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total):
+        entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in self.phases.items()]
+        if self.es_took is not None:
+            entries.append(f"es-took;dur={self.es_took * 1000:.1f}")
+        if self.total_hits is not None:
+            entries.append(f'hits;desc="{self.total_hits}"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(entries)
+
+
+class SearchInstrumentationMixin:
+    """
+    Times the phases of a DRF list view (query build, Elasticsearch round trip,
+    serialization, rendering), exposes them as a Server-Timing header, feeds the
+    product search metrics and logs searches slower than SLOW_QUERY_MS.
+    """
+    def initial(self, request, *args, **kwargs):
+        self.timings = SearchTimings()
+        super().initial(request, *args, **kwargs)
+
+    def get_queryset(self):
+        with self.timings.phase('query'):
+            return super().get_queryset()
+
+    def filter_queryset(self, queryset):
+        with self.timings.phase('query'):
+            return super().filter_queryset(queryset)
+
+    def paginate_queryset(self, queryset):
+        try:
+            with self.timings.phase('es'):
+                return super().paginate_queryset(queryset)
+        finally:
+            self.timings.tier = getattr(self.paginator, 'search_tier', None)
+            self.timings.total_hits = getattr(self.paginator, 'total_hits', None)
+            took = getattr(self.paginator, 'took', None)
+            self.timings.es_took = took / 1000 if took is not None else None
+            # ListModelMixin serializes the page between here and get_paginated_response
+            self.timings.mark = time.perf_counter()
+
+    def get_paginated_response(self, data):
+        if self.timings.mark is not None:
+            self.timings.add('serialize', time.perf_counter() - self.timings.mark)
+        return super().get_paginated_response(data)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        timings = getattr(self, 'timings', None)
+        if timings is not None and hasattr(response, 'add_post_render_callback'):
+            response.add_post_render_callback(partial(record_search, timings, time.perf_counter()))
+        return response
+
+
+def record_search(timings, render_started, response):
+    registry.start_flusher()
+    timings.add('render', time.perf_counter() - render_started)
+    total = timings.total()
+    response['Server-Timing'] = timings.server_timing(total)
+
+    search_requests.inc(str(response.status_code), timings.tier or '', timings.cache)
+    if response.status_code != 200:
+        return
+
+    for name, duration in timings.phases.items():
+        search_phase_seconds.observe(duration, name)
+    search_phase_seconds.observe(total, 'total')
+    if timings.es_took is not None:
+        search_es_took_seconds.observe(timings.es_took)
+    if timings.total_hits is not None:
+        search_total_hits.observe(timings.total_hits)
+
+    if total * 1000 >= settings.PRODUCT_SEARCH_METRICS["SLOW_QUERY_MS"]:
+        search_slow_queries.inc()
+        logger.warning(
+            "Slow product search %.0fms query=%r tier=%s cache=%s hits=%s phases=%s",
+            total * 1000, timings.query, timings.tier, timings.cache, timings.total_hits,
+            {name: round(duration * 1000, 1) for name, duration in timings.phases.items()},
+        )
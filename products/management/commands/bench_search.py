@@ -0,0 +1,213 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from elasticsearch import Elasticsearch
+from elasticsearch_dsl.connections import connections as es_connections
+
+from products.views import ProductDocumentView
+
+
+DEFAULT_CORPUS = Path(settings.BASE_DIR) / 'benchmarks' / 'queries.txt'
+
+EMPTY_RESPONSE = {
+    'took': 0,
+    'timed_out': False,
+    '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+    'hits': {'total': {'value': 0, 'relation': 'eq'}, 'max_score': None, 'hits': []},
+}
+
+
+def request_key(index, body):
+    raw = json.dumps({'index': index, 'body': body}, sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+class RecordedClient:
+    """
+    Stand-in for the Elasticsearch client that answers from a recording made with --record.
+    Requests that were never recorded get an empty result, so the Django side can still be measured.
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            self.responses = json.load(f)
+        self.misses = 0
+
+    def search(self, body=None, index=None, **kwargs):
+        response = self.responses.get(request_key(index, body))
+        if response is None:
+            self.misses += 1
+            return dict(EMPTY_RESPONSE)
+        return response
+
+
+class InstrumentedClient:
+    """
+    Wraps a client (live or recorded) and records, per thread, the ES-reported `took`
+    and the wall-clock round trip of every search. Optionally keeps the raw responses.
+    """
+    def __init__(self, client, record=False):
+        self.client = client
+        self.recording = {} if record else None
+        self.local = threading.local()
+
+    def reset(self):
+        self.local.took = 0
+        self.local.round_trip = 0.0
+
+    def search(self, body=None, index=None, **kwargs):
+        started = time.perf_counter()
+        response = self.client.search(body=body, index=index, **kwargs)
+        self.local.round_trip += time.perf_counter() - started
+        self.local.took += response.get('took', 0)
+
+        if self.recording is not None:
+            self.recording[request_key(index, body)] = response
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(values)) - 1)
+    return values[rank]
+
+
+class Command(BaseCommand):
+    help = '⏱️ Replay a query corpus against ProductDocumentView and report latency percentiles and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help='File with one query per line')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of parallel clients')
+        parser.add_argument('--repeat', type=int, default=5, help='How many times the corpus is replayed')
+        parser.add_argument('--warmup', type=int, default=1, help='Unmeasured passes over the corpus before the run')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--backend', choices=['live', 'recorded'], default='live',
+                            help='live: send queries to Elasticsearch; recorded: replay responses from --responses')
+        parser.add_argument('--es-host', help='Elasticsearch URL for the live backend (default: ELASTICSEARCH_DSL)')
+        parser.add_argument('--responses', help='Recorded responses file for the recorded backend')
+        parser.add_argument('--record', help='Live backend only: save every ES response to this file for later replay')
+        parser.add_argument('--with-cache', action='store_true', help='Keep the search result cache enabled')
+        parser.add_argument('--json', dest='json_path', help='Also write the report as JSON to this file')
+
+    def handle(self, *args, **options):
+        queries = self.load_corpus(options['corpus'])
+        previous_client = es_connections.get_connection()
+        client = InstrumentedClient(self.get_client(options), record=bool(options['record']))
+        es_connections.add_connection('default', client)
+        try:
+            results, wall_time = self.run_workload(client, queries, options)
+        finally:
+            es_connections.add_connection('default', previous_client)
+
+        report = self.build_report(results, wall_time, options)
+        self.print_report(report)
+
+        if options['record']:
+            with open(options['record'], 'w') as f:
+                json.dump(client.recording, f, ensure_ascii=False)
+            self.stdout.write(f"💾 Recorded {len(client.recording)} responses to {options['record']}")
+        if options['json_path']:
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def run_workload(self, client, queries, options):
+        """Replay the corpus through the view; returns (status, end-to-end, ES took, ES round trip) per request."""
+        view = ProductDocumentView.as_view(
+            {'get': 'list'}, use_result_cache=options['with_cache'], record_queries=False, throttle_classes=[],
+        )
+        factory = RequestFactory()
+
+        def run_query(query):
+            client.reset()
+            request = factory.get('/api/products/', {'search': query, 'page_size': options['page_size']})
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            elapsed = time.perf_counter() - started
+            return response.status_code, elapsed, client.local.took / 1000, client.local.round_trip
+
+        for _ in range(options['warmup']):
+            with ThreadPoolExecutor(options['concurrency']) as executor:
+                list(executor.map(run_query, queries))
+
+        workload = queries * options['repeat']
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(run_query, workload))
+        wall_time = time.perf_counter() - started
+        return results, wall_time
+
+    def load_corpus(self, path):
+        try:
+            with open(path) as f:
+                queries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        except OSError as e:
+            raise CommandError(f"Cannot read corpus {path}: {e}")
+        if not queries:
+            raise CommandError(f"Corpus {path} has no queries")
+        return queries
+
+    def get_client(self, options):
+        if options['backend'] == 'recorded':
+            if not options['responses']:
+                raise CommandError("--responses is required with --backend recorded")
+            if options['record']:
+                raise CommandError("--record only makes sense with the live backend")
+            return RecordedClient(options['responses'])
+
+        if options['es_host']:
+            return Elasticsearch(options['es_host'])
+        return es_connections.get_connection()
+
+    def build_report(self, results, wall_time, options):
+        def stats(values):
+            values = sorted(values)
+            return {
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': (values[-1] if values else 0) * 1000,
+            }
+
+        ok = [result for result in results if result[0] == 200]
+        return {
+            'backend': options['backend'],
+            'concurrency': options['concurrency'],
+            'requests': len(results),
+            'errors': len(results) - len(ok),
+            'throughput_rps': len(results) / wall_time if wall_time else 0.0,
+            'end_to_end': stats([elapsed for _, elapsed, _, _ in ok]),
+            'es_took': stats([took for _, _, took, _ in ok]),
+            'es_round_trip': stats([round_trip for _, _, _, round_trip in ok]),
+            'django_overhead': stats([elapsed - round_trip for _, elapsed, _, round_trip in ok]),
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\n📊 {report['requests']:,} requests ({report['errors']} errors), "
+            f"concurrency {report['concurrency']}, backend {report['backend']}"
+        )
+        self.stdout.write(f"🚀 Throughput: {report['throughput_rps']:.1f} req/s\n")
+        self.stdout.write(f"{'':<18}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+        for label, key in (
+            ('end-to-end', 'end_to_end'),
+            ('ES took', 'es_took'),
+            ('ES round trip', 'es_round_trip'),
+            ('Django overhead', 'django_overhead'),
+        ):
+            row = report[key]
+            self.stdout.write(
+                f"{label:<18}{row['p50_ms']:>8.1f}ms{row['p95_ms']:>8.1f}ms{row['p99_ms']:>8.1f}ms{row['max_ms']:>8.1f}ms"
+            )
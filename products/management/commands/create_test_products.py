@@ -1,38 +1,72 @@
 import csv
+import io
 import random
-import tempfile
-import os
 import multiprocessing
 from django.core.management.base import BaseCommand
 from faker import Faker
-from django.db import connection
+from django.db import connection, connections
+
+from products.models import Product
 
 
 fixed_time = '2025-07-09 12:00:00'
 
-def generate_csv(start_idx, count, file_path):
+TABLE = Product._meta.db_table
+
+COPY_SQL = f"""
+    COPY {TABLE}
+        (title, description, cached_tags, is_published, is_deleted, created_at, updated_at)
+    FROM STDIN WITH (FORMAT CSV)
+"""
+
+
+def generate_rows(fake, count):
+    for _ in range(count):
+        title = " ".join(fake.words(nb=random.randint(1, 2))).title()
+        description = " ".join(fake.sentences(nb=3)).replace('\n', ' ')
+        tag = fake.word()
+        yield [title, description, tag, 't', 'f', fixed_time, fixed_time]
+
+
+class CSVRowStream:
+    """
+    Read-only file-like object for `copy_expert`: rows are rendered as CSV only when
+    COPY asks for more data, so generation and loading overlap and memory stays flat.
+    """
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def read(self, size=-1):
+        while size < 0 or self.buffer.tell() < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.writer.writerow(row)
+
+        data = self.buffer.getvalue()
+        if size < 0:
+            size = len(data)
+
+        self.buffer = io.StringIO(data[size:])
+        self.buffer.seek(0, io.SEEK_END)
+        self.writer = csv.writer(self.buffer)
+        return data[:size]
+
+
+def copy_products(args):
+    """Worker: generate `count` products and COPY them in batches over this process's own connection."""
+    count, batch_size = args
     fake = Faker('fa_IR')
-    with open(file_path, 'w', newline='') as f:
-        writer = csv.writer(f)
-        for _ in range(count):
-            title = " ".join(fake.words(nb=random.randint(1, 2))).title()
-            description = " ".join(fake.sentences(nb=3)).replace('\n', ' ')
-            tag = fake.word()
-            writer.writerow([title, description, tag, 't', 'f', fixed_time, fixed_time])
 
+    with connection.cursor() as cursor:
+        for offset in range(0, count, batch_size):
+            rows = generate_rows(fake, min(batch_size, count - offset))
+            cursor.copy_expert(COPY_SQL, CSVRowStream(rows))
 
-def import_csv_to_db(file_path):
-    with open(file_path, 'r') as f:
-        with connection.cursor() as cursor:
-            cursor.copy_expert(
-                """
-                COPY products_product
-                    (title, description, cached_tags, is_published, is_deleted, created_at, updated_at)
-                FROM STDIN WITH (FORMAT CSV)
-                """,
-                f
-            )
-    os.remove(file_path)
+    connection.close()
+    return count
 
 
 class Command(BaseCommand):
@@ -40,26 +74,76 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('count', type=int, help='Total number of products to generate (e.g. 4000000)')
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='Number of generating/loading processes')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Rows per COPY statement (one transaction each)')
+        parser.add_argument(
+            '--disable-indexes', action='store_true',
+            help='Drop secondary indexes and constraints during the load and rebuild them afterwards'
+        )
 
     def handle(self, *args, **options):
         total = options['count']
-        cpu_count = multiprocessing.cpu_count()
-        chunk_size = total // cpu_count
-        self.stdout.write(f"⚙️ Detected {cpu_count} CPU cores. Generating {total:,} products in {cpu_count} parallel chunks...")
+        workers = max(1, min(options['workers'], total))
+        batch_size = options['batch_size']
 
-        tmp_files = [tempfile.NamedTemporaryFile(delete=False, suffix=f'_chunk_{i}.csv') for i in range(cpu_count)]
-        paths = [f.name for f in tmp_files]
-        for f in tmp_files:
-            f.close()
+        # Spread the remainder over the first workers so no rows are dropped
+        base, remainder = divmod(total, workers)
+        counts = [base + (1 if i < remainder else 0) for i in range(workers)]
+        self.stdout.write(f"⚙️ Generating and loading {total:,} products with {workers} parallel COPY streams...")
 
-        with multiprocessing.Pool(cpu_count) as pool:
-            pool.starmap(generate_csv, [(i, chunk_size, path) for i, path in enumerate(paths)])
+        dropped = self.drop_indexes() if options['disable_indexes'] else None
+        inserted = 0
+        try:
+            # Forked workers must open their own database connections
+            connections.close_all()
+            with multiprocessing.Pool(workers) as pool:
+                for count in pool.imap_unordered(copy_products, [(count, batch_size) for count in counts if count]):
+                    inserted += count
+                    self.stdout.write(f"  ✅ {inserted:,} / {total:,} rows loaded")
+        finally:
+            if dropped is not None:
+                self.restore_indexes(*dropped)
 
-        self.stdout.write("✅ CSV generation completed. Now importing into database...")
-
-        for path in paths:
-            import_csv_to_db(path)
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {TABLE}")
 
         self.stdout.write(self.style.SUCCESS(
-            f"🎉 Successfully inserted {total:,} Persian products using parallel COPY across {cpu_count} cores!"
+            f"🎉 Successfully inserted {inserted:,} Persian products using parallel COPY across {workers} processes!"
         ))
+
+    def drop_indexes(self):
+        """Drop every constraint except the primary key, then every remaining secondary index."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+                WHERE conrelid = %s::regclass AND contype <> 'p'
+                """,
+                [TABLE]
+            )
+            constraints = cursor.fetchall()
+            for name, _ in constraints:
+                cursor.execute(f'ALTER TABLE {TABLE} DROP CONSTRAINT "{name}"')
+
+            cursor.execute(
+                """
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE tablename = %s
+                  AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+                """,
+                [TABLE, TABLE]
+            )
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}"')
+
+        self.stdout.write(f"🔧 Dropped {len(indexes)} indexes and {len(constraints)} constraints for the load")
+        return constraints, indexes
+
+    def restore_indexes(self, constraints, indexes):
+        self.stdout.write("🔧 Rebuilding indexes and constraints...")
+        with connection.cursor() as cursor:
+            for _, definition in indexes:
+                cursor.execute(definition)
+            for name, definition in constraints:
+                cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
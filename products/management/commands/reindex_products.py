@@ -0,0 +1,183 @@
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Max, Min
+from django.utils import timezone
+from elasticsearch.helpers import bulk
+from elasticsearch_dsl.connections import connections as es_connections
+
+from products.documents import ProductDocument
+from products.indexing import IndexWatermark, sync_products
+from products.models import Product
+from products.search_cache import SearchResultCache
+
+
+CHECKPOINT_KEY = 'products:reindex:run'
+
+
+def init_worker():
+    # Each forked worker gets its own Elasticsearch client instead of sharing the parent's sockets
+    es_connections.create_connection('default', **settings.ELASTICSEARCH_DSL['default'])
+
+
+def index_range(args):
+    """Index the published products with start <= id < end into `index_name`."""
+    index_name, start, end, batch_size = args
+    document = ProductDocument()
+
+    products = Product.objects.published().filter(id__gte=start, id__lt=end).order_by('id')
+    actions = (
+        {'_index': index_name, '_id': product.pk, '_source': document.prepare(product)}
+        for product in products.iterator(chunk_size=batch_size)  # server-side cursor on PostgreSQL
+    )
+    indexed, _ = bulk(
+        es_connections.get_connection(),
+        actions,
+        chunk_size=batch_size,
+        refresh=False,
+        request_timeout=120,
+    )
+    return start, indexed
+
+
+class Command(BaseCommand):
+    help = '🔁 Zero-downtime reindex: fill a new versioned index in parallel, then atomically swap the products alias'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='Number of indexing processes')
+        parser.add_argument('--range-size', type=int, default=50000, help='Ids per work unit; each finished unit is checkpointed')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Documents per _bulk request')
+        parser.add_argument('--resume', action='store_true', help='Continue the last unfinished run from its checkpoints')
+        parser.add_argument('--keep-old', action='store_true', help='Keep the previous indices after the alias swap')
+
+    def handle(self, *args, **options):
+        client = es_connections.get_connection()
+        alias = ProductDocument._index._name
+
+        run = self.start_run(client, options)
+        index_name = run['index']
+
+        indexed_total = 0
+        if not run.get('swapped'):
+            indexed_total = self.fill_index(run, options)
+            self.finish_index(client, index_name)
+            run['old_indices'] = self.swap_alias(client, alias, index_name)
+            # The alias now serves index_name: a resumed run must neither swap again nor delete it
+            run['swapped'] = True
+            cache.set(CHECKPOINT_KEY, run, timeout=None)
+
+        self.catch_up(run['started_at'])
+
+        if run['old_indices'] and not options['keep_old']:
+            client.indices.delete(index=','.join(run['old_indices']), ignore=(404,))
+
+        cache.delete(CHECKPOINT_KEY)
+        # Everything older than the run is in the new index; the delta sync takes over from here
+        IndexWatermark.set(run['started_at'])
+        SearchResultCache.bump_generation()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"🎉 {alias} now points to {index_name} ({indexed_total:,} documents indexed in this run)"
+        ))
+
+    def fill_index(self, run, options):
+        """Index the id ranges the run has not done yet, checkpointing each one; returns the documents indexed."""
+        index_name = run['index']
+        bounds = Product.objects.published().aggregate(min_id=Min('id'), max_id=Max('id'))
+        ranges = []
+        if bounds['min_id'] is not None:
+            for start in range(bounds['min_id'], bounds['max_id'] + 1, run['range_size']):
+                if start not in run['done']:
+                    ranges.append((index_name, start, start + run['range_size'], options['batch_size']))
+
+        self.stdout.write(
+            f"⚙️ Indexing into {index_name}: {len(ranges)} id ranges left, {len(run['done'])} already done, "
+            f"{options['workers']} workers"
+        )
+
+        # Forked workers must open their own database connections
+        connections.close_all()
+        indexed_total = 0
+        with multiprocessing.Pool(options['workers'], initializer=init_worker) as pool:
+            for start, indexed in pool.imap_unordered(index_range, ranges):
+                run['done'].add(start)
+                cache.set(CHECKPOINT_KEY, run, timeout=None)
+                indexed_total += indexed
+                self.stdout.write(f"  ✅ ids {start:,}+ → {indexed:,} documents ({len(run['done'])} ranges done)")
+        return indexed_total
+
+    def start_run(self, client, options):
+        """Return the run to work on: the checkpointed one with --resume, otherwise a fresh index."""
+        run = cache.get(CHECKPOINT_KEY)
+
+        if run and options['resume'] and client.indices.exists(index=run['index']):
+            self.stdout.write(f"↩️ Resuming {run['index']} started at {run['started_at']:%Y-%m-%d %H:%M:%S}")
+            return run
+
+        if run and run.get('swapped'):
+            # Swapped in but not cleaned up: its index is live, the next swap moves the alias off it
+            self.stdout.write(self.style.WARNING(
+                f"⚠️ {run['index']} is live; indices it replaced were not deleted: {', '.join(run['old_indices']) or '-'}"
+            ))
+        elif run and client.indices.exists(index=run['index']):
+            # An abandoned run that was never swapped in; its index is dead weight
+            client.indices.delete(index=run['index'])
+
+        run = {
+            'index': f"{ProductDocument._index._name}_v{int(time.time())}",
+            'range_size': options['range_size'],
+            'started_at': timezone.now(),
+            'done': set(),
+        }
+
+        index = ProductDocument._index.clone(name=run['index'])
+        # Bulk loading is much cheaper without refreshes and replica copies
+        index.settings(refresh_interval='-1', number_of_replicas=0)
+        index.create(using=client)
+
+        cache.set(CHECKPOINT_KEY, run, timeout=None)
+        return run
+
+    def finish_index(self, client, index_name):
+        """Restore the regular refresh/replica settings and make everything searchable."""
+        live_settings = ProductDocument._index._settings
+        client.indices.put_settings(index=index_name, body={
+            'index': {
+                'refresh_interval': live_settings['refresh_interval'],
+                'number_of_replicas': live_settings['number_of_replicas'],
+            }
+        })
+        client.indices.refresh(index=index_name)
+
+    def swap_alias(self, client, alias, index_name):
+        """Point `alias` at `index_name` in a single atomic update; returns the indices it left."""
+        actions = []
+        old_indices = []
+
+        if client.indices.exists_alias(name=alias):
+            old_indices = [name for name in client.indices.get_alias(name=alias) if name != index_name]
+            actions += [{'remove': {'index': name, 'alias': alias}} for name in old_indices]
+        elif client.indices.exists(index=alias):
+            # A concrete index still carries the alias name (built by `search_index --rebuild`)
+            actions.append({'remove_index': {'index': alias}})
+
+        actions.append({'add': {'index': index_name, 'alias': alias}})
+        client.indices.update_aliases(body={'actions': actions})
+        return old_indices
+
+    def catch_up(self, started_at):
+        """Re-sync products saved while the run was in progress; they may have hit only the old index."""
+        batch_size = 1000
+        changed_ids = Product.objects.filter(updated_at__gte=started_at).values_list('id', flat=True).iterator()
+
+        batch = []
+        for product_id in changed_ids:
+            batch.append(product_id)
+            if len(batch) >= batch_size:
+                sync_products(batch)
+                batch = []
+        sync_products(batch)
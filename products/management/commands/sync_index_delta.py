@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from products.indexing import IndexWatermark, sync_index_delta
+
+
+class Command(BaseCommand):
+    help = '🔄 Push products changed since the last watermark (Product.updated_at) to the search index'
+
+    def handle(self, *args, **options):
+        watermark = IndexWatermark.get()
+        if watermark is None:
+            self.stdout.write("⚠️ No watermark recorded yet, syncing the whole catalog...")
+        else:
+            self.stdout.write(f"⚙️ Syncing products changed after {watermark[0]:%Y-%m-%d %H:%M:%S} (id {watermark[1]})...")
+
+        synced = sync_index_delta()
+        if synced is None:
+            self.stdout.write(self.style.WARNING("⏳ Another index sync is already running."))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"🎉 Synced {synced:,} changed products."))
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from products.query_log import QueryLog
+from products.views import ProductDocumentView
+
+
+class Command(BaseCommand):
+    help = '🔥 Replay the most popular searches to fill the result cache and warm Elasticsearch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=settings.PRODUCT_SEARCH_WARMUP["TOP_QUERIES"],
+            help='How many of the most popular queries to replay'
+        )
+
+    def handle(self, *args, **options):
+        queries = QueryLog.top(options['top'])
+        if not queries:
+            self.stdout.write("ℹ️ The query log is empty, nothing to warm.")
+            return
+
+        self.stdout.write(f"⚙️ Warming {len(queries)} queries...")
+        # Going through the view builds exactly the query, cache key and payload real requests use;
+        # a cache miss also pulls the index files the query touches into the OS page cache
+        view = ProductDocumentView.as_view({'get': 'list'}, record_queries=False, throttle_classes=[])
+        factory = RequestFactory()
+
+        failed = 0
+        for query in queries:
+            response = view(factory.get('/api/products/', {'search': query}))
+            if response.status_code != 200:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"  ⚠️ {query!r} → HTTP {response.status_code}"))
+
+        self.stdout.write(self.style.SUCCESS(f"🎉 Warmed {len(queries) - failed} of {len(queries)} queries"))
@@ -40,5 +40,11 @@ class Product(models.Model):
     
     objects = ProductManager()
 
+    class Meta:
+        indexes = [
+            # Keyset order of the incremental index sync
+            models.Index(fields=['updated_at', 'id']),
+        ]
+
     def __str__(self):
         return self.title
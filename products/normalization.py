@@ -0,0 +1,77 @@
+"""
+Query-side mirror of the `rebuilt_persian` analyzer (see products/documents.py).
+
+Spelling variants of the same query ("گوشي" with Arabic yeh, ZWNJ-joined words, Persian or
+Arabic-Indic digits, ...) collapse into one canonical string before they reach the filter
+backend or the result cache. Stemming is left to Elasticsearch.
+"""
+
+# zero_width_spaces char_filter (plus the other invisible joiners users paste in)
+ZERO_WIDTH_CHARS = {
+    '\u200c': ' ',  # ZWNJ
+    '\u200b': ' ',  # ZWSP
+    '\u200d': '',   # ZWJ
+    '\ufeff': '',   # BOM
+}
+
+# decimal_digit
+DIGITS = {
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # Persian
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # Arabic-Indic
+}
+
+# arabic_normalization / persian_normalization, folded to the Persian letter forms
+LETTERS = {
+    '\u064a': '\u06cc',  # Arabic yeh -> Farsi yeh
+    '\u0649': '\u06cc',  # alef maksura -> Farsi yeh
+    '\u06d2': '\u06cc',  # yeh barree -> Farsi yeh
+    '\u0643': '\u06a9',  # Arabic kaf -> keheh
+    '\u0629': '\u0647',  # teh marbuta -> heh
+    '\u06c0': '\u0647',  # heh with yeh above -> heh
+    '\u06c1': '\u0647',  # heh goal -> heh
+    '\u0622': '\u0627',  # alef with madda -> alef
+    '\u0623': '\u0627',  # alef with hamza above -> alef
+    '\u0625': '\u0627',  # alef with hamza below -> alef
+    '\u0671': '\u0627',  # alef wasla -> alef
+}
+
+# Tatweel, harakat and hamza above are dropped entirely
+REMOVED = ['\u0640', '\u0654', *(chr(c) for c in range(0x064B, 0x0653))]
+
+TRANSLATION_TABLE = str.maketrans({
+    **ZERO_WIDTH_CHARS,
+    **DIGITS,
+    **LETTERS,
+    **{char: None for char in REMOVED},
+})
+
+# Most frequent entries of Lucene's `_persian_` stop list
+PERSIAN_STOPWORDS = frozenset(word.translate(TRANSLATION_TABLE) for word in (
+    'و', 'در', 'به', 'از', 'که', 'این', 'را', 'با', 'است', 'برای', 'آن', 'یک', 'تا', 'ها',
+    'های', 'هم', 'بر', 'نیز', 'اما', 'یا', 'اگر', 'ای', 'شود', 'شد', 'شده', 'بود', 'کرد',
+    'کند', 'باید', 'می', 'ما', 'من', 'تو', 'او', 'آنها', 'اینکه', 'چه', 'همه', 'دیگر',
+    'پس', 'هر', 'بی', 'بین', 'روی', 'زیر', 'پیش', 'پیشین', 'خود', 'وی', 'ولی', 'چون',
+))
+
+def fold_characters(text):
+    """
+    Apply the analyzer's character folding, lowercase and collapse whitespace.
+    Safe for half-typed prefixes, since no token is dropped.
+    """
+    if not text:
+        return ''
+
+    return ' '.join(text.translate(TRANSLATION_TABLE).lower().split())
+
+
+def normalize_query(query):
+    """
+    Return the canonical form of a search query.
+
+    Characters are folded like the analyzer folds them, whitespace is collapsed and
+    stopwords are dropped unless the query consists of nothing else.
+    """
+    tokens = fold_characters(query).split()
+    meaningful = [token for token in tokens if token not in PERSIAN_STOPWORDS]
+
+    return ' '.join(meaningful or tokens)
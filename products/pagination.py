@@ -1,66 +1,293 @@
+import base64
+from collections import namedtuple
+
+import orjson
+from django.conf import settings
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl.connections import get_connection
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import BasePagination
 from rest_framework.response import Response
 
+from .connections import get_async_client, search_breaker
+
+# `search_after` values, the search tier they belong to and, in consistent mode, the point in time
+Cursor = namedtuple('Cursor', ['search_after', 'tier', 'pit_id'])
+
+PIT_CURSOR_PREFIX = 'pit.'
+
+
+def search_params(search):
+    """Request parameters for `search`, with the per-query time budget from PRODUCT_SEARCH."""
+    return {
+        'request_timeout': settings.PRODUCT_SEARCH["REQUEST_TIMEOUT_SECONDS"],
+        **search._params,
+    }
+
+
+def search_body(search):
+    return {'timeout': settings.PRODUCT_SEARCH["TIMEOUT"], **search.to_dict()}
+
+
+def execute_raw(search, pit=None):
+    """
+    Run an elasticsearch_dsl Search and return the raw response dict, skipping the
+    Response/Hit/AttrDict wrapping that `Search.execute()` builds for every hit.
+    With `pit` ({'id': ..., 'keep_alive': ...}) it searches that point in time instead of the indices.
+    """
+    es = get_connection(search._using)
+    index, body = search_target(search, pit)
+    with search_breaker.guard():
+        return es.search(index=index, body=body, **search_params(search))
+
+
+async def aexecute_raw(search, pit=None):
+    """execute_raw() on the event loop's shared AsyncElasticsearch client."""
+    es = get_async_client()
+    index, body = search_target(search, pit)
+    with search_breaker.guard():
+        return await es.search(index=index, body=body, **search_params(search))
+
+
+def search_target(search, pit):
+    body = search_body(search)
+    if pit is None:
+        return search._index, body
+    # A point in time already names its indices; the request must not repeat them
+    return None, {**body, 'pit': pit}
+
+
+def open_point_in_time(search, keep_alive):
+    es = get_connection(search._using)
+    with search_breaker.guard():
+        return es.open_point_in_time(index=search._index, keep_alive=keep_alive)['id']
+
+
+async def aopen_point_in_time(search, keep_alive):
+    es = get_async_client()
+    with search_breaker.guard():
+        return (await es.open_point_in_time(index=search._index, keep_alive=keep_alive))['id']
+
+
+def close_point_in_time(search, pit_id):
+    get_connection(search._using).close_point_in_time(body={'id': pit_id}, ignore=(404,))
+
+
+async def aclose_point_in_time(pit_id):
+    await get_async_client().close_point_in_time(body={'id': pit_id}, ignore=(404,))
+
+
+def parse_search_after(raw):
+    """
+    Parse a `search_after` cursor: either "<score>,<id>[,<tier>]" or an opaque point-in-time
+    cursor produced in consistent mode.
+    Returns a Cursor, or None when the cursor is missing or malformed.
+    """
+    if not raw:
+        return None
+
+    if raw.startswith(PIT_CURSOR_PREFIX):
+        return decode_pit_cursor(raw[len(PIT_CURSOR_PREFIX):])
+
+    parts = raw.split(',')
+    if len(parts) not in (2, 3):
+        return None
+
+    try:
+        score = float(parts[0])
+    except ValueError:
+        return None
+
+    tier = parts[2] if len(parts) == 3 else None
+    return Cursor([score, parts[1]], tier, None)
+
+
+def encode_pit_cursor(pit_id, sort, tier):
+    data = orjson.dumps({'pit': pit_id, 'sort': sort, 'tier': tier})
+    return PIT_CURSOR_PREFIX + base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_pit_cursor(token):
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return Cursor(list(data['sort']), data['tier'], data['pit'])
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
 class SearchAfterRelevancePagination(BasePagination):
     """
     Pages through Elasticsearch Search results ordered by relevance (_score) and id as tie-breaker.
-    Reads `page_size` and `search_after` from query params.
+    Reads `page_size` and `search_after` from query params. The page is a list of raw hit dicts.
+
+    When the filter backend leaves a `fallback_search` on the view (tiered search), the first
+    page falls back to it if the primary search matches too few documents.
+
+    With `consistent=true` on the first page the search runs against a point in time, and
+    `next_search_after` becomes an opaque cursor carrying the point in time, the sort values
+    (with the `_shard_doc` tiebreaker) and the tier. Every later page then reads the same
+    snapshot, so refreshes and reindexing can neither duplicate nor skip hits. The point in
+    time is kept alive for PIT_KEEP_ALIVE per page and closed after the last one. Only
+    authenticated clients get consistent mode, so anonymous traffic can't open points in time.
     """
     default_page_size = 20
     max_page_size = 100
     page_size_query_param = 'page_size'
     search_after_param = 'search_after'
+    consistent_param = 'consistent'
 
-    def paginate_queryset(self, search, request, view=None):
+    def get_page_size(self, request):
         """
-        `search` is an instance of elasticsearch_dsl.Search
+        Read page_size from query params, enforce limits
         """
-        self.request = request
-
-        # Read page_size from query params, enforce limits
         try:
-            self.page_size = min(
+            return min(
                 int(request.query_params.get(self.page_size_query_param, self.default_page_size)),
                 self.max_page_size
             )
         except (ValueError, TypeError):
-            self.page_size = self.default_page_size
-
-        # Apply sort: first by _score desc, then by id asc for stable ordering
-        search = search.sort(
-            {'_score': {'order': 'desc'}},
-            {'id': {'order': 'asc'}}
-        )
-
-        # Parse search_after if provided
-        raw = request.query_params.get(self.search_after_param)
-        if raw:
-            # Expect raw like "<score>,<id>"
-            score_str, id_str = raw.split(',')
-            try:
-                score = float(score_str)
-            except ValueError:
-                score = None
-            if score is not None:
-                search = search.extra(search_after=[score, id_str])
+            return self.default_page_size
 
-        # Retrieve one extra record to detect next page
-        response = search[0:self.page_size + 1].execute()
-        hits = response.hits
+    def wants_point_in_time(self, request):
+        cursor = parse_search_after(request.query_params.get(self.search_after_param))
+        if cursor is not None:
+            return cursor.pit_id is not None
+        if not request.user.is_authenticated:
+            # Every first page would hold a search context open on the cluster
+            return False
+        return request.query_params.get(self.consistent_param, '').lower() in ('1', 'true', 'yes')
+
+    def paginate_queryset(self, search, request, view=None):
+        """
+        `search` is an instance of elasticsearch_dsl.Search
+        """
+        self.start(request, view)
+        if self.consistent and self.pit_id is None:
+            self.pit_id = open_point_in_time(search, self.keep_alive)
+
+        response = self.execute(search)
+
+        fallback = self.get_fallback(response, view)
+        if fallback is not None:
+            response = self.execute(fallback)
+
+        page = self.finish(response)
+        if self.consistent and not self.has_next():
+            close_point_in_time(search, self.pit_id)
+        return page
+
+    async def apaginate_queryset(self, search, request, view=None):
+        """Same as paginate_queryset, with the searches awaited on the AsyncElasticsearch client."""
+        self.start(request, view)
+        if self.consistent and self.pit_id is None:
+            self.pit_id = await aopen_point_in_time(search, self.keep_alive)
+
+        response = await self.aexecute(search)
+
+        fallback = self.get_fallback(response, view)
+        if fallback is not None:
+            response = await self.aexecute(fallback)
+
+        page = self.finish(response)
+        if self.consistent and not self.has_next():
+            await aclose_point_in_time(self.pit_id)
+        return page
 
-        # Store hits for building next pointer
-        self.hits = hits
+    def start(self, request, view):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.cursor = parse_search_after(request.query_params.get(self.search_after_param))
+        self.consistent = self.wants_point_in_time(request)
+        self.pit_id = self.cursor.pit_id if self.cursor is not None else None
+        self.keep_alive = settings.PRODUCT_SEARCH["PIT_KEEP_ALIVE"] if self.consistent else None
+        self.search_tier = getattr(view, 'search_tier', None)
+        self.took = 0
+        self.timed_out = False
+
+    def get_fallback(self, response, view):
+        """The search to run instead when the view's fallback applies to this response, else None."""
+        fallback = getattr(view, 'fallback_search', None)
+        if fallback is not None and response['hits']['total']['value'] < fallback.min_hits:
+            self.search_tier = fallback.tier
+            return fallback.search
+        return None
+
+    def finish(self, response):
+        self.total_hits = response['hits']['total']['value']
+
+        # Store raw hits for building next pointer
+        self.hits = response['hits']['hits']
         # Return only the requested page size
-        return hits[:self.page_size]
+        return self.hits[:self.page_size]
+
+    def has_next(self):
+        # One extra hit is fetched to detect the next page
+        return len(self.hits) > self.page_size
+
+    def prepare(self, search):
+        # Apply sort: first by _score desc, then a unique tiebreaker for stable ordering
+        tiebreaker = {'_shard_doc': {'order': 'asc'}} if self.consistent else {'id': {'order': 'asc'}}
+        search = search.sort({'_score': {'order': 'desc'}}, tiebreaker)
+
+        if self.cursor is not None:
+            search = search.extra(search_after=self.cursor.search_after)
+
+        # Retrieve one extra record to detect next page
+        return search[0:self.page_size + 1]
+
+    def get_pit(self):
+        if self.pit_id is None:
+            return None
+        return {'id': self.pit_id, 'keep_alive': self.keep_alive}
+
+    def execute(self, search):
+        try:
+            return self.record(execute_raw(self.prepare(search), pit=self.get_pit()))
+        except NotFoundError:
+            self.raise_if_expired()
+            raise
+
+    async def aexecute(self, search):
+        try:
+            return self.record(await aexecute_raw(self.prepare(search), pit=self.get_pit()))
+        except NotFoundError:
+            self.raise_if_expired()
+            raise
+
+    def raise_if_expired(self):
+        if self.pit_id is not None:
+            raise ValidationError({
+                self.search_after_param: 'This cursor has expired, start again from the first page.'
+            })
+
+    def record(self, response):
+        self.took += response['took']
+        # Shards that ran out of the PRODUCT_SEARCH["TIMEOUT"] budget return partial hits
+        self.timed_out = self.timed_out or response.get('timed_out', False)
+        # Elasticsearch may hand back a new id for the same point in time
+        self.pit_id = response.get('pit_id', self.pit_id)
+        return response
 
     def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
         next_search_after = None
-        # If more hits than page_size, we have a next page
-        if len(self.hits) > self.page_size:
-            last = self.hits[self.page_size - 1]
-            next_search_after = f"{last.meta.score},{last.id}"
+        if self.has_next():
+            sort = self.hits[self.page_size - 1]['sort']
+            if self.consistent:
+                next_search_after = encode_pit_cursor(self.pit_id, sort, self.search_tier)
+            else:
+                score, product_id = sort
+                next_search_after = f"{score},{product_id}"
+                if self.search_tier:
+                    next_search_after = f"{next_search_after},{self.search_tier}"
 
-        return Response({
+        payload = {
             'next_search_after': next_search_after,
             'results': data
-        })
+        }
+        if self.search_tier:
+            payload['search_tier'] = self.search_tier
+
+        return payload
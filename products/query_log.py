@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryLog:
+    """
+    Popularity of normalized first-page search queries, kept in a Redis sorted set.
+    Searches are counted in process and added to the scores in one pipeline every
+    FLUSH_SECONDS by a background thread, which also trims the set to MAX_TRACKED
+    queries; `decay()` periodically scales all scores down so old traffic fades out.
+    With a cache that has no Redis client (LocMem) searches are not counted.
+    """
+    key = 'products:search:popular_queries'
+    pending = Counter()
+    enabled = False
+    flusher_pid = None
+    lock = threading.Lock()
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    @classmethod
+    def record(cls, query):
+        """Count one search of `query`. No I/O: the count reaches Redis with the next flush."""
+        cls.start_flusher()
+        if cls.enabled:
+            with cls.lock:
+                cls.pending[query] += 1
+
+    @classmethod
+    def start_flusher(cls):
+        """Start this process's flush thread, once per process."""
+        if cls.flusher_pid == os.getpid():
+            return
+
+        with cls.lock:
+            if cls.flusher_pid != os.getpid():
+                # A forked worker must not flush the parent's counts a second time
+                cls.pending = Counter()
+                try:
+                    cls.get_connection()
+                except NotImplementedError:
+                    cls.enabled = False
+                else:
+                    cls.enabled = True
+                    threading.Thread(target=cls.flush_forever, name='query-log-flush', daemon=True).start()
+                cls.flusher_pid = os.getpid()
+
+    @classmethod
+    def flush_forever(cls):
+        while True:
+            time.sleep(settings.PRODUCT_POPULAR_QUERIES["FLUSH_SECONDS"])
+            try:
+                cls.flush()
+            except Exception:
+                logger.warning("Could not flush the popular query counts", exc_info=True)
+
+    @classmethod
+    def flush(cls):
+        """Add the searches counted since the last flush to the scores, then trim the tail."""
+        with cls.lock:
+            pending, cls.pending = cls.pending, Counter()
+        if not pending:
+            return
+
+        pipe = cls.get_connection().pipeline()
+        for query, count in pending.items():
+            pipe.zincrby(cls.key, count, query)
+        pipe.zremrangebyrank(cls.key, 0, -settings.PRODUCT_POPULAR_QUERIES["MAX_TRACKED"] - 1)
+        try:
+            pipe.execute()
+        except Exception:
+            # Keep the counts for the next flush
+            with cls.lock:
+                cls.pending.update(pending)
+            raise
+
+    @classmethod
+    def top(cls, count):
+        """The `count` most popular queries, most popular first."""
+        return [query.decode() for query in cls.get_connection().zrevrange(cls.key, 0, count - 1)]
+
+    @classmethod
+    def decay(cls):
+        """Apply one DECAY_INTERVAL_SECONDS step of the half-life to every score, then trim the tail."""
+        config = settings.PRODUCT_POPULAR_QUERIES
+        factor = 0.5 ** (config["DECAY_INTERVAL_SECONDS"] / config["HALF_LIFE_SECONDS"])
+
+        pipe = cls.get_connection().pipeline()
+        # A one-key ZUNIONSTORE onto itself rescales the whole set atomically
+        pipe.zunionstore(cls.key, {cls.key: factor})
+        pipe.zremrangebyrank(cls.key, 0, -config["MAX_TRACKED"] - 1)
+        pipe.execute()
@@ -0,0 +1,86 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .normalization import normalize_query
+from utils.local_cache import hot_cache
+
+
+class SearchResultCache:
+    """
+    Stores serialized search pages ({next_search_after, results}) in the default cache.
+    Every key embeds the current index generation, so bumping the generation after an
+    index write orphans all cached pages at once; the orphans simply expire via their TTL.
+    A page never changes under its key, so it can be read through the local tier without
+    invalidation; the generation itself is invalidated on every bump.
+    """
+    generation_key = 'products:index_generation'
+    key_prefix = 'products:search'
+
+    @staticmethod
+    def initial_generation():
+        # Time based, so a generation recreated after eviction never reuses an old one
+        return int(time.time() * 1000)
+
+    @classmethod
+    def get_generation(cls):
+        return hot_cache.get_or_set(cls.generation_key, cls.initial_generation, timeout=None)
+
+    @classmethod
+    def bump_generation(cls):
+        try:
+            return hot_cache.incr(cls.generation_key)
+        except ValueError:
+            generation = cls.initial_generation()
+            hot_cache.set(cls.generation_key, generation, timeout=None)
+            return generation
+
+    @classmethod
+    def make_key(cls, query, page_size, search_after=None):
+        raw = f"{normalize_query(query)}|{page_size}|{search_after or ''}"
+        digest = hashlib.md5(raw.encode()).hexdigest()
+        return f"{cls.key_prefix}:{cls.get_generation()}:{digest}"
+
+    @staticmethod
+    def get(key):
+        return hot_cache.get(key)
+
+    @staticmethod
+    def set(key, payload):
+        cache.set(key, payload, timeout=settings.PRODUCT_SEARCH_CACHE["TIMEOUT_SECONDS"])
+
+
+class TopQueryStore:
+    """
+    First pages (default page size) of the most popular queries, rebuilt by the
+    `precompute_top_queries` task. Unlike SearchResultCache entries they are not tied to
+    the index generation, so the head of the traffic keeps being served without
+    Elasticsearch while the index is being written to; they are at most one
+    PRECOMPUTE_INTERVAL_SECONDS stale and expire if the task stops running.
+    """
+    key_prefix = 'products:search:top'
+
+    @classmethod
+    def make_key(cls, query):
+        digest = hashlib.md5(normalize_query(query).encode()).hexdigest()
+        return f"{cls.key_prefix}:{digest}"
+
+    @classmethod
+    def set_many(cls, payloads):
+        """Store {query: first page payload}."""
+        timeout = 2 * settings.PRODUCT_POPULAR_QUERIES["PRECOMPUTE_INTERVAL_SECONDS"]
+        hot_cache.set_many({cls.make_key(query): payload for query, payload in payloads.items()}, timeout=timeout)
+
+
+def lookup_page(cache_key, top_key=None):
+    """
+    Fetch a page from the top-query store (when `top_key` is given) and the result cache
+    in at most one round trip, none when the page that wins is in the local tier.
+    Returns (payload, source) with source 'top', 'hit' or 'miss'.
+    """
+    key, payload = hot_cache.get_first([key for key in (top_key, cache_key) if key])
+    if key is None:
+        return None, 'miss'
+    return payload, 'top' if key == top_key else 'hit'
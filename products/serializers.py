@@ -1,12 +1,36 @@
-from django_elasticsearch_dsl_drf.serializers import DocumentSerializer
-from .documents import ProductDocument
+from django.conf import settings
+from rest_framework import serializers
 from .models import Product
 
 
-class ProductDocumentSerializer(DocumentSerializer):
-    class Meta:
-        document = ProductDocument
-        fields = (
-            'title',
-            'id',
-        )
\ No newline at end of file
+class ProductHitSerializer(serializers.Serializer):
+    """
+    Read-only serializer for raw Elasticsearch hits ({'_score': ..., '_source': {...}}).
+    The declared fields describe the output; values are copied straight from `_source`
+    without per-field machinery or elasticsearch_dsl wrapper objects.
+    """
+    source_fields = ('title', 'id')
+
+    title = serializers.CharField(read_only=True)
+    id = serializers.IntegerField(read_only=True)
+
+    def to_representation(self, hit):
+        source = hit['_source']
+        return {name: source.get(name) for name in self.source_fields}
+
+
+class ProductSuggestQuerySerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=100, trim_whitespace=False)
+    size = serializers.IntegerField(min_value=1, max_value=20, default=5)
+
+
+class ProductExportQuerySerializer(serializers.Serializer):
+    search = serializers.CharField(max_length=200)
+    output = serializers.ChoiceField(choices=['ndjson', 'csv'], default='ndjson')
+    limit = serializers.IntegerField(min_value=1, required=False)
+
+    def validate_limit(self, value):
+        max_results = settings.PRODUCT_SEARCH_EXPORT["MAX_RESULTS"]
+        if value > max_results:
+            raise serializers.ValidationError(f"Ensure this value is less than or equal to {max_results}.")
+        return value
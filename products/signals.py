@@ -1,25 +1,29 @@
+from functools import partial
+
+from django.db import transaction
 from django.db.models.signals import post_save, m2m_changed, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
 from .models import Product
-from .documents import ProductDocument
+from .indexing import enqueue_product_index
 
 
 @receiver(m2m_changed, sender=Product.tags.through)
 def schedule_tag_vector_update(sender, instance, action, **kwargs):
     if action in ['post_add', 'post_remove', 'post_clear']:
         instance.cached_tags = ','.join(instance.tags.names())
-        
-        Product.objects.filter(pk=instance.pk).update(cached_tags=instance.cached_tags)
+
+        # `update()` skips auto_now and post_save: bump updated_at for the incremental
+        # index sync and queue the change explicitly
+        Product.objects.filter(pk=instance.pk).update(cached_tags=instance.cached_tags, updated_at=timezone.now())
+        transaction.on_commit(partial(enqueue_product_index, instance.pk))
 
 
 @receiver(post_save, sender=Product)
 def index_product_if_valid(sender, instance, **kwargs):
-    doc = ProductDocument()
-    if instance.is_published and not instance.is_deleted:
-        doc.update(instance)
-    else:
-        doc.delete(instance)
+    # Only record the id; the worker decides between index and delete when it flushes
+    transaction.on_commit(partial(enqueue_product_index, instance.pk))
 
 @receiver(post_delete, sender=Product)
 def remove_product_from_index(sender, instance, **kwargs):
-    ProductDocument().delete(instance)
\ No newline at end of file
+    transaction.on_commit(partial(enqueue_product_index, instance.pk))
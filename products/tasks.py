@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import cache
+from elasticsearch.exceptions import ConnectionError, TransportError
+
+from core.celery import app
+from .indexing import IndexQueue, sync_index_delta, sync_products
+from .query_log import QueryLog
+from . import top_queries
+
+
+@app.task(bind=True, max_retries=5, default_retry_delay=10)
+def flush_product_index_queue(self):
+    """Drain the index queue in coalesced `_bulk` requests of at most BATCH_SIZE products."""
+    batch_size = settings.PRODUCT_INDEX_QUEUE["BATCH_SIZE"]
+    flushed = 0
+    # Batches that fill up from now on may queue another immediate flush
+    cache.delete(IndexQueue.flush_now_key)
+
+    while True:
+        product_ids = IndexQueue.pop(batch_size)
+        if not product_ids:
+            break
+
+        try:
+            sync_products(product_ids)
+        except Exception as exc:
+            # Put the batch back so the retry (or the next flush) picks it up again
+            IndexQueue.push(product_ids)
+            if isinstance(exc, (ConnectionError, TransportError)):
+                raise self.retry(exc=exc)
+            raise
+
+        flushed += len(product_ids)
+
+    return flushed
+
+
+@app.task
+def sync_product_index_delta():
+    """Periodic repair pass: push products changed since the last watermark."""
+    return sync_index_delta()
+
+
+@app.task
+def decay_popular_queries():
+    QueryLog.decay()
+
+
+@app.task
+def precompute_top_queries():
+    """Serve the head of the query traffic from precomputed first pages."""
+    return top_queries.precompute_top_queries()
@@ -0,0 +1,237 @@
+import csv
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.response import Response
+from unittest.mock import MagicMock, patch
+
+from products.management.commands.bench_search import percentile
+from products.management.commands.create_test_products import CSVRowStream
+from products.management.commands.reindex_products import CHECKPOINT_KEY, Command
+from products.query_log import QueryLog
+from products.search_cache import SearchResultCache
+from products.top_queries import precompute_top_queries
+from utils.local_cache import hot_cache
+
+
+class TestReindexAliasSwap(SimpleTestCase):
+    def setUp(self):
+        self.client = MagicMock()
+        self.command = Command()
+
+    def test_moves_alias_from_previous_versions(self):
+        self.client.indices.exists_alias.return_value = True
+        self.client.indices.get_alias.return_value = {'products_v1': {}}
+
+        old = self.command.swap_alias(self.client, 'products', 'products_v2')
+
+        self.assertEqual(old, ['products_v1'])
+        self.client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove': {'index': 'products_v1', 'alias': 'products'}},
+            {'add': {'index': 'products_v2', 'alias': 'products'}},
+        ]})
+
+    def test_replaces_concrete_index_in_the_same_request(self):
+        self.client.indices.exists_alias.return_value = False
+        self.client.indices.exists.return_value = True
+
+        old = self.command.swap_alias(self.client, 'products', 'products_v2')
+
+        self.assertEqual(old, [])
+        self.client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'remove_index': {'index': 'products'}},
+            {'add': {'index': 'products_v2', 'alias': 'products'}},
+        ]})
+
+    def test_first_run_only_adds_alias(self):
+        self.client.indices.exists_alias.return_value = False
+        self.client.indices.exists.return_value = False
+
+        self.command.swap_alias(self.client, 'products', 'products_v2')
+
+        self.client.indices.update_aliases.assert_called_once_with(body={'actions': [
+            {'add': {'index': 'products_v2', 'alias': 'products'}},
+        ]})
+
+
+    def test_target_index_is_never_reported_as_old(self):
+        self.client.indices.exists_alias.return_value = True
+        self.client.indices.get_alias.return_value = {'products_v2': {}}
+
+        self.assertEqual(self.command.swap_alias(self.client, 'products', 'products_v2'), [])
+
+
+class TestReindexResume(TestCase):
+    def setUp(self):
+        cache.clear()
+        hot_cache.clear_local()
+        self.client = MagicMock()
+        patcher = patch('products.management.commands.reindex_products.es_connections.get_connection',
+                        return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(Command, 'fill_index')
+    @patch.object(Command, 'catch_up', side_effect=[RuntimeError('database went away'), None])
+    def test_resume_after_the_swap_only_finishes_the_clean_up(self, mock_catch_up, mock_fill):
+        mock_fill.return_value = 10
+        self.client.indices.exists_alias.return_value = True
+        self.client.indices.get_alias.return_value = {'products_v1': {}}
+
+        with self.assertRaises(RuntimeError):
+            call_command('reindex_products', workers=1, stdout=io.StringIO())
+        index_name = cache.get(CHECKPOINT_KEY)['index']
+        # The alias now serves the new index
+        self.client.indices.get_alias.return_value = {index_name: {}}
+
+        call_command('reindex_products', workers=1, resume=True, stdout=io.StringIO())
+
+        mock_fill.assert_called_once()
+        self.client.indices.update_aliases.assert_called_once()
+        self.client.indices.delete.assert_called_once_with(index='products_v1', ignore=(404,))
+        self.assertIsNone(cache.get(CHECKPOINT_KEY))
+
+
+class TestCSVRowStream(SimpleTestCase):
+    def setUp(self):
+        self.rows = [[f'عنوان {i}', 'توضیح, با "ویرگول"', 'تگ', 't', 'f'] for i in range(200)]
+
+    def test_small_reads_reassemble_into_the_same_rows(self):
+        stream = CSVRowStream(iter(self.rows))
+        chunks = []
+        while True:
+            chunk = stream.read(64)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), 64)
+            chunks.append(chunk)
+
+        self.assertEqual(list(csv.reader(io.StringIO(''.join(chunks)))), self.rows)
+
+    def test_rows_are_generated_lazily(self):
+        consumed = []
+
+        def rows():
+            for row in self.rows:
+                consumed.append(row)
+                yield row
+
+        CSVRowStream(rows()).read(64)
+        self.assertLess(len(consumed), len(self.rows))
+
+
+class TestBenchSearch(SimpleTestCase):
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_replays_corpus_against_recorded_backend(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus = Path(tmp) / 'queries.txt'
+            corpus.write_text('# comment\nگوشی\n\nlaptop\n')
+            responses = Path(tmp) / 'responses.json'
+            responses.write_text('{}')
+            report_path = Path(tmp) / 'report.json'
+
+            call_command(
+                'bench_search', corpus=str(corpus), backend='recorded', responses=str(responses),
+                concurrency=2, repeat=3, warmup=0, json_path=str(report_path), stdout=io.StringIO(),
+            )
+            report = json.loads(report_path.read_text())
+
+        self.assertEqual(report['requests'], 6)
+        self.assertEqual(report['errors'], 0)
+        self.assertGreater(report['end_to_end']['p50_ms'], 0)
+
+
+@override_settings(PRODUCT_POPULAR_QUERIES={
+    "MAX_TRACKED": 100, "FLUSH_SECONDS": 5, "HALF_LIFE_SECONDS": 600, "DECAY_INTERVAL_SECONDS": 300, "TOP_K": 2,
+    "PRECOMPUTE_INTERVAL_SECONDS": 60,
+})
+class TestPopularQueries(SimpleTestCase):
+    @patch('products.query_log.threading.Thread')
+    @patch.object(QueryLog, 'get_connection')
+    def test_searches_are_counted_in_process_and_flushed_in_one_pipeline(self, mock_connection, mock_thread):
+        self.addCleanup(setattr, QueryLog, 'flusher_pid', None)
+        QueryLog.flusher_pid = None
+        pipe = mock_connection.return_value.pipeline.return_value
+
+        for query in ['گوشی', 'laptop', 'گوشی']:
+            QueryLog.record(query)
+        mock_thread.return_value.start.assert_called_once_with()
+        pipe.zincrby.assert_not_called()
+
+        pipe.execute.side_effect = ConnectionError('redis down')
+        with self.assertRaises(ConnectionError):
+            QueryLog.flush()
+        QueryLog.record('laptop')
+
+        pipe.reset_mock(side_effect=True)
+        QueryLog.flush()
+        self.assertEqual(
+            sorted(call.args for call in pipe.zincrby.call_args_list),
+            [(QueryLog.key, 2, 'laptop'), (QueryLog.key, 2, 'گوشی')],
+        )
+        pipe.zremrangebyrank.assert_called_once_with(QueryLog.key, 0, -101)
+
+        pipe.reset_mock()
+        QueryLog.flush()
+        pipe.execute.assert_not_called()
+
+    @patch.object(QueryLog, 'get_connection')
+    def test_top_reads_highest_scores(self, mock_connection):
+        mock_connection.return_value.zrevrange.return_value = ['گوشی'.encode(), b'laptop']
+
+        self.assertEqual(QueryLog.top(2), ['گوشی', 'laptop'])
+        mock_connection.return_value.zrevrange.assert_called_once_with(QueryLog.key, 0, 1)
+
+    @patch.object(QueryLog, 'get_connection')
+    def test_decay_scales_scores_and_trims(self, mock_connection):
+        pipe = mock_connection.return_value.pipeline.return_value
+
+        QueryLog.decay()
+
+        factor = pipe.zunionstore.call_args.args[1][QueryLog.key]
+        self.assertAlmostEqual(factor, 0.5 ** 0.5)
+        pipe.zremrangebyrank.assert_called_once_with(QueryLog.key, 0, -101)
+        pipe.execute.assert_called_once()
+
+    @patch('products.top_queries.TopQueryStore.set_many')
+    @patch('products.top_queries.build_first_page')
+    @patch('products.top_queries.QueryLog.top', return_value=['گوشی', 'laptop'])
+    def test_precompute_stores_successful_first_pages(self, mock_top, mock_build, mock_set_many):
+        page = {'next_search_after': None, 'results': []}
+        mock_build.side_effect = [page, None]
+
+        self.assertEqual(precompute_top_queries(), 1)
+        mock_top.assert_called_once_with(2)
+        mock_set_many.assert_called_once_with({'گوشی': page})
+
+
+class TestWarmSearchCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        hot_cache.clear_local()
+
+    @patch('products.views.QueryLog')
+    @patch('products.views.DocumentViewSet.list')
+    @patch('products.management.commands.warm_search_cache.QueryLog.top')
+    def test_replays_top_queries_into_result_cache(self, mock_top, mock_list, mock_view_log):
+        mock_top.return_value = ['گوشی', 'laptop']
+        mock_list.return_value = Response({'next_search_after': None, 'results': []})
+
+        call_command('warm_search_cache', top=2, stdout=io.StringIO())
+
+        mock_top.assert_called_once_with(2)
+        self.assertEqual(mock_list.call_count, 2)
+        self.assertIsNotNone(SearchResultCache.get(SearchResultCache.make_key('laptop', 20)))
+        # Replays are not logged as real searches
+        mock_view_log.record.assert_not_called()
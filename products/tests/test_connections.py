@@ -0,0 +1,124 @@
+import asyncio
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from elasticsearch.exceptions import ConnectionError, NotFoundError, TransportError
+from rest_framework import status
+from rest_framework.test import APIClient
+from unittest.mock import MagicMock, patch
+
+from products.connections import CircuitBreaker, SearchUnavailable, get_async_client, search_breaker
+from utils.local_cache import hot_cache
+
+
+class TestGetAsyncClient(SimpleTestCase):
+    @override_settings(ELASTICSEARCH_ASYNC={"MAXSIZE": 7})
+    def test_client_is_built_from_settings(self):
+        async def build():
+            client = get_async_client()
+            self.assertIs(get_async_client(), client)
+            await client.close()
+            return client
+
+        client = asyncio.run(build())
+        self.assertEqual(client.transport.kwargs['maxsize'], 7)
+
+
+@override_settings(ELASTICSEARCH_CIRCUIT_BREAKER={"FAILURE_THRESHOLD": 2, "RESET_SECONDS": 30})
+class TestCircuitBreaker(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker()
+
+    def fail(self, exc=None):
+        with self.assertRaises(SearchUnavailable):
+            with self.breaker.guard():
+                raise exc or ConnectionError('N/A', 'connection refused', None)
+
+    @patch('products.connections.time.monotonic')
+    def test_opens_after_consecutive_failures_and_probes_after_reset(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        self.fail()
+        self.assertTrue(self.breaker.allow())
+        self.fail()
+
+        # Open: rejected without calling Elasticsearch
+        called = MagicMock()
+        with self.assertRaises(SearchUnavailable):
+            with self.breaker.guard():
+                called()
+        called.assert_not_called()
+
+        # After RESET_SECONDS a single probe goes through; a success closes the breaker
+        mock_monotonic.return_value = 131
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertTrue(self.breaker.allow())
+
+    def test_request_errors_do_not_count(self):
+        for _ in range(3):
+            with self.assertRaises(NotFoundError):
+                with self.breaker.guard():
+                    raise NotFoundError(404, 'index_not_found_exception', {})
+
+        self.assertIsNone(self.breaker.opened_at)
+
+    def test_overload_status_counts_as_failure(self):
+        self.fail(TransportError(503, 'unavailable', {}))
+        self.fail(TransportError(429, 'es_rejected_execution_exception', {}))
+
+        self.assertFalse(self.breaker.allow())
+
+
+@override_settings(PRODUCT_SEARCH={"TIERED_MIN_HITS": 0, "TIMEOUT": "800ms", "REQUEST_TIMEOUT_SECONDS": 2})
+class TestSearchBudget(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        query_log = patch('products.views.QueryLog')
+        self.query_log = query_log.start()
+        self.addCleanup(query_log.stop)
+        cache.clear()
+        hot_cache.clear_local()
+        search_breaker.record_success()
+        self.url = reverse('product-search')
+        self.es = MagicMock()
+        patcher = patch('products.pagination.get_connection', return_value=self.es)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(search_breaker.record_success)
+
+    def response(self, timed_out=False):
+        return {'took': 1, 'timed_out': timed_out, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'hits': []}}
+
+    def test_search_carries_time_budget(self):
+        self.es.search.return_value = self.response()
+
+        self.client.get(self.url, {'search': 'گوشی'})
+
+        kwargs = self.es.search.call_args.kwargs
+        self.assertEqual(kwargs['body']['timeout'], '800ms')
+        self.assertEqual(kwargs['request_timeout'], 2)
+
+    def test_partial_results_are_not_cached(self):
+        self.es.search.return_value = self.response(timed_out=True)
+
+        self.client.get(self.url, {'search': 'گوشی'})
+        self.client.get(self.url, {'search': 'گوشی'})
+
+        self.assertEqual(self.es.search.call_count, 2)
+
+    def test_unreachable_elasticsearch_returns_503(self):
+        self.es.search.side_effect = ConnectionError('N/A', 'connection refused', None)
+
+        response = self.client.get(self.url, {'search': 'گوشی'})
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @patch('products.pagination.aexecute_raw', side_effect=SearchUnavailable())
+    async def test_async_view_returns_503_when_unavailable(self, mock_execute):
+        response = await self.async_client.get(reverse('product-search-async'), {'search': 'گوشی'})
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json(), {'detail': SearchUnavailable.default_detail})
@@ -0,0 +1,114 @@
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from accounts.models import User
+from products.connections import search_breaker
+
+
+def hit(pk, score=1.0):
+    return {'_id': str(pk), '_score': score, '_source': {'id': pk, 'title': f'گوشی {pk}'}, 'sort': [score, pk]}
+
+
+@override_settings(PRODUCT_SEARCH_EXPORT={"BATCH_SIZE": 2, "MAX_RESULTS": 10, "KEEP_ALIVE": "1m"})
+class TestProductExportView(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        search_breaker.record_success()
+        self.url = reverse('product-export')
+        self.user = User.objects.create_user(phone='09123456789')
+        self.client.force_authenticate(self.user)
+
+        self.es = MagicMock()
+        self.es.open_point_in_time.return_value = {'id': 'pit-1'}
+        patcher = patch('products.pagination.get_connection', return_value=self.es)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *batches, total=50):
+        count = {'took': 1, 'hits': {'total': {'value': total, 'relation': 'gte'}, 'hits': []}}
+        pages = [{'pit_id': 'pit-2', 'hits': {'hits': batch}} for batch in batches]
+        self.es.search.side_effect = [count, *pages]
+
+    def test_streams_every_batch_as_ndjson(self):
+        self.respond([hit(1), hit(2)], [hit(3)])
+
+        response = self.client.get(self.url, {'search': 'گوشی'})
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(body.splitlines(), [
+            '{"title":"گوشی 1","id":1}',
+            '{"title":"گوشی 2","id":2}',
+            '{"title":"گوشی 3","id":3}',
+        ])
+
+        first, second = [call.kwargs['body'] for call in self.es.search.call_args_list[1:]]
+        self.assertEqual(first['pit'], {'id': 'pit-1', 'keep_alive': '1m'})
+        self.assertNotIn('search_after', first)
+        self.assertEqual(second['pit']['id'], 'pit-2')
+        self.assertEqual(second['search_after'], [1.0, 2])
+        self.es.close_point_in_time.assert_called_once_with(body={'id': 'pit-2'}, ignore=(404,))
+
+    async def test_streams_on_the_event_loop_under_asgi(self):
+        count = {'took': 1, 'hits': {'total': {'value': 50, 'relation': 'gte'}, 'hits': []}}
+        self.es.search.side_effect = [count]
+        async_es = MagicMock()
+        async_es.search = AsyncMock(side_effect=[
+            {'pit_id': 'pit-2', 'hits': {'hits': [hit(1), hit(2)]}},
+            {'pit_id': 'pit-2', 'hits': {'hits': [hit(3)]}},
+        ])
+        async_es.close_point_in_time = AsyncMock()
+        self.async_client.cookies['access_token'] = str(AccessToken.for_user(self.user))
+
+        with patch('products.pagination.get_async_client', return_value=async_es):
+            response = await self.async_client.get(self.url, {'search': 'گوشی', 'output': 'csv'})
+            self.assertTrue(response.is_async)
+            # Nothing is fetched before the client starts reading
+            async_es.search.assert_not_called()
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(b''.join(chunks).decode().splitlines(), ['title,id', 'گوشی 1,1', 'گوشی 2,2', 'گوشی 3,3'])
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(async_es.search.await_args_list[1].kwargs['body']['search_after'], [1.0, 2])
+        async_es.close_point_in_time.assert_awaited_once_with(body={'id': 'pit-2'}, ignore=(404,))
+
+    def test_csv_output(self):
+        self.respond([hit(1)])
+
+        response = self.client.get(self.url, {'search': 'گوشی', 'output': 'csv'})
+        body = b''.join(response.streaming_content).decode()
+
+        self.assertEqual(body.splitlines(), ['title,id', 'گوشی 1,1'])
+
+    def test_limit_caps_the_export(self):
+        self.respond([hit(1), hit(2)], [hit(3)])
+
+        response = self.client.get(self.url, {'search': 'گوشی', 'limit': 3})
+        b''.join(response.streaming_content)
+
+        self.assertEqual(self.es.search.call_args_list[-1].kwargs['body']['size'], 1)
+
+    def test_few_exact_hits_export_the_fuzzy_tier(self):
+        self.respond([hit(1)], total=1)
+
+        response = self.client.get(self.url, {'search': 'گوشی'})
+        b''.join(response.streaming_content)
+
+        query = self.es.search.call_args_list[1].kwargs['body']['query']
+        self.assertEqual(query['multi_match']['fuzziness'], 'AUTO')
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'search': 'گوشی', 'limit': 11})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(self.url, {'search': 'گوشی'})
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
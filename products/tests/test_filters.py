@@ -0,0 +1,185 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, override_settings
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch_dsl import Search
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from unittest.mock import MagicMock, patch
+
+from products.filters import TieredSearchFilterBackend
+from products.pagination import Cursor, SearchAfterRelevancePagination, encode_pit_cursor, parse_search_after
+
+
+class FakeView:
+    def __init__(self):
+        self.paginator = SearchAfterRelevancePagination()
+
+
+def make_request(**params):
+    return Request(APIRequestFactory().get('/', params))
+
+
+def fake_search(total, hits):
+    """A Search stand-in whose client returns a raw response with `hits` and the given total."""
+    search = MagicMock()
+    search.sort.return_value = search
+    search.extra.return_value = search
+    search.__getitem__.return_value = search
+    search.to_dict.return_value = {}
+    search._params = {}
+    # get_connection() hands back non-string aliases as the client itself
+    search._using.search.return_value = {
+        'took': 5,
+        'hits': {'total': {'value': total, 'relation': 'eq'}, 'hits': hits},
+    }
+    return search
+
+
+class TestParseSearchAfter(SimpleTestCase):
+    def test_cursor_formats(self):
+        self.assertEqual(parse_search_after('1.5,10'), Cursor([1.5, '10'], None, None))
+        self.assertEqual(parse_search_after('1.5,10,fuzzy'), Cursor([1.5, '10'], 'fuzzy', None))
+        self.assertIsNone(parse_search_after(None))
+        self.assertIsNone(parse_search_after('abc,10'))
+        self.assertIsNone(parse_search_after('1.5'))
+        self.assertIsNone(parse_search_after('pit.not-base64-json'))
+
+    def test_pit_cursor_round_trip(self):
+        raw = encode_pit_cursor('pit-id==', [2.5, 17], 'exact')
+
+        self.assertTrue(raw.startswith('pit.'))
+        self.assertNotIn(',', raw)
+        self.assertEqual(parse_search_after(raw), Cursor([2.5, 17], 'exact', 'pit-id=='))
+
+
+@override_settings(PRODUCT_SEARCH={**settings.PRODUCT_SEARCH, "TIERED_MIN_HITS": 10})
+class TestTieredSearchFilterBackend(SimpleTestCase):
+    def setUp(self):
+        self.backend = TieredSearchFilterBackend()
+        self.view = FakeView()
+
+    def test_first_page_uses_exact_tier_with_fuzzy_fallback(self):
+        search = self.backend.filter_queryset(make_request(search='گوشي'), Search(), self.view)
+
+        query = search.to_dict()['query']
+        self.assertIn('bool', query)
+        self.assertNotIn('fuzziness', str(query))
+        self.assertEqual(self.view.search_tier, 'exact')
+        self.assertEqual(self.view.fallback_search.tier, 'fuzzy')
+        self.assertEqual(self.view.fallback_search.min_hits, 10)
+        self.assertEqual(
+            self.view.fallback_search.search.to_dict()['query']['multi_match']['fuzziness'], 'AUTO'
+        )
+
+    def test_fuzzy_cursor_stays_on_fuzzy_tier(self):
+        request = make_request(search='گوشی', search_after='1.5,10,fuzzy')
+        search = self.backend.filter_queryset(request, Search(), self.view)
+
+        self.assertIn('multi_match', search.to_dict()['query'])
+        self.assertEqual(self.view.search_tier, 'fuzzy')
+        self.assertFalse(hasattr(self.view, 'fallback_search'))
+
+    def test_exact_cursor_has_no_fallback(self):
+        request = make_request(search='گوشی', search_after='1.5,10,exact')
+        self.backend.filter_queryset(request, Search(), self.view)
+
+        self.assertEqual(self.view.search_tier, 'exact')
+        self.assertFalse(hasattr(self.view, 'fallback_search'))
+
+
+@override_settings(PRODUCT_SEARCH={**settings.PRODUCT_SEARCH, "TIERED_MIN_HITS": 10})
+class TestTieredPagination(SimpleTestCase):
+    def paginate(self, exact_total):
+        view = FakeView()
+        backend = TieredSearchFilterBackend()
+        request = make_request(search='گوشی', page_size=1)
+        backend.filter_queryset(request, Search(), view)
+
+        hit = {'_score': 2.0, '_source': {'id': 7, 'title': 'گوشی'}, 'sort': [2.0, 7]}
+        exact = fake_search(exact_total, [hit, hit])
+        fuzzy = fake_search(50, [hit, hit])
+        view.fallback_search = view.fallback_search._replace(search=fuzzy)
+
+        paginator = view.paginator
+        paginator.paginate_queryset(exact, request, view)
+        return paginator.get_paginated_response([]).data, exact, fuzzy
+
+    def test_enough_exact_hits_skip_fuzzy(self):
+        data, exact, fuzzy = self.paginate(exact_total=25)
+
+        self.assertEqual(data['search_tier'], 'exact')
+        self.assertEqual(data['next_search_after'], '2.0,7,exact')
+        fuzzy._using.search.assert_not_called()
+
+    def test_too_few_exact_hits_fall_back_to_fuzzy(self):
+        data, exact, fuzzy = self.paginate(exact_total=3)
+
+        self.assertEqual(data['search_tier'], 'fuzzy')
+        self.assertEqual(data['next_search_after'], '2.0,7,fuzzy')
+        exact._using.search.assert_called_once()
+        fuzzy._using.search.assert_called_once()
+
+
+@override_settings(PRODUCT_SEARCH={**settings.PRODUCT_SEARCH, "TIERED_MIN_HITS": 0, "PIT_KEEP_ALIVE": "2m"})
+class TestPointInTimePagination(SimpleTestCase):
+    def setUp(self):
+        self.es = MagicMock()
+        self.es.open_point_in_time.return_value = {'id': 'pit-1'}
+        patcher = patch('products.pagination.get_connection', return_value=self.es)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *pks):
+        hits = [{'_score': 1.0, '_source': {'id': pk}, 'sort': [1.0, pk * 10]} for pk in pks]
+        self.es.search.return_value = {
+            'took': 1, 'pit_id': 'pit-2', 'hits': {'total': {'value': 50, 'relation': 'eq'}, 'hits': hits},
+        }
+
+    def paginate(self, user=None, **params):
+        request = make_request(search='گوشی', page_size=2, **params)
+        request.user = user or MagicMock(is_authenticated=True)
+        view = FakeView()
+        search = TieredSearchFilterBackend().filter_queryset(request, Search(index='products'), view)
+        paginator = view.paginator
+        paginator.paginate_queryset(search, request, view)
+        return paginator.get_paginated_data([]), self.es.search.call_args.kwargs
+
+    def test_first_page_opens_point_in_time(self):
+        self.respond(1, 2, 3)
+
+        data, call = self.paginate(consistent='true')
+
+        self.es.open_point_in_time.assert_called_once_with(index=['products'], keep_alive='2m')
+        self.assertIsNone(call['index'])
+        self.assertEqual(call['body']['pit'], {'id': 'pit-1', 'keep_alive': '2m'})
+        self.assertEqual(call['body']['sort'][1], {'_shard_doc': {'order': 'asc'}})
+        self.assertEqual(parse_search_after(data['next_search_after']), Cursor([1.0, 20], 'exact', 'pit-2'))
+        self.es.close_point_in_time.assert_not_called()
+
+    def test_anonymous_clients_get_regular_pages(self):
+        self.respond(1, 2, 3)
+
+        data, call = self.paginate(user=AnonymousUser(), consistent='true')
+
+        self.es.open_point_in_time.assert_not_called()
+        self.assertEqual(call['index'], ['products'])
+        self.assertEqual(call['body']['sort'][1], {'id': {'order': 'asc'}})
+
+    def test_next_page_reuses_point_in_time_and_closes_it_at_the_end(self):
+        self.respond(3)
+
+        data, call = self.paginate(search_after=encode_pit_cursor('pit-2', [1.0, 20], 'exact'))
+
+        self.es.open_point_in_time.assert_not_called()
+        self.assertEqual(call['body']['pit']['id'], 'pit-2')
+        self.assertEqual(call['body']['search_after'], [1.0, 20])
+        self.assertIsNone(data['next_search_after'])
+        self.es.close_point_in_time.assert_called_once_with(body={'id': 'pit-2'}, ignore=(404,))
+
+    def test_expired_point_in_time_is_a_client_error(self):
+        self.es.search.side_effect = NotFoundError(404, 'search_context_missing_exception', {})
+
+        with self.assertRaises(ValidationError):
+            self.paginate(search_after=encode_pit_cursor('gone', [1.0, 20], 'exact'))
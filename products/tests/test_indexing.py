@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from elasticsearch.helpers import BulkIndexError
+from freezegun import freeze_time
+from unittest.mock import patch
+
+from products.documents import ProductDocument
+from products.indexing import IndexWatermark, enqueue_product_index, get_index_actions, sync_index_delta
+from products.models import Product
+from products.tasks import flush_product_index_queue
+from utils.local_cache import hot_cache
+
+
+class TestIndexSignals(TestCase):
+    @patch('products.signals.enqueue_product_index')
+    def test_save_enqueues_on_commit(self, mock_enqueue):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(title='گوشی', is_published=True)
+
+        mock_enqueue.assert_called_once_with(product.pk)
+
+    @patch('products.signals.enqueue_product_index')
+    def test_delete_enqueues_on_commit(self, mock_enqueue):
+        product = Product.objects.create(title='گوشی', is_published=True)
+        product_id = product.pk
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+
+        mock_enqueue.assert_called_once_with(product_id)
+
+    @patch('products.signals.enqueue_product_index')
+    def test_nothing_enqueued_before_commit(self, mock_enqueue):
+        Product.objects.create(title='گوشی', is_published=True)
+        mock_enqueue.assert_not_called()
+
+
+@override_settings(PRODUCT_INDEX_QUEUE={"BATCH_SIZE": 3, "FLUSH_INTERVAL_SECONDS": 5})
+class TestEnqueueProductIndex(TestCase):
+    def setUp(self):
+        cache.clear()
+        hot_cache.clear_local()
+
+    @patch('products.tasks.flush_product_index_queue')
+    @patch('products.indexing.IndexQueue.push', return_value=3)
+    def test_flushes_immediately_when_batch_is_full(self, mock_push, mock_task):
+        enqueue_product_index(1, 2, 3)
+
+        mock_push.assert_called_once_with((1, 2, 3))
+        mock_task.delay.assert_called_once_with()
+        mock_task.apply_async.assert_not_called()
+
+    @patch('products.tasks.flush_product_index_queue')
+    @patch('products.indexing.IndexQueue.push', return_value=1)
+    def test_schedules_a_single_delayed_flush(self, mock_push, mock_task):
+        enqueue_product_index(1)
+        enqueue_product_index(2)
+
+        mock_task.delay.assert_not_called()
+        mock_task.apply_async.assert_called_once_with(countdown=5)
+
+    @patch('products.tasks.flush_product_index_queue')
+    @patch('products.indexing.IndexQueue.push', side_effect=[3, 4, 5])
+    def test_one_immediate_flush_while_the_queue_stays_full(self, mock_push, mock_task):
+        for product_id in (1, 2, 3):
+            enqueue_product_index(product_id)
+
+        mock_task.delay.assert_called_once_with()
+
+    @patch('products.tasks.sync_products', side_effect=BulkIndexError('1 document(s) failed to index.', []))
+    @patch('products.tasks.IndexQueue.push')
+    @patch('products.tasks.IndexQueue.pop', return_value=[1, 2])
+    def test_failed_batch_is_put_back(self, mock_pop, mock_push, mock_sync):
+        with self.assertRaises(BulkIndexError):
+            flush_product_index_queue.apply(throw=True)
+
+        mock_push.assert_called_once_with([1, 2])
+
+
+class TestGetIndexActions(TestCase):
+    def test_actions_follow_product_state(self):
+        published = Product.objects.create(title='گوشی', is_published=True, cached_tags='موبایل,سامسونگ')
+        unpublished = Product.objects.create(title='تبلت', is_published=False)
+        deleted = Product.objects.create(title='لپ تاپ', is_published=True, is_deleted=True)
+        missing_id = deleted.pk + 100
+
+        actions = {
+            action['_id']: action
+            for action in get_index_actions([published.pk, unpublished.pk, deleted.pk, missing_id])
+        }
+
+        self.assertEqual(actions[published.pk]['_op_type'], 'index')
+        self.assertEqual(actions[published.pk]['_source']['title'], 'گوشی')
+        self.assertEqual(actions[published.pk]['_source']['suggest'], {'input': ['گوشی', 'موبایل', 'سامسونگ']})
+        self.assertEqual(actions[published.pk]['_index'], ProductDocument._index._name)
+        for product_id in (unpublished.pk, deleted.pk, missing_id):
+            self.assertEqual(actions[product_id]['_op_type'], 'delete')
+
+
+@override_settings(PRODUCT_INDEX_DELTA={"BATCH_SIZE": 2, "SAFETY_LAG_SECONDS": 10, "LOCK_TIMEOUT_SECONDS": 60})
+class TestSyncIndexDelta(TestCase):
+    start = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        hot_cache.clear_local()
+        with freeze_time(self.start):
+            self.products = [Product.objects.create(title=f'کالا {i}', is_published=True) for i in range(3)]
+
+    def sync_at(self, moment):
+        with freeze_time(moment), patch('products.indexing.sync_products') as mock_sync:
+            synced = sync_index_delta()
+        return synced, [call.args[0] for call in mock_sync.call_args_list]
+
+    def test_first_run_syncs_everything_in_keyset_batches(self):
+        synced, batches = self.sync_at(self.start + timedelta(minutes=1))
+
+        ids = [product.pk for product in self.products]
+        self.assertEqual(synced, 3)
+        self.assertEqual(batches, [ids[:2], ids[2:]])
+        self.assertEqual(IndexWatermark.get(), (self.start, ids[2]))
+
+    def test_only_changes_after_the_watermark_are_synced(self):
+        self.sync_at(self.start + timedelta(minutes=1))
+
+        with freeze_time(self.start + timedelta(minutes=2)):
+            self.products[0].save()
+
+        synced, batches = self.sync_at(self.start + timedelta(minutes=3))
+        self.assertEqual(synced, 1)
+        self.assertEqual(batches, [[self.products[0].pk]])
+
+        synced, batches = self.sync_at(self.start + timedelta(minutes=4))
+        self.assertEqual(synced, 0)
+        self.assertEqual(batches, [])
+
+    def test_recent_rows_wait_for_the_safety_lag(self):
+        synced, _ = self.sync_at(self.start + timedelta(seconds=5))
+        self.assertEqual(synced, 0)
+
+    def test_tag_changes_move_updated_at(self):
+        self.sync_at(self.start + timedelta(minutes=1))
+
+        with freeze_time(self.start + timedelta(minutes=2)):
+            self.products[1].tags.add('موبایل')
+
+        synced, batches = self.sync_at(self.start + timedelta(minutes=3))
+        self.assertEqual(batches, [[self.products[1].pk]])
+
+    def test_concurrent_run_is_skipped(self):
+        cache.add(IndexWatermark.lock_key, 1)
+        synced, batches = self.sync_at(self.start + timedelta(minutes=1))
+
+        self.assertIsNone(synced)
+        self.assertEqual(batches, [])
@@ -0,0 +1,132 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from unittest.mock import MagicMock, patch
+
+import orjson
+
+from products.instrumentation import Counter, Histogram, MetricsRegistry, SearchTimings
+from utils.local_cache import hot_cache
+
+
+class TestMetricsRegistry(SimpleTestCase):
+    def test_renders_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        requests = registry.register(Counter('requests_total', 'Requests.', labels=('status',)))
+        latency = registry.register(Histogram('latency_seconds', 'Latency.', (0.1, 1)))
+
+        requests.inc('200')
+        requests.inc('200')
+        latency.observe(0.05)
+        latency.observe(0.5)
+
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{status="200"} 2',
+            '# HELP latency_seconds Latency.',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1.0"} 2',
+            'latency_seconds_bucket{le="+Inf"} 2',
+            'latency_seconds_count 2',
+            'latency_seconds_sum 0.55',
+        ]) + '\n')
+
+    def test_flushes_deltas_and_renders_the_shared_totals(self):
+        registry = MetricsRegistry()
+        requests = registry.register(Counter('requests_total', 'Requests.', labels=('status',)))
+        latency = registry.register(Histogram('latency_seconds', 'Latency.', (0.1, 1)))
+        connection = MagicMock()
+        pipe = connection.pipeline.return_value
+
+        requests.inc('200')
+        requests.inc('200')
+        latency.observe(0.5)
+        with patch.object(MetricsRegistry, 'get_connection', return_value=connection):
+            registry.flush()
+            requests.inc('200')
+            pipe.reset_mock()
+            registry.flush()
+
+        # Only what was counted since the last flush
+        pipe.hincrby.assert_called_once_with(
+            MetricsRegistry.shared_key, orjson.dumps(('requests_total', ('200',), 0)), 1,
+        )
+        pipe.hincrbyfloat.assert_not_called()
+
+        # Another worker's counts are in the hash too
+        connection.hgetall.return_value = {
+            orjson.dumps(['requests_total', ['200'], 0]): b'7',
+            orjson.dumps(['requests_total', ['503'], 0]): b'1',
+            orjson.dumps(['latency_seconds', [], 1]): b'2',
+            orjson.dumps(['latency_seconds', [], 2]): b'2',
+            orjson.dumps(['latency_seconds', [], 3]): b'1.25',
+            orjson.dumps(['removed_total', [], 0]): b'3',
+        }
+        with patch.object(MetricsRegistry, 'get_connection', return_value=connection):
+            text = registry.render(registry.shared_values())
+
+        self.assertEqual(text.splitlines()[2:4], ['requests_total{status="200"} 7', 'requests_total{status="503"} 1'])
+        self.assertIn('latency_seconds_bucket{le="0.1"} 0', text)
+        self.assertIn('latency_seconds_sum 1.25', text)
+        self.assertNotIn('removed_total', text)
+
+    def test_server_timing_lists_phases_in_order(self):
+        timings = SearchTimings()
+        timings.add('query', 0.001)
+        timings.add('es', 0.02)
+        timings.add('es', 0.01)
+        timings.es_took = 0.025
+        timings.total_hits = 42
+
+        self.assertEqual(
+            timings.server_timing(0.04),
+            'query;dur=1.0, es;dur=30.0, es-took;dur=25.0, hits;desc="42", total;dur=40.0',
+        )
+
+
+class TestSearchInstrumentation(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        query_log = patch('products.views.QueryLog')
+        self.query_log = query_log.start()
+        self.addCleanup(query_log.stop)
+        cache.clear()
+        hot_cache.clear_local()
+        self.url = reverse('product-search')
+        self.payload = {'next_search_after': None, 'results': [{'id': 1, 'title': 'گوشی'}]}
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_server_timing_header_on_search(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        miss = self.client.get(self.url, {'search': 'گوشی'})
+        hit = self.client.get(self.url, {'search': 'گوشی'})
+
+        self.assertRegex(miss['Server-Timing'], r'^cache;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertIn('cache;dur=', hit['Server-Timing'])
+
+    @override_settings(PRODUCT_SEARCH_METRICS={"SLOW_QUERY_MS": 0, "ALLOWED_IPS": ["127.0.0.1"], "FLUSH_SECONDS": 5})
+    @patch('products.views.DocumentViewSet.list')
+    def test_slow_search_logged_with_normalized_query(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        with self.assertLogs('products.search', level='WARNING') as logs:
+            self.client.get(self.url, {'search': '  گوشي  '})
+
+        self.assertIn("query='گوشی'", logs.output[0])
+
+    def test_metrics_endpoint(self):
+        response = self.client.get(reverse('product-search-metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(b'# TYPE product_search_phase_seconds histogram', response.content)
+
+    def test_metrics_endpoint_is_local_only(self):
+        response = self.client.get(reverse('product-search-metrics'), REMOTE_ADDR='10.0.0.8')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
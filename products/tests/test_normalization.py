@@ -0,0 +1,38 @@
+from django.test import SimpleTestCase
+
+from products.normalization import normalize_query
+
+
+class TestNormalizeQuery(SimpleTestCase):
+    def test_arabic_letters_fold_to_persian(self):
+        self.assertEqual(normalize_query('گوشي'), normalize_query('گوشی'))
+        self.assertEqual(normalize_query('كتاب'), normalize_query('کتاب'))
+        self.assertEqual(normalize_query('خانة'), normalize_query('خانه'))
+
+    def test_digits_are_folded(self):
+        self.assertEqual(normalize_query('آیفون ۱۳'), normalize_query('آیفون 13'))
+        self.assertEqual(normalize_query('آیفون ١٣'), normalize_query('آیفون 13'))
+
+    def test_zwnj_and_whitespace(self):
+        self.assertEqual(normalize_query('کیف‌پول'), 'کیف پول')
+        self.assertEqual(normalize_query('  کیف \t  پول \n'), 'کیف پول')
+
+    def test_diacritics_and_tatweel_are_removed(self):
+        self.assertEqual(normalize_query('کتـــاب'), 'کتاب')
+        self.assertEqual(normalize_query('کِتاب'), 'کتاب')
+
+    def test_lowercase(self):
+        self.assertEqual(normalize_query('Samsung GALAXY'), 'samsung galaxy')
+
+    def test_stopwords(self):
+        self.assertEqual(normalize_query('گوشی برای بازی'), 'گوشی بازی')
+        # A query made only of stopwords is kept rather than emptied
+        self.assertEqual(normalize_query('از در'), 'از در')
+
+    def test_empty(self):
+        self.assertEqual(normalize_query(None), '')
+        self.assertEqual(normalize_query(' ‌ '), '')
+
+    def test_idempotent(self):
+        query = normalize_query(' گوشي‌های  سامسونگ ۱۲ ')
+        self.assertEqual(normalize_query(query), query)
@@ -0,0 +1,108 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from unittest.mock import MagicMock, patch
+
+import orjson
+
+from products.search_cache import SearchResultCache, TopQueryStore, lookup_page
+from utils.local_cache import LocalCache, TwoTierCache, hot_cache
+
+
+class TestLocalCache(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        local = LocalCache(max_entries=2, max_bytes=10000)
+        local.set('a', 1, 60)
+        local.set('b', 2, 60)
+        local.get('a')
+        local.set('c', 3, 60)
+
+        self.assertEqual(local.get('a'), 1)
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('c'), 3)
+
+    def test_memory_cap(self):
+        local = LocalCache(max_entries=100, max_bytes=300)
+        local.set('a', 'x' * 100, 60)
+        local.set('b', 'y' * 100, 60)
+        local.set('c', 'z' * 100, 60)
+        local.set('huge', 'w' * 1000, 60)
+
+        self.assertIsNone(local.get('a'))
+        self.assertIsNone(local.get('huge'))
+        self.assertEqual(local.get('c'), 'z' * 100)
+        self.assertLessEqual(local.size, 300)
+
+    def test_expired_entries_are_dropped(self):
+        local = LocalCache(max_entries=10, max_bytes=10000)
+        with patch('utils.local_cache.time.monotonic', return_value=100):
+            local.set('a', 1, 5)
+        with patch('utils.local_cache.time.monotonic', return_value=104):
+            self.assertEqual(local.get('a'), 1)
+        with patch('utils.local_cache.time.monotonic', return_value=105):
+            self.assertIsNone(local.get('a'))
+        self.assertEqual(local.size, 0)
+
+
+@override_settings(LOCAL_CACHE={
+    'MAX_ENTRIES': 100, 'MAX_BYTES': 100000, 'TIMEOUT_SECONDS': 10, 'CHANNEL': 'invalidate',
+})
+class TestTwoTierCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        hot_cache.clear_local()
+        self.connection = MagicMock()
+        self.hot_cache = TwoTierCache()
+        patch.object(self.hot_cache, 'get_connection', return_value=self.connection).start()
+        patch('utils.local_cache.threading.Thread').start()
+        patch('products.search_cache.hot_cache', self.hot_cache).start()
+        self.addCleanup(patch.stopall)
+
+    def test_hot_keys_are_read_locally(self):
+        TopQueryStore.set_many({'گوشی': {'results': [1]}})
+        top_key = TopQueryStore.make_key('گوشی')
+        cache_key = SearchResultCache.make_key('گوشی', 20)
+
+        with patch('utils.local_cache.cache', wraps=cache) as mock_cache:
+            lookup_page(cache_key, top_key)
+            payload, source = lookup_page(cache_key, top_key)
+            SearchResultCache.make_key('گوشی', 20)
+
+        self.assertEqual((payload, source), ({'results': [1]}, 'top'))
+        # Only the first lookup went to Redis; the generation was already local
+        mock_cache.get_many.assert_called_once_with([top_key, cache_key])
+        mock_cache.get_or_set.assert_not_called()
+
+    def test_writes_publish_invalidations(self):
+        generation = SearchResultCache.get_generation()
+        cache.incr(SearchResultCache.generation_key, 5)
+        self.assertEqual(SearchResultCache.get_generation(), generation)
+
+        self.assertEqual(SearchResultCache.bump_generation(), generation + 6)
+        self.assertEqual(SearchResultCache.get_generation(), generation + 6)
+
+        channel, message = self.connection.publish.call_args.args
+        self.assertEqual(channel, 'invalidate')
+        self.assertEqual(orjson.loads(message), {
+            'sender': self.hot_cache.sender, 'keys': [SearchResultCache.generation_key],
+        })
+
+    def test_invalidation_from_another_worker(self):
+        self.hot_cache.get_many(['products:index_generation'])
+        self.hot_cache.local.set('products:index_generation', 1, 10)
+
+        self.hot_cache.handle_message(orjson.dumps({'sender': 'other', 'keys': ['products:index_generation']}))
+        self.assertIsNone(self.hot_cache.local.get('products:index_generation'))
+
+        self.hot_cache.local.set('products:index_generation', 1, 10)
+        self.hot_cache.handle_message(orjson.dumps({
+            'sender': self.hot_cache.sender, 'keys': ['products:index_generation'],
+        }))
+        self.assertEqual(self.hot_cache.local.get('products:index_generation'), 1)
+
+    def test_bypassed_without_redis(self):
+        hot_cache = TwoTierCache()
+        patch.object(hot_cache, 'get_connection', side_effect=NotImplementedError).start()
+        cache.set('key', 'value')
+
+        self.assertEqual(hot_cache.get('key'), 'value')
+        self.assertIsNone(hot_cache.local)
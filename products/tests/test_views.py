@@ -0,0 +1,343 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from accounts.models import User
+from products.search_cache import SearchResultCache, TopQueryStore
+from utils.local_cache import hot_cache
+from utils.rate_limit import local_allowances
+
+
+class TestProductSearchCache(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        query_log = patch('products.views.QueryLog')
+        self.query_log = query_log.start()
+        self.addCleanup(query_log.stop)
+        cache.clear()
+        hot_cache.clear_local()
+        self.url = reverse('product-search')
+        self.payload = {'next_search_after': None, 'results': [{'id': 1, 'title': 'گوشی'}]}
+
+    def test_missing_search_param(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_repeated_query_served_from_cache(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        first = self.client.get(self.url, {'search': 'گوشی'})
+        second = self.client.get(self.url, {'search': '  گوشی '})
+
+        self.assertEqual(mock_list.call_count, 1)
+        self.assertEqual(first.data, self.payload)
+        self.assertEqual(second.data, self.payload)
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_page_parameters_are_part_of_the_key(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        self.client.get(self.url, {'search': 'گوشی'})
+        self.client.get(self.url, {'search': 'گوشی', 'page_size': 50})
+        self.client.get(self.url, {'search': 'گوشی', 'search_after': '1.5,10'})
+
+        self.assertEqual(mock_list.call_count, 3)
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_generation_bump_invalidates_cache(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        self.client.get(self.url, {'search': 'گوشی'})
+        SearchResultCache.bump_generation()
+        self.client.get(self.url, {'search': 'گوشی'})
+
+        self.assertEqual(mock_list.call_count, 2)
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_spelling_variants_share_cache_entry(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        self.client.get(self.url, {'search': 'گوشی'})
+        self.client.get(self.url, {'search': 'گوشي'})
+
+        self.assertEqual(mock_list.call_count, 1)
+
+
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_first_pages_are_logged_for_warm_up(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        self.client.get(self.url, {'search': 'گوشي'})
+        self.client.get(self.url, {'search': 'گوشی', 'search_after': '1.5,10'})
+
+        self.query_log.record.assert_called_once_with('گوشی')
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_precomputed_first_page_served_before_result_cache(self, mock_list):
+        precomputed = {'next_search_after': '3.0,2', 'results': [{'id': 2, 'title': 'گوشی'}]}
+        TopQueryStore.set_many({'گوشی': precomputed})
+
+        first_page = self.client.get(self.url, {'search': 'گوشي'})
+        mock_list.return_value = Response(self.payload)
+        other_size = self.client.get(self.url, {'search': 'گوشی', 'page_size': 5})
+
+        self.assertEqual(first_page.data, precomputed)
+        self.assertEqual(other_size.data, self.payload)
+        self.assertEqual(mock_list.call_count, 1)
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_consistent_mode_bypasses_cache(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+        user = User.objects.create(phone='+989123456789')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+
+        self.client.get(self.url, {'search': 'گوشی', 'consistent': 'true'})
+        self.client.get(self.url, {'search': 'گوشی', 'consistent': 'true'})
+
+        self.assertEqual(mock_list.call_count, 2)
+
+    @patch('products.views.DocumentViewSet.list')
+    def test_consistent_mode_is_ignored_for_anonymous_clients(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        self.client.get(self.url, {'search': 'گوشی', 'consistent': 'true'})
+        self.client.get(self.url, {'search': 'گوشی', 'consistent': 'true'})
+
+        self.assertEqual(mock_list.call_count, 1)
+
+class TestProductSearchFastPath(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        query_log = patch('products.views.QueryLog')
+        self.query_log = query_log.start()
+        self.addCleanup(query_log.stop)
+        cache.clear()
+        hot_cache.clear_local()
+        self.url = reverse('product-search')
+
+    @patch('products.pagination.execute_raw')
+    def test_page_built_from_raw_hits(self, mock_execute):
+        mock_execute.return_value = {
+            'took': 3,
+            'hits': {
+                'total': {'value': 30, 'relation': 'eq'},
+                'hits': [
+                    {'_id': str(pk), '_score': 2.5, '_source': {'id': pk, 'title': 'گوشی'}, 'sort': [2.5, pk]}
+                    for pk in (4, 9)
+                ],
+            },
+        }
+
+        response = self.client.get(self.url, {'search': 'گوشی', 'page_size': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'next_search_after': '2.5,4,exact',
+            'results': [{'title': 'گوشی', 'id': 4}],
+            'search_tier': 'exact',
+        })
+        # Non-ASCII text is written as UTF-8, not \u escapes
+        self.assertIn('گوشی'.encode(), response.content)
+        self.assertEqual(mock_execute.call_args.args[0].to_dict()['_source'], ['title', 'id'])
+
+class TestProductSuggestView(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        self.url = reverse('product-suggest')
+
+    def es_response(self, search):
+        return {
+            'hits': {'total': {'value': 0, 'relation': 'eq'}, 'hits': []},
+            'suggest': {
+                'product-suggest': [{
+                    'text': 'گوش',
+                    'offset': 0,
+                    'length': 3,
+                    'options': [
+                        {'text': 'گوشی سامسونگ', '_id': '1', '_score': 1.0, '_source': {'id': 1}},
+                        {'text': 'گوشواره', '_id': '2', '_score': 1.0, '_source': {'id': 2}},
+                    ],
+                }],
+            },
+        }
+
+    def test_returns_top_suggestions(self):
+        executed = []
+
+        def execute(search, *args, **kwargs):
+            executed.append(search.to_dict())
+            return self.es_response(search)
+
+        with patch('products.views.execute_raw', side_effect=execute):
+            response = self.client.get(self.url, {'q': 'گوش', 'size': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['suggestions'], [
+            {'text': 'گوشی سامسونگ', 'id': 1},
+            {'text': 'گوشواره', 'id': 2},
+        ])
+        body = executed[0]
+        self.assertEqual(body['size'], 0)
+        self.assertNotIn('sort', body)
+        self.assertNotIn('query', body)
+        self.assertEqual(body['suggest']['product-suggest']['completion']['size'], 2)
+
+    def test_prefix_is_folded_but_not_stopword_trimmed(self):
+        executed = []
+
+        def execute(search, *args, **kwargs):
+            executed.append(search.to_dict())
+            return self.es_response(search)
+
+        with patch('products.views.execute_raw', side_effect=execute):
+            self.client.get(self.url, {'q': 'گوشي با'})
+
+        self.assertEqual(executed[0]['suggest']['product-suggest']['text'], 'گوشی با')
+
+    @patch('products.views.execute_raw')
+    def test_blank_prefix_skips_elasticsearch(self, mock_execute):
+        response = self.client.get(self.url, {'q': ' ‌ '})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['suggestions'], [])
+        mock_execute.assert_not_called()
+
+    def test_uses_the_search_time_budget(self):
+        es = MagicMock()
+        es.search.return_value = self.es_response(None)
+
+        with patch('products.pagination.get_connection', return_value=es):
+            self.client.get(self.url, {'q': 'گوش'})
+
+        kwargs = es.search.call_args.kwargs
+        self.assertEqual(kwargs['request_timeout'], settings.PRODUCT_SEARCH["REQUEST_TIMEOUT_SECONDS"])
+        self.assertEqual(kwargs['body']['timeout'], settings.PRODUCT_SEARCH["TIMEOUT"])
+
+    def test_open_breaker_rejects_suggestions(self):
+        with patch('products.pagination.search_breaker.allow', return_value=False):
+            response = self.client.get(self.url, {'q': 'گوش'})
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_invalid_params(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {'q': 'گوش', 'size': 100})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestAsyncProductSearchView(TestCase):
+    def setUp(self):
+        query_log = patch('products.views.QueryLog')
+        self.query_log = query_log.start()
+        self.addCleanup(query_log.stop)
+        cache.clear()
+        hot_cache.clear_local()
+        self.url = reverse('product-search-async')
+        self.raw = {
+            'took': 3,
+            'hits': {
+                'total': {'value': 30, 'relation': 'eq'},
+                'hits': [
+                    {'_id': str(pk), '_score': 2.5, '_source': {'id': pk, 'title': 'گوشی'}, 'sort': [2.5, pk]}
+                    for pk in (4, 9)
+                ],
+            },
+        }
+
+    async def test_same_body_as_sync_view(self):
+        with patch('products.pagination.aexecute_raw', AsyncMock(return_value=self.raw)) as mock_execute:
+            response = await self.async_client.get(self.url, {'search': 'گوشی', 'page_size': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            'next_search_after': '2.5,4,exact',
+            'results': [{'title': 'گوشی', 'id': 4}],
+            'search_tier': 'exact',
+        })
+        self.assertIn('es-took;dur=3.0', response['Server-Timing'])
+        self.assertEqual(mock_execute.call_args.args[0].to_dict()['_source'], ['title', 'id'])
+
+    async def test_falls_back_to_fuzzy_tier(self):
+        few = {'took': 1, 'hits': {'total': {'value': 1, 'relation': 'eq'}, 'hits': self.raw['hits']['hits'][:1]}}
+        with patch('products.pagination.aexecute_raw', AsyncMock(side_effect=[few, self.raw])) as mock_execute:
+            response = await self.async_client.get(self.url, {'search': 'گوشی', 'page_size': 1})
+
+        self.assertEqual(response.json()['search_tier'], 'fuzzy')
+        self.assertEqual(mock_execute.await_count, 2)
+
+    async def test_repeated_query_served_from_cache(self):
+        with patch('products.pagination.aexecute_raw', AsyncMock(return_value=self.raw)) as mock_execute:
+            first = await self.async_client.get(self.url, {'search': 'گوشی'})
+            second = await self.async_client.get(self.url, {'search': 'گوشي'})
+
+        self.assertEqual(mock_execute.await_count, 1)
+        self.assertEqual(first.content, second.content)
+
+    async def test_missing_search_param(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(
+    RATE_LIMITS={'product-search': {'ip': [(1, 5), (60, 2)]}},
+    RATE_LIMIT_LOCAL={'SHARE': 0, 'MAX_CLIENTS': 100},
+)
+class TestProductSearchRateLimit(TestCase):
+    client_class = APIClient
+
+    def setUp(self):
+        query_log = patch('products.views.QueryLog')
+        self.query_log = query_log.start()
+        self.addCleanup(query_log.stop)
+        cache.clear()
+        hot_cache.clear_local()
+        local_allowances.clear()
+        self.url = reverse('product-search')
+        self.payload = {'next_search_after': None, 'results': []}
+
+    @freeze_time('2025-01-01 12:00:00')
+    @patch('products.views.DocumentViewSet.list')
+    def test_limited_per_ip_with_headers(self, mock_list):
+        mock_list.return_value = Response(self.payload)
+
+        first = self.client.get(self.url, {'search': 'گوشی'})
+        self.assertEqual(first['RateLimit-Limit'], '2')
+        self.assertEqual(first['RateLimit-Remaining'], '1')
+        self.assertEqual(first['RateLimit-Reset'], '60')
+
+        self.client.get(self.url, {'search': 'گوشی'})
+        throttled = self.client.get(self.url, {'search': 'گوشی'})
+
+        self.assertEqual(throttled.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(throttled.json(), {'detail': '00:01:00'})
+        self.assertEqual(throttled['Retry-After'], '60')
+        self.assertEqual(throttled['RateLimit-Remaining'], '0')
+
+        other_ip = self.client.get(self.url, {'search': 'گوشی'}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(other_ip.status_code, status.HTTP_200_OK)
+
+    @freeze_time('2025-01-01 12:00:00')
+    async def test_async_view_shares_the_limit(self):
+        with patch('products.pagination.aexecute_raw', AsyncMock(return_value={
+            'took': 1, 'hits': {'total': {'value': 0, 'relation': 'eq'}, 'hits': []},
+        })):
+            for _ in range(2):
+                response = await self.async_client.get(reverse('product-search-async'), {'search': 'گوشی'})
+            self.assertEqual(response['RateLimit-Remaining'], '0')
+
+            response = await self.async_client.get(reverse('product-search-async'), {'search': 'گوشی'})
+
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '60')
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.test import RequestFactory
+
+from .query_log import QueryLog
+from .search_cache import TopQueryStore
+from .views import ProductDocumentView
+
+
+def build_first_page(query):
+    """
+    Run `query` through ProductDocumentView, bypassing every cache, and return the
+    default-sized first page payload, or None when the search did not succeed.
+    """
+    view = ProductDocumentView.as_view(
+        {'get': 'list'}, use_result_cache=False, use_top_queries=False, record_queries=False, throttle_classes=[],
+    )
+    response = view(RequestFactory().get('/api/products/', {'search': query}))
+    if response.status_code != 200:
+        return None
+    return {**response.data, 'results': list(response.data['results'])}
+
+
+def precompute_top_queries():
+    """Rebuild the TopQueryStore pages of the TOP_K most popular queries; returns how many were stored."""
+    payloads = {}
+    for query in QueryLog.top(settings.PRODUCT_POPULAR_QUERIES["TOP_K"]):
+        payload = build_first_page(query)
+        if payload is not None:
+            payloads[query] = payload
+
+    TopQueryStore.set_many(payloads)
+    return len(payloads)
@@ -1,7 +1,17 @@
 from django.urls import path
-from .views import ProductDocumentView
+from .views import (
+    AsyncProductSearchView,
+    ProductDocumentView,
+    ProductExportView,
+    ProductSuggestView,
+    SearchMetricsView,
+)
 
 
 urlpatterns = [
     path('', ProductDocumentView.as_view({'get': 'list'}), name='product-search'),
+    path('async/', AsyncProductSearchView.as_view(), name='product-search-async'),
+    path('export/', ProductExportView.as_view(), name='product-export'),
+    path('suggest/', ProductSuggestView.as_view(), name='product-suggest'),
+    path('metrics/', SearchMetricsView.as_view(), name='product-search-metrics'),
 ]
\ No newline at end of file
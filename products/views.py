@@ -1,19 +1,47 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
 from django_elasticsearch_dsl_drf.viewsets import DocumentViewSet
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from .documents import ProductDocument
-from .serializers import ProductDocumentSerializer
-from .filters import FuzzySearchFilterBackend
-from .pagination import SearchAfterRelevancePagination
+from .export import EXPORT_FORMATS, aiter_chunks, aiter_hit_batches, iter_chunks, iter_hit_batches
+from .serializers import ProductExportQuerySerializer, ProductHitSerializer, ProductSuggestQuerySerializer
+from .filters import TieredSearchFilterBackend
+from .instrumentation import SearchInstrumentationMixin, SearchTimings, record_search, registry
+from .normalization import fold_characters, normalize_query
+from .pagination import SearchAfterRelevancePagination, execute_raw, open_point_in_time
+from .query_log import QueryLog
+from .search_cache import SearchResultCache, TopQueryStore, lookup_page
+from accounts.authentication import JWTCookieStatelessAuthentication
+from accounts.throttles import MultiWindowRateThrottle, RateLimitHeadersMixin, add_rate_limit_headers
+from utils.renderers import ORJSONRenderer
 
 
-class ProductDocumentView(DocumentViewSet):
+class ProductDocumentView(RateLimitHeadersMixin, SearchInstrumentationMixin, DocumentViewSet):
     document = ProductDocument
-    serializer_class = ProductDocumentSerializer
+    serializer_class = ProductHitSerializer
     pagination_class = SearchAfterRelevancePagination
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    # Read-only: the user comes from the token claims, without a database or cache lookup
+    authentication_classes = [JWTCookieStatelessAuthentication]
     filter_backends = [
-        FuzzySearchFilterBackend
+        TieredSearchFilterBackend
     ]
+    throttle_classes = [MultiWindowRateThrottle]
+    rate_limit_scope = 'product-search'
+    use_result_cache = True
+    use_top_queries = True
+    record_queries = True
 
     search_fields = (
         'title_fa',
@@ -28,9 +56,258 @@ class ProductDocumentView(DocumentViewSet):
     )
     
     def get_queryset(self):
-        query = self.request.query_params.get('search')
+        query = normalize_query(self.request.query_params.get('search'))
         if not query:
             raise ValidationError("Search query parameter 'search' is required.")
         
         queryset = super().get_queryset()
-        return queryset.source(['id', 'title'])
+        return queryset.source(list(self.serializer_class.source_fields))
+
+    def list(self, request, *args, **kwargs):
+        query = normalize_query(request.query_params.get('search'))
+        self.timings.query = query
+        page_size = self.paginator.get_page_size(request)
+        search_after = request.query_params.get(self.paginator.search_after_param)
+        if query and self.record_queries and not search_after:
+            QueryLog.record(query)
+
+        # Point-in-time pages are tied to their snapshot; they are neither cached nor served from cache
+        if not query or not self.use_result_cache or self.paginator.wants_point_in_time(request):
+            return super().list(request, *args, **kwargs)
+
+        with self.timings.phase('cache'):
+            cache_key = SearchResultCache.make_key(query, page_size, search_after)
+            top_key = get_top_query_key(self, query, page_size, search_after)
+            payload, self.timings.cache = lookup_page(cache_key, top_key)
+        if payload is not None:
+            self.timings.tier = payload.get('search_tier')
+            return Response(payload)
+
+        response = super().list(request, *args, **kwargs)
+        # Don't keep partial pages from a search that hit its time budget
+        if not getattr(self.paginator, 'timed_out', False):
+            with self.timings.phase('cache'):
+                SearchResultCache.set(cache_key, {
+                    **response.data,
+                    'results': list(response.data['results']),
+                })
+        return response
+
+
+
+class AsyncProductSearchView(View):
+    """
+    ASGI variant of ProductDocumentView with the same query, pagination, cache and response
+    body. The Elasticsearch round trip is awaited on the worker's pooled AsyncElasticsearch
+    client, so one process serves many in-flight searches instead of one per thread.
+    """
+    document = ProductDocument
+    serializer_class = ProductHitSerializer
+    pagination_class = SearchAfterRelevancePagination
+    filter_backends = ProductDocumentView.filter_backends
+    authentication_classes = ProductDocumentView.authentication_classes
+    throttle_classes = ProductDocumentView.throttle_classes
+    rate_limit_scope = ProductDocumentView.rate_limit_scope
+    renderer = ORJSONRenderer()
+    use_result_cache = True
+    use_top_queries = True
+    record_queries = True
+
+    async def get(self, request):
+        self.timings = SearchTimings()
+        # Filter backends, throttles and the paginator read DRF's `query_params` and `user`
+        self.request = Request(request, authenticators=[auth() for auth in self.authentication_classes])
+        self.paginator = self.pagination_class()
+
+        try:
+            for throttle in self.throttle_classes:
+                await cache_call(throttle().allow_request, self.request, self)
+        except APIException as exc:
+            return self.respond_error(exc)
+
+        query = normalize_query(request.GET.get('search'))
+        self.timings.query = query
+        if not query:
+            return self.respond(["Search query parameter 'search' is required."], status=400)
+
+        if self.record_queries and not self.request.query_params.get(self.paginator.search_after_param):
+            QueryLog.record(query)
+
+        try:
+            return await self.get_page(query)
+        except APIException as exc:
+            return self.respond_error(exc)
+
+    async def get_page(self, query):
+        if not self.use_result_cache or self.paginator.wants_point_in_time(self.request):
+            return self.respond(await self.search_page())
+
+        page_size = self.paginator.get_page_size(self.request)
+        search_after = self.request.query_params.get(self.paginator.search_after_param)
+        with self.timings.phase('cache'):
+            cache_key = await cache_call(SearchResultCache.make_key, query, page_size, search_after)
+            top_key = get_top_query_key(self, query, page_size, search_after)
+            payload, self.timings.cache = await cache_call(lookup_page, cache_key, top_key)
+        if payload is not None:
+            self.timings.tier = payload.get('search_tier')
+            return self.respond(payload)
+
+        payload = await self.search_page()
+        if not self.paginator.timed_out:
+            with self.timings.phase('cache'):
+                await cache_call(SearchResultCache.set, cache_key, payload)
+        return self.respond(payload)
+
+    async def search_page(self):
+        with self.timings.phase('query'):
+            search = self.document.search().source(list(self.serializer_class.source_fields))
+            for backend in self.filter_backends:
+                search = backend().filter_queryset(self.request, search, self)
+
+        with self.timings.phase('es'):
+            hits = await self.paginator.apaginate_queryset(search, self.request, view=self)
+        self.timings.tier = self.paginator.search_tier
+        self.timings.total_hits = self.paginator.total_hits
+        self.timings.es_took = self.paginator.took / 1000
+
+        with self.timings.phase('serialize'):
+            results = self.serializer_class(hits, many=True).data
+        return self.paginator.get_paginated_data(list(results))
+
+    def respond(self, data, status=200):
+        render_started = time.perf_counter()
+        response = HttpResponse(self.renderer.render(data), status=status, content_type=self.renderer.media_type)
+        add_rate_limit_headers(response, getattr(self.request, 'rate_limit', None))
+        record_search(self.timings, render_started, response)
+        return response
+
+    def respond_error(self, exc):
+        response = self.respond({'detail': exc.detail}, status=exc.status_code)
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+
+def get_top_query_key(view, query, page_size, search_after):
+    """TopQueryStore key to look up for this request; only default-sized first pages are precomputed."""
+    if view.use_top_queries and not search_after and page_size == view.paginator.default_page_size:
+        return TopQueryStore.make_key(query)
+    return None
+
+
+def cache_call(func, *args):
+    # Redis calls are thread-safe, so they need not queue up behind the main sync thread
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+
+class ProductExportView(APIView):
+    """
+    Streams every match of a search (up to PRODUCT_SEARCH_EXPORT["MAX_RESULTS"]) as NDJSON
+    or CSV in one response. The tier is chosen like the first page of ProductDocumentView,
+    then the hits are read batch by batch from a point in time and each batch is sent before
+    the next is fetched, so the server holds about one BATCH_SIZE of hits per export.
+    Under ASGI the batches are read on the event loop: Django would load a synchronous
+    iterator into a list before sending any of it.
+    """
+    authentication_classes = ProductDocumentView.authentication_classes
+    permission_classes = [IsAuthenticated]
+    document = ProductDocument
+    serializer_class = ProductHitSerializer
+    filter_backends = ProductDocumentView.filter_backends
+    pagination_class = SearchAfterRelevancePagination
+
+    def get(self, request):
+        params = ProductExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+
+        if not normalize_query(data['search']):
+            raise ValidationError("Search query parameter 'search' is required.")
+
+        search = self.get_search(request)
+        pit_id = open_point_in_time(search, settings.PRODUCT_SEARCH_EXPORT["KEEP_ALIVE"])
+        batch_size = settings.PRODUCT_SEARCH_EXPORT["BATCH_SIZE"]
+        limit = data.get('limit', settings.PRODUCT_SEARCH_EXPORT["MAX_RESULTS"])
+
+        content_type, encoder = EXPORT_FORMATS[data['output']]
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiter_chunks(aiter_hit_batches(search, pit_id, batch_size, limit), encoder(self.serializer_class()))
+        else:
+            chunks = iter_chunks(iter_hit_batches(search, pit_id, batch_size, limit), encoder(self.serializer_class()))
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="products.{data["output"]}"'
+        return response
+
+    def get_search(self, request):
+        # The tiered filter backend reads the cursor parameter name from the view's paginator
+        self.paginator = self.pagination_class()
+
+        search = self.document.search().source(list(self.serializer_class.source_fields))
+        for backend in self.filter_backends:
+            search = backend().filter_queryset(request, search, self)
+
+        fallback = getattr(self, 'fallback_search', None)
+        if fallback is not None:
+            count = execute_raw(search.extra(size=0, track_total_hits=fallback.min_hits))
+            if count['hits']['total']['value'] < fallback.min_hits:
+                return fallback.search
+        return search
+
+class ProductSuggestView(APIView):
+    """
+    Search-as-you-type suggestions from the `suggest` completion field.
+    Only the top-k options are returned: no query, no pagination, no sorting.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+    serializer_class = ProductSuggestQuerySerializer
+    suggestion_name = 'product-suggest'
+
+    def get(self, request):
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        prefix = fold_characters(data['q'])
+        if not prefix:
+            return Response({'suggestions': []})
+
+        search = ProductDocument.search() \
+            .suggest(
+                self.suggestion_name,
+                prefix,
+                completion={'field': 'suggest', 'size': data['size'], 'skip_duplicates': True},
+            ) \
+            .source(['id']) \
+            .extra(size=0)
+        # Keystroke traffic gets the same time budget and circuit breaker as searches
+        response = execute_raw(search)
+
+        suggestions = [
+            {'text': option['text'], 'id': option['_source']['id']}
+            for option in response['suggest'][self.suggestion_name][0]['options']
+        ]
+        return Response({'suggestions': suggestions})
+
+
+class SearchMetricsView(APIView):
+    """
+    Product search counters and histograms in the Prometheus text format, summed over
+    every worker process (see MetricsRegistry). Only served to the addresses in
+    PRODUCT_SEARCH_METRICS["ALLOWED_IPS"].
+    """
+    authentication_classes = ()
+    permission_classes = ()
+
+    def get(self, request):
+        if request.META.get('REMOTE_ADDR') not in settings.PRODUCT_SEARCH_METRICS["ALLOWED_IPS"]:
+            raise PermissionDenied()
+        try:
+            # Include this worker's latest counts; the others' are at most FLUSH_SECONDS old
+            registry.start_flusher()
+            registry.flush()
+            text = registry.render(registry.shared_values())
+        except NotImplementedError:
+            text = registry.render()
+        return HttpResponse(text, content_type='text/plain; version=0.0.4; charset=utf-8')
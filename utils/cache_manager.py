@@ -1,32 +1,107 @@
+from contextlib import contextmanager
+
 from django.core.cache import cache
 from django.core.exceptions import SuspiciousOperation
+from django_redis import get_redis_connection
 
 
 class CacheManager:
+    """
+    Per-user values in the default cache, stored under "<key_name>_<user_id>".
+
+    Every write is a single command: the TTL goes with the SET itself, so there is no
+    window where a key exists without its expiry. The *_many methods read or write a
+    whole batch in one round trip, and writes made with `client=pipe` inside
+    `CacheManager.pipeline()` are sent together when the block exits.
+    """
+    @staticmethod
+    def make_key(user_id, key_name):
+        return f"{key_name}_{user_id}"
+
+    @staticmethod
+    @contextmanager
+    def pipeline():
+        """
+        Yield a Redis pipeline to pass as `client=` to the write methods; it is executed
+        when the block exits. Caches without a Redis client yield None and the writes
+        run immediately.
+        """
+        try:
+            pipe = get_redis_connection('default').pipeline()
+        except NotImplementedError:
+            yield None
+            return
+        yield pipe
+        pipe.execute()
+
     @staticmethod
-    def set_new_value(user_id, value, key_name, timeout=None):
+    def set_new_value(user_id, value, key_name, timeout=None, nx=False, client=None):
+        """
+        Store `value`, replacing any previous one, with `timeout` seconds to live.
+        With `nx=True` the value is only stored when the key does not exist yet.
+        """
+        extra = {'client': client} if client is not None else {}
         try:
-            CacheManager.delete_value(user_id, key_name)
-            success = cache.set(f"{key_name}_{user_id}", str(value), timeout=timeout)
-            if not success:
+            key = CacheManager.make_key(user_id, key_name)
+            if nx:
+                return cache.add(key, str(value), timeout=timeout, **extra)
+            success = cache.set(key, str(value), timeout=timeout, **extra)
+            if success is False:
                 raise SuspiciousOperation("Failed to set the cache value.")
+            return True
         except Exception as e:
             print(f"Error setting cache value: {e}")
+            return False
 
     @staticmethod
     def get_value(user_id, key_name):
         try:
-            value = cache.get(f"{key_name}_{user_id}")
-            if value is None:
-                print("Value not found in cache.")
-            return value
+            return cache.get(CacheManager.make_key(user_id, key_name))
         except Exception as e:
             print(f"Error getting cache value: {e}")
             return None
 
     @staticmethod
-    def delete_value(user_id, key_name):
+    def delete_value(user_id, key_name, client=None):
+        extra = {'client': client} if client is not None else {}
         try:
-            cache.delete(f"{key_name}_{user_id}")
+            cache.delete(CacheManager.make_key(user_id, key_name), **extra)
         except Exception as e:
             print(f"Error deleting cache value: {e}")
+
+    @staticmethod
+    def get_many(user_ids, key_name):
+        """Return {user_id: value} for the ids that have a value."""
+        keys = {CacheManager.make_key(user_id, key_name): user_id for user_id in user_ids}
+        try:
+            values = cache.get_many(list(keys))
+        except Exception as e:
+            print(f"Error getting cache values: {e}")
+            return {}
+        return {keys[key]: value for key, value in values.items()}
+
+    @staticmethod
+    def set_many(values, key_name, timeout=None, client=None):
+        """Store {user_id: value} with the same timeout."""
+        data = {CacheManager.make_key(user_id, key_name): str(value) for user_id, value in values.items()}
+        try:
+            if client is not None:
+                # django_redis would open a second pipeline of its own for set_many
+                for key, value in data.items():
+                    cache.set(key, value, timeout=timeout, client=client)
+                return True
+            failed = cache.set_many(data, timeout=timeout)
+            if failed:
+                raise SuspiciousOperation(f"Failed to set {len(failed)} cache values.")
+            return True
+        except Exception as e:
+            print(f"Error setting cache values: {e}")
+            return False
+
+    @staticmethod
+    def delete_many(user_ids, key_name, client=None):
+        extra = {'client': client} if client is not None else {}
+        try:
+            cache.delete_many([CacheManager.make_key(user_id, key_name) for user_id in user_ids], **extra)
+        except Exception as e:
+            print(f"Error deleting cache values: {e}")
@@ -0,0 +1,225 @@
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU with a per-entry TTL, capped both by entry count and by the
+    (pickled) size of the stored values. Thread-safe; one instance per worker process.
+    """
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] <= time.monotonic():
+                self.pop(key)
+                return default
+            self.entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, timeout):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self.pop(key)
+            self.entries[key] = (time.monotonic() + timeout, size, value)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            self.pop(key)
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class TwoTierCache:
+    """
+    Read-mostly keys (index generation, precomputed search pages) served from a LocalCache
+    in front of the default Redis cache, so the hottest reads skip the network.
+
+    Writes go to Redis, then an invalidation is published on LOCAL_CACHE["CHANNEL"];
+    every worker drops the key from its local tier when the message arrives. A worker
+    that loses its subscription clears its local tier, and TIMEOUT_SECONDS bounds how
+    long an entry can outlive a missed message. Flushing Redis (FLUSHDB, cache.clear())
+    publishes nothing: every worker keeps serving its local entries for up to TIMEOUT_SECONDS
+    afterwards; call clear_local() in each process when that matters. With a cache that has
+    no Redis client (LocMem) the local tier is bypassed: that cache is in-process already.
+    """
+    def __init__(self):
+        self.local = None
+        self.listener_pid = None
+        self.sender = uuid.uuid4().hex
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    def get_local(self):
+        """The local tier, or None when it is bypassed. Starts this process's listener on first use."""
+        if self.listener_pid == os.getpid():
+            return self.local
+
+        with self.lock:
+            if self.listener_pid != os.getpid():
+                config = settings.LOCAL_CACHE
+                try:
+                    connection = self.get_connection()
+                except NotImplementedError:
+                    self.local = None
+                else:
+                    # A forked worker must neither share the parent's entries nor its listener thread
+                    self.local = LocalCache(config["MAX_ENTRIES"], config["MAX_BYTES"])
+                    self.sender = uuid.uuid4().hex
+                    threading.Thread(
+                        target=self.listen, args=(connection,), name='local-cache-invalidation', daemon=True,
+                    ).start()
+                self.listener_pid = os.getpid()
+        return self.local
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    def get_many(self, keys):
+        """Like cache.get_many(): only the keys Redis has are returned, in one round trip for the local misses."""
+        local = self.get_local()
+        if local is None:
+            return cache.get_many(keys)
+
+        found = {}
+        missing = []
+        for key in keys:
+            value = local.get(key, MISSING)
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+
+        if missing:
+            fetched = cache.get_many(missing)
+            timeout = settings.LOCAL_CACHE["TIMEOUT_SECONDS"]
+            for key, value in fetched.items():
+                local.set(key, value, timeout)
+            found.update(fetched)
+        return found
+
+    def get_first(self, keys):
+        """
+        (key, value) for the first of `keys`, in priority order, that has a value, else (None, None).
+        Redis is only asked about the keys ahead of the first one held locally.
+        """
+        local = self.get_local()
+        held = None
+        ahead = keys
+        if local is not None:
+            for i, key in enumerate(keys):
+                value = local.get(key, MISSING)
+                if value is not MISSING:
+                    held, ahead = (key, value), keys[:i]
+                    break
+
+        found = self.get_many(ahead) if ahead else {}
+        for key in ahead:
+            if key in found:
+                return key, found[key]
+        return held or (None, None)
+
+    def get_or_set(self, key, default, timeout=None):
+        local = self.get_local()
+        value = local.get(key) if local is not None else None
+        if value is None:
+            value = cache.get_or_set(key, default, timeout=timeout)
+            if local is not None:
+                local.set(key, value, settings.LOCAL_CACHE["TIMEOUT_SECONDS"])
+        return value
+
+    def set(self, key, value, timeout=None):
+        cache.set(key, value, timeout=timeout)
+        self.invalidate([key])
+
+    def set_many(self, data, timeout=None):
+        cache.set_many(data, timeout=timeout)
+        self.invalidate(list(data))
+
+    def incr(self, key):
+        value = cache.incr(key)
+        self.invalidate([key])
+        return value
+
+    def invalidate(self, keys):
+        """Drop `keys` from the local tier of this and every other worker."""
+        local = self.get_local()
+        if local is None or not keys:
+            return
+        for key in keys:
+            local.delete(key)
+        try:
+            self.get_connection().publish(
+                settings.LOCAL_CACHE["CHANNEL"], orjson.dumps({'sender': self.sender, 'keys': keys}),
+            )
+        except Exception:
+            logger.warning("Could not publish a local cache invalidation", exc_info=True)
+
+    def handle_message(self, data):
+        message = orjson.loads(data)
+        if message['sender'] == self.sender:
+            return
+        for key in message['keys']:
+            self.local.delete(key)
+
+    def listen(self, connection):
+        channel = settings.LOCAL_CACHE["CHANNEL"]
+        while True:
+            try:
+                pubsub = connection.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                # Anything published while we were not subscribed is lost
+                self.local.clear()
+                for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        self.handle_message(message['data'])
+            except Exception:
+                logger.warning("Local cache invalidation listener failed, retrying", exc_info=True)
+                self.local.clear()
+                time.sleep(1)
+
+    def clear_local(self):
+        if self.local is not None:
+            self.local.clear()
+
+
+hot_cache = TwoTierCache()
@@ -1,60 +1,158 @@
+import threading
+import time
+
 import pyotp
+from django.core.cache import cache
 from django.core.exceptions import SuspiciousOperation
 from django.conf import settings
+from django_redis import get_redis_connection
+
 from utils.cache_manager import CacheManager
 
 OTP_TIMEOUT = settings.OTP["EXPIRATION_TIME_SECONDS"]
+OTP_INTERVAL = 30  # pyotp's default TOTP step, in seconds
+
+
+# KEYS[1]: the pending code, stored as "<time step>:<code>"; KEYS[2]: failed attempts counter
+# ARGV: submitted code, first and last acceptable time step, max failed attempts, counter TTL (s)
+VERIFY_OTP_SCRIPT = """
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return -1
+end
+
+local sep = string.find(stored, ':', 1, true)
+if not sep then
+    -- Not a "<time step>:<code>" value (e.g. a secret stored by an earlier release)
+    return -1
+end
+local step = tonumber(string.sub(stored, 1, sep - 1))
+if string.sub(stored, sep + 1) == ARGV[1] and step >= tonumber(ARGV[2]) and step <= tonumber(ARGV[3]) then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+
+local failures = redis.call('INCR', KEYS[2])
+if failures == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[5])
+end
+if failures >= tonumber(ARGV[4]) then
+    -- Too many guesses: this code is dead, a new one has to be requested
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
 class OTPManager:
+    """
+    Pending one-time passwords, one per user id and prefix.
+
+    Only the code and the TOTP time step it was generated in are kept, so a verification
+    is a single compare-and-delete: on Redis one Lua script checks the code, consumes it
+    on success and counts the failure otherwise. Two requests racing with the same code
+    can't both pass, and MAX_FAILED_ATTEMPTS wrong guesses discard the code. Caches
+    without a Redis client (LocMem in tests) run the same steps under a process lock.
+    """
+    script = None
+    fallback_lock = threading.Lock()
+
     @staticmethod
     def get_totp(secret):
         """Returns a TOTP object for the given secret."""
-        return pyotp.TOTP(secret)
+        return pyotp.TOTP(secret, interval=OTP_INTERVAL)
 
     @staticmethod
-    def store_secret(user_id, secret, prefix='otp_secret'):
-        """Store the OTP secret in the cache using CacheManager."""
-        try:
-            CacheManager.set_new_value(user_id, secret, prefix, OTP_TIMEOUT)
-        except SuspiciousOperation as e:
-            raise SuspiciousOperation(f"Error storing OTP secret: {e}")
+    def get_connection():
+        return get_redis_connection('default')
 
     @staticmethod
-    def retrieve_secret(user_id, prefix='otp_secret'):
-        """Retrieve the OTP secret from the cache using CacheManager."""
-        secret = CacheManager.get_value(user_id, prefix)
-        if secret is None:
-            raise SuspiciousOperation("OTP secret not found in cache.")
-        return secret
+    def make_keys(user_id, prefix):
+        """(code key, failed attempts key) as CacheManager names them."""
+        return CacheManager.make_key(user_id, prefix), CacheManager.make_key(user_id, f"{prefix}_failures")
 
     @staticmethod
-    def generate_otp(user_id, prefix='otp_secret'):
-        """Generate a one-time password (OTP) and store its secret."""
+    def store_code(user_id, otp, step, prefix='otp_secret'):
+        """
+        Store the pending code with its time step, replacing any earlier one, and reset the
+        failed attempts: failures against an earlier code must not count against this one.
+        """
+        value = f"{step}:{otp}"
+        code_key, failures_key = OTPManager.make_keys(user_id, prefix)
+        try:
+            connection = OTPManager.get_connection()
+        except NotImplementedError:
+            stored = CacheManager.set_new_value(user_id, value, prefix, OTP_TIMEOUT)
+            cache.delete(failures_key)
+        else:
+            # Raw value, not django-redis's pickle, so the verify script can read it
+            pipe = connection.pipeline()
+            pipe.set(cache.make_key(code_key), value, ex=OTP_TIMEOUT)
+            pipe.delete(cache.make_key(failures_key))
+            stored, _ = pipe.execute()
+        if not stored:
+            raise SuspiciousOperation("Error storing OTP secret.")
 
-        secret = pyotp.random_base32()
-        OTPManager.store_secret(user_id, secret, prefix)
-        
-        totp = OTPManager.get_totp(secret)
-        return totp.now()
+    @staticmethod
+    def generate_otp(user_id, prefix='otp_secret'):
+        """Generate a one-time password (OTP) from a fresh secret and store it."""
+        totp = OTPManager.get_totp(pyotp.random_base32())
+        now = time.time()
+        otp = totp.at(now)
+        OTPManager.store_code(user_id, otp, int(now) // OTP_INTERVAL, prefix)
+        return otp
 
     @staticmethod
     def verify_otp(user_id, otp, prefix='otp_secret'):
-        """Verify the provided OTP against the stored secret."""
-        secret = OTPManager.retrieve_secret(user_id, prefix)
-        if secret is None:
-            return False
-
-        totp = OTPManager.get_totp(secret)
+        """
+        Check `otp` and consume it if it matches, in one atomic step.
+        Raises SuspiciousOperation when no code is pending.
+        """
+        # The serializers pass the code as an int, which drops leading zeros
+        otp = str(otp).zfill(6)
+        step = int(time.time()) // OTP_INTERVAL
         valid_window = settings.OTP["VALID_WINDOW"]
-        if totp.verify(otp, valid_window=valid_window):
-            OTPManager.delete_otp(user_id, prefix)
-            return True
+        first_step, last_step = step - valid_window, step + valid_window
+        max_failures = settings.OTP["MAX_FAILED_ATTEMPTS"]
 
-        return False
+        try:
+            connection = OTPManager.get_connection()
+        except NotImplementedError:
+            result = OTPManager.verify_cache(user_id, otp, first_step, last_step, max_failures, prefix)
+        else:
+            if OTPManager.script is None:
+                OTPManager.script = connection.register_script(VERIFY_OTP_SCRIPT)
+            keys = [cache.make_key(key) for key in OTPManager.make_keys(user_id, prefix)]
+            args = [otp, first_step, last_step, max_failures, OTP_TIMEOUT]
+            result = OTPManager.script(keys=keys, args=args, client=connection)
+
+        if result == -1:
+            raise SuspiciousOperation("OTP secret not found in cache.")
+        return result == 1
+
+    @staticmethod
+    def verify_cache(user_id, otp, first_step, last_step, max_failures, prefix):
+        code_key, failures_key = OTPManager.make_keys(user_id, prefix)
+        with OTPManager.fallback_lock:
+            stored = cache.get(code_key)
+            if stored is None:
+                return -1
+
+            if ':' not in stored:
+                return -1
+            step, code = stored.split(':', 1)
+            if code == otp and first_step <= int(step) <= last_step:
+                cache.delete_many([code_key, failures_key])
+                return 1
+
+            cache.add(failures_key, 0, timeout=OTP_TIMEOUT)
+            if cache.incr(failures_key) >= max_failures:
+                cache.delete(code_key)
+            return 0
 
     @staticmethod
     def delete_otp(user_id, prefix='otp_secret'):
-        """Delete the stored OTP secret from the cache using CacheManager."""
+        """Delete the pending code from the cache using CacheManager."""
         try:
             CacheManager.delete_value(user_id, prefix)
         except Exception as e:
@@ -66,8 +164,7 @@ class OTPManager:
 # ==============================================
 
 def generate_otp_auth_num(user_id):
-    delete_otp_auth_num(user_id)
-    """Generate a one-time password (OTP) for authentication."""
+    """Generate a one-time password (OTP) for authentication; it replaces any previous one."""
     return OTPManager.generate_otp(user_id, prefix='otp_secret_auth_num')
 
 def verify_otp_auth_num(user_id, otp):
@@ -84,7 +181,6 @@ def delete_otp_auth_num(user_id):
 # ==============================================
 
 def generate_otp_change_phone(user_id):
-    delete_otp_change_phone(user_id)
     return OTPManager.generate_otp(user_id, prefix='otp_secret_change_phone')
 
 def verify_otp_change_phone(user_id, otp):
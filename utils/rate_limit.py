@@ -0,0 +1,211 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+
+# `wait`: seconds until a denied request would be allowed. `limit`, `remaining` and `reset`
+# (seconds until the oldest counted request leaves it) describe the window with the fewest requests left.
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'wait', 'limit', 'remaining', 'reset'])
+
+
+# KEYS[1]: sorted set of request timestamps (ms) for one client
+# ARGV: now (ms), unique member for this request, requests to record unconditionally,
+# then window (ms) / max requests pairs
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local pending = tonumber(ARGV[3])
+
+local longest = 0
+for i = 4, #ARGV, 2 do
+    longest = math.max(longest, tonumber(ARGV[i]))
+end
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - longest)
+
+-- Requests already served from a local allowance are recorded whatever the outcome
+for i = 1, pending do
+    redis.call('ZADD', key, now, member .. ':' .. i)
+end
+
+local counts = {}
+local wait = 0
+for i = 4, #ARGV, 2 do
+    local window = tonumber(ARGV[i])
+    local limit = tonumber(ARGV[i + 1])
+    local since = '(' .. (now - window)
+    local count = redis.call('ZCOUNT', key, since, '+inf')
+    counts[i] = count
+    if count >= limit then
+        -- The request is allowed again once enough of the requests in this window have aged out of it
+        local oldest = redis.call('ZRANGEBYSCORE', key, since, '+inf', 'WITHSCORES', 'LIMIT', count - limit, 1)
+        local window_wait = window
+        if oldest[2] then
+            window_wait = tonumber(oldest[2]) + window - now
+        end
+        wait = math.max(wait, window_wait)
+    end
+end
+
+local allowed = 0
+if wait == 0 then
+    allowed = 1
+    redis.call('ZADD', key, now, member)
+end
+if allowed == 1 or pending > 0 then
+    redis.call('PEXPIRE', key, longest)
+end
+
+local remaining, policy_limit, reset = -1, 0, 0
+for i = 4, #ARGV, 2 do
+    local window = tonumber(ARGV[i])
+    local limit = tonumber(ARGV[i + 1])
+    local left = math.max(limit - counts[i] - allowed, 0)
+    if remaining < 0 or left < remaining then
+        remaining = left
+        policy_limit = limit
+        reset = 0
+        local first = redis.call('ZRANGEBYSCORE', key, '(' .. (now - window), '+inf', 'WITHSCORES', 'LIMIT', 0, 1)
+        if first[2] then
+            reset = tonumber(first[2]) + window - now
+        end
+    end
+end
+
+return {allowed, wait, policy_limit, remaining, reset}
+"""
+
+
+class SlidingWindowRateLimiter:
+    """
+    Sliding-log rate limiter over one or more windows, e.g. ((120, 1), (7200, 15)) for
+    "1 request per 2 minutes and 15 per 2 hours". A request counts against every window
+    and is only recorded when all of them allow it.
+
+    On Redis the check and the update are a single Lua script, so one round trip decides
+    and concurrent requests can't slip past the limit together. Caches without a Redis
+    client (LocMem in tests) get the same algorithm on a timestamp list in the cache.
+    """
+    script = None
+    fallback_lock = threading.Lock()
+
+    def __init__(self, windows):
+        self.windows = tuple((float(seconds), int(max_requests)) for seconds, max_requests in windows)
+        self.longest = max(seconds for seconds, _ in self.windows)
+
+    @staticmethod
+    def get_connection():
+        return get_redis_connection('default')
+
+    def hit(self, key, pending=0):
+        """
+        Count a request for `key`, after recording `pending` requests that were already served.
+        :return: a RateLimitResult.
+        """
+        # Taken on this side (not Redis TIME) so every app server and test clock agrees
+        now = time.time()
+        try:
+            connection = self.get_connection()
+        except NotImplementedError:
+            return self.hit_cache(key, now, pending)
+        return self.hit_redis(connection, key, now, pending)
+
+    def hit_redis(self, connection, key, now, pending):
+        cls = type(self)
+        if cls.script is None:
+            cls.script = connection.register_script(SLIDING_WINDOW_SCRIPT)
+
+        args = [int(now * 1000), f"{now}:{uuid.uuid4().hex}", pending]
+        for seconds, max_requests in self.windows:
+            args += [int(seconds * 1000), max_requests]
+
+        allowed, wait, limit, remaining, reset = cls.script(keys=[key], args=args, client=connection)
+        return RateLimitResult(bool(allowed), int(wait) / 1000, int(limit), int(remaining), int(reset) / 1000)
+
+    def hit_cache(self, key, now, pending):
+        with self.fallback_lock:
+            timestamps = [ts for ts in cache.get(key, []) if now - ts < self.longest]
+            timestamps += [now] * pending
+
+            in_windows = []
+            wait = 0
+            for seconds, max_requests in self.windows:
+                in_window = [ts for ts in timestamps if now - ts < seconds]
+                in_windows.append(in_window)
+                if len(in_window) >= max_requests:
+                    oldest = in_window[len(in_window) - max_requests] if max_requests else now
+                    wait = max(wait, oldest + seconds - now)
+
+            allowed = wait == 0
+            if allowed:
+                timestamps.append(now)
+                for in_window in in_windows:
+                    in_window.append(now)
+            if allowed or pending:
+                cache.set(key, timestamps, timeout=self.longest)
+
+            remaining, limit, reset = None, 0, 0
+            for (seconds, max_requests), in_window in zip(self.windows, in_windows):
+                left = max(max_requests - len(in_window), 0)
+                if remaining is None or left < remaining:
+                    remaining, limit = left, max_requests
+                    reset = in_window[0] + seconds - now if in_window else 0
+            return RateLimitResult(allowed, wait, limit, remaining, reset)
+
+
+class LocalAllowances:
+    """
+    Per-process pre-check in front of SlidingWindowRateLimiter.
+
+    Each Redis check leases the client SHARE of the requests it has left as local tokens.
+    Those requests are served without a round trip and recorded in Redis with the client's
+    next check, so the shared windows still count every request; remaining requests only
+    grow as time passes, so the lease stays valid however long it is held. A denied client
+    is denied locally until its wait is over. Across P processes a client can overshoot a
+    limit by at most P * SHARE of what it had left.
+    """
+    def __init__(self):
+        self.clients = OrderedDict()  # key -> [tokens, pending, blocked_until, checked_at, result]
+        self.lock = threading.Lock()
+
+    def hit(self, limiter, key):
+        config = settings.RATE_LIMIT_LOCAL
+        now = time.time()
+        with self.lock:
+            state = self.clients.get(key)
+            if state is not None:
+                self.clients.move_to_end(key)
+                tokens, pending, blocked_until, checked_at, result = state
+                reset = max(result.reset - (now - checked_at), 0)
+                if blocked_until > now:
+                    return result._replace(wait=blocked_until - now, reset=reset)
+                if tokens > 0:
+                    state[0] -= 1
+                    state[1] += 1
+                    return result._replace(remaining=max(result.remaining - pending - 1, 0), reset=reset)
+            pending = state[1] if state is not None else 0
+            if state is not None:
+                state[1] = 0
+
+        result = limiter.hit(key, pending)
+
+        with self.lock:
+            tokens = int(result.remaining * config["SHARE"]) if result.allowed else 0
+            blocked_until = now + result.wait if not result.allowed else 0
+            self.clients[key] = [tokens, 0, blocked_until, now, result]
+            self.clients.move_to_end(key)
+            while len(self.clients) > config["MAX_CLIENTS"]:
+                self.clients.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.clients.clear()
+
+
+local_allowances = LocalAllowances()